@@ -0,0 +1,328 @@
+"""
+Throughput benchmarks for the Mario Expert agent.
+
+Runs the agent headless against the real ROM and reports steps/sec for the different execution paths.
+
+    python3 benchmark.py turbo --steps 500
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+
+import numpy as np
+from enemy_tracker import EnemyTracker
+from mario_environment import MarioEnvironment
+from mario_expert import MarioExpert
+from observation import ObservationPipeline, naive_observation
+from pipeline import DecisionPipeline
+from vector_env import VectorMarioEnv
+
+logging.basicConfig(level=logging.INFO)
+
+
+def run_steps(expert, steps, grab_frames):
+    environment = expert.environment
+    environment.reset()
+
+    frames_start = environment.pyboy.frame_count
+    start = time.perf_counter()
+
+    completed = 0
+    while completed < steps and not environment.get_game_over():
+        if grab_frames:
+            environment.grab_frame()
+        expert.step()
+        completed += 1
+
+    elapsed = time.perf_counter() - start
+    frames = environment.pyboy.frame_count - frames_start
+    return {
+        "steps": completed,
+        "seconds": elapsed,
+        "steps_per_sec": completed / elapsed if elapsed > 0 else 0.0,
+        "frames_per_sec": frames / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def benchmark_turbo(args):
+    """
+    Compares the default per-frame tick path against turbo mode with and without a frame consumer.
+    """
+    modes = {
+        "default": {"turbo": False, "render_frames": True, "grab_frames": True},
+        "turbo+video": {"turbo": True, "render_frames": True, "grab_frames": True},
+        "turbo": {"turbo": True, "render_frames": False, "grab_frames": False},
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as results_path:
+        expert = MarioExpert(results_path=results_path, headless=True)
+
+        for name, mode in modes.items():
+            expert.current_state = "DEFAULT"
+            expert.environment.set_turbo(mode["turbo"], mode["render_frames"])
+            # Compare the execution paths, not the real-time speed limit
+            expert.environment.pyboy.set_emulation_speed(0)
+            results[name] = run_steps(expert, args.steps, mode["grab_frames"])
+
+        expert.environment.pyboy.stop(save=False)
+
+    baseline = results["default"]["steps_per_sec"]
+    for name, result in results.items():
+        speedup = result["steps_per_sec"] / baseline if baseline > 0 else 0.0
+        logging.info(
+            f"{name:>12}: {result['steps']} steps in {result['seconds']:.2f}s - "
+            f"{result['steps_per_sec']:.1f} steps/sec, {result['frames_per_sec']:.0f} frames/sec ({speedup:.2f}x)"
+        )
+    return results
+
+
+def benchmark_game_state(args):
+    """
+    Compares the per-step cost of game_state plus three get_x_position calls (as in fsm_transition) between the
+    MarioEnvironment getters and the per-tick RamSnapshot, and checks both return the same values.
+    """
+    with tempfile.TemporaryDirectory() as results_path:
+        expert = MarioExpert(results_path=results_path, headless=True)
+        environment = expert.environment
+        environment.set_turbo(True, render_frames=False)
+
+        base_seconds = 0.0
+        snapshot_seconds = 0.0
+        mismatches = 0
+        for _ in range(args.steps):
+            environment.run_action(2, 10)
+
+            start = time.perf_counter()
+            base_state = MarioEnvironment.game_state(environment)
+            for _ in range(3):
+                MarioEnvironment.get_x_position(environment)
+            base_seconds += time.perf_counter() - start
+
+            # Force a fresh read, as the first access after a tick would
+            environment._ram = None
+            start = time.perf_counter()
+            state = environment.game_state()
+            for _ in range(3):
+                environment.get_x_position()
+            snapshot_seconds += time.perf_counter() - start
+
+            mismatches += state != base_state
+
+        environment.pyboy.stop(save=False)
+
+    base_us = base_seconds / args.steps * 1e6
+    snapshot_us = snapshot_seconds / args.steps * 1e6
+    logging.info(f"MarioEnvironment getters: {base_us:.1f}us/step")
+    logging.info(f"RamSnapshot: {snapshot_us:.1f}us/step ({base_us / snapshot_us:.2f}x)")
+    logging.info(f"Mismatched steps: {mismatches}/{args.steps}")
+    return {"base_us": base_us, "snapshot_us": snapshot_us, "mismatches": mismatches}
+
+
+def benchmark_vector_env(args):
+    """
+    Aggregate env-steps/sec of VectorMarioEnv with random actions for each number of environments in --envs.
+    """
+    results = {}
+    for num_envs in args.envs:
+        with VectorMarioEnv(num_envs) as env:
+            env.reset()
+
+            start = time.perf_counter()
+            for _ in range(args.steps):
+                env.step(np.random.randint(0, 7, size=num_envs))
+            elapsed = time.perf_counter() - start
+
+        env_steps = args.steps * num_envs
+        results[num_envs] = env_steps / elapsed
+        logging.info(f"{num_envs:>3} envs: {results[num_envs]:.1f} env-steps/sec")
+    return results
+
+
+def benchmark_pipeline(args):
+    """
+    Compares the synchronous step loop against the DecisionPipeline: how long each step waits for its decision and
+    the emulated frames per second.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as results_path:
+        expert = MarioExpert(results_path=results_path, headless=True)
+        environment = expert.environment
+        environment.set_turbo(True, render_frames=False)
+
+        for name in ["sync", "pipelined"]:
+            expert.current_state = "DEFAULT"
+            expert.decoder.reset()
+            environment.reset()
+            pipeline = DecisionPipeline(expert, args.max_staleness) if name == "pipelined" else None
+
+            decision_ns = 0
+            steps = 0
+            frames_start = environment.pyboy.frame_count
+            start = time.perf_counter()
+            while steps < args.steps and not environment.get_game_over():
+                decide_start = time.perf_counter_ns()
+                if pipeline is not None:
+                    action, hold_freq = pipeline.take()
+                    pipeline.submit()
+                else:
+                    action, hold_freq = expert.choose_action()
+                decision_ns += time.perf_counter_ns() - decide_start
+
+                environment.run_action(action, hold_freq)
+                steps += 1
+            elapsed = time.perf_counter() - start
+
+            results[name] = {
+                "steps": steps,
+                "decision_us": decision_ns / steps / 1e3 if steps else 0.0,
+                "frames_per_sec": (environment.pyboy.frame_count - frames_start) / elapsed if elapsed > 0 else 0.0,
+            }
+            if pipeline is not None:
+                pipeline.close()
+                results[name].update(pipeline.stats())
+
+            logging.info(
+                f"{name:>9}: {results[name]['decision_us']:.1f}us waiting per decision, "
+                f"{results[name]['frames_per_sec']:.0f} frames/sec"
+            )
+
+        environment.pyboy.stop(save=False)
+
+    stats = results["pipelined"]
+    logging.info(
+        f"Pipelined decisions: {stats['pipelined']}/{stats['decisions']}, {stats['stale']} too stale, "
+        f"{stats['mean_staleness_frames']:.1f} frames old on average"
+    )
+    return results
+
+
+def benchmark_enemy_tracker(args):
+    """
+    Compares finding the enemies through the game area grid (game_area, decode, enemy positions) against reading them
+    from the sprite table with the EnemyTracker, and counts the frames where the two see a different number of enemy
+    cells.
+    """
+    with tempfile.TemporaryDirectory() as results_path:
+        expert = MarioExpert(results_path=results_path, headless=True)
+        environment = expert.environment
+        environment.set_turbo(True, render_frames=False)
+        tracker = EnemyTracker(environment.pyboy.game_wrapper.mapping_compressed)
+
+        grid_ns = 0
+        tracker_ns = 0
+        mismatches = 0
+        for _ in range(args.steps):
+            expert.step()
+
+            start = time.perf_counter_ns()
+            enemies = expert.decoder.decode(environment.game_area()).enemies
+            grid_ns += time.perf_counter_ns() - start
+
+            start = time.perf_counter_ns()
+            tracker.update(environment.pyboy)
+            tracker_ns += time.perf_counter_ns() - start
+
+            # A 16x16 enemy covers up to four cells of the grid, compare the cells the two cover
+            cells = {(y // 8 - 2, x // 8) for x, y, _ in tracker.read_sprites(environment.pyboy.memory)}
+            cells = {cell for cell in cells if 0 <= cell[0] < 16 and 0 <= cell[1] < 20}
+            mismatches += len(cells) != len(set(map(tuple, enemies.tolist())))
+
+        environment.pyboy.stop(save=False)
+
+    results = {"grid_us": grid_ns / args.steps / 1e3, "tracker_us": tracker_ns / args.steps / 1e3}
+    logging.info(f"Grid scan: {results['grid_us']:.1f}us, sprite tracker: {results['tracker_us']:.1f}us per frame")
+    logging.info(f"{mismatches}/{args.steps} frames with a different number of enemy cells")
+    return results
+
+
+def benchmark_observation(args):
+    """
+    Compares the batched ObservationPipeline against per-frame processing (naive_observation) on the frames and grids
+    of a VectorMarioEnv for each number of environments in --envs, and checks both produce the same observations.
+    """
+    results = {}
+    for num_envs in args.envs:
+        pipeline = ObservationPipeline(num_envs, stack=args.stack, downsample=args.downsample)
+        histories = [[] for _ in range(num_envs)]
+
+        pipeline_seconds = 0.0
+        naive_seconds = 0.0
+        max_difference = 0.0
+        with VectorMarioEnv(num_envs, frames=True) as env:
+            env.reset()
+            pipeline.reset(env.frames, env.grids)
+            for index in range(num_envs):
+                naive_observation(histories[index], env.frames[index], env.grids[index], args.stack, args.downsample)
+
+            for _ in range(args.steps):
+                _, _, terminated, _, _ = env.step(np.random.randint(0, 7, size=num_envs))
+
+                start = time.perf_counter()
+                frames, grid = pipeline.step(env.frames, env.grids, terminated)
+                pipeline_seconds += time.perf_counter() - start
+
+                start = time.perf_counter()
+                naive = []
+                for index in range(num_envs):
+                    if terminated[index]:
+                        histories[index].clear()
+                    naive.append(
+                        naive_observation(histories[index], env.frames[index], env.grids[index], args.stack, args.downsample)
+                    )
+                naive_seconds += time.perf_counter() - start
+
+                for index, (naive_frames, naive_grid) in enumerate(naive):
+                    max_difference = max(
+                        max_difference,
+                        float(np.abs(frames[index] - naive_frames).max()),
+                        float(np.abs(grid[index] - naive_grid).max()),
+                    )
+
+        results[num_envs] = {
+            "pipeline_us": pipeline_seconds / args.steps * 1e6,
+            "naive_us": naive_seconds / args.steps * 1e6,
+            "max_difference": max_difference,
+        }
+        speedup = naive_seconds / pipeline_seconds if pipeline_seconds > 0 else 0.0
+        logging.info(
+            f"{num_envs:>3} envs: {results[num_envs]['pipeline_us']:.0f}us batched, {results[num_envs]['naive_us']:.0f}us "
+            f"per frame ({speedup:.2f}x), max difference {max_difference:.4f}"
+        )
+    return results
+
+
+BENCHMARKS = {
+    "turbo": benchmark_turbo,
+    "game_state": benchmark_game_state,
+    "vector_env": benchmark_vector_env,
+    "pipeline": benchmark_pipeline,
+    "enemy_tracker": benchmark_enemy_tracker,
+    "observation": benchmark_observation,
+}
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("benchmark", type=str, choices=BENCHMARKS.keys())
+
+    parse_args.add_argument("--steps", type=int, default=500)
+    parse_args.add_argument("--envs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parse_args.add_argument("--max_staleness", type=int, default=10)
+    parse_args.add_argument("--stack", type=int, default=4)
+    parse_args.add_argument("--downsample", type=int, default=2)
+
+    return parse_args.parse_args()
+
+
+def main():
+    args = get_args()
+
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Capture policies for the video MarioExpert.play records.
+
+play hands every step to the expert's capture policy:
+
+    VideoCapture()                      every step, upscaled to 300x240, into mario_expert.mp4 (the default)
+    VideoCapture(every=4)               every 4th step
+    VideoCapture(native=True)           the native 160x144 screen without resizing
+    NoCapture()                         no video at all
+    RingCapture(seconds=10)             the last 10 seconds kept in memory, written to death_N.mp4 whenever Mario
+                                        loses a life and to game_over.mp4 at the end
+
+Frames are taken once per step, and videos play at fps frames per second (30 by default).
+"""
+
+import logging
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_HEIGHT = 240
+DEFAULT_WIDTH = 300
+
+NATIVE_HEIGHT = 144
+NATIVE_WIDTH = 160
+
+
+class NoCapture:
+    """
+    Records nothing.
+    """
+
+    def start(self, expert) -> None:
+        pass
+
+    def capture(self, expert) -> None:
+        pass
+
+    def finish(self, expert) -> None:
+        pass
+
+
+class VideoCapture:
+    """
+    Streams frames into mario_expert.mp4 through the expert's background video encoder.
+
+    Args:
+        every (int): Capture every Nth step. Defaults to 1.
+        native (bool): Whether to record the native 160x144 screen instead of 300x240. Defaults to False.
+        fps (int): Frames per second of the video. Defaults to 30.
+    """
+
+    def __init__(self, every: int = 1, native: bool = False, fps: int = 30) -> None:
+        self.every = every
+        self.fps = fps
+        self.height, self.width = (NATIVE_HEIGHT, NATIVE_WIDTH) if native else (DEFAULT_HEIGHT, DEFAULT_WIDTH)
+        self._steps = 0
+
+    def start(self, expert) -> None:
+        self._steps = 0
+        expert.start_video(f"{expert.results_path}/mario_expert.mp4", self.width, self.height, fps=self.fps)
+
+    def capture(self, expert) -> None:
+        self._steps += 1
+        if (self._steps - 1) % self.every != 0:
+            return
+
+        profiler = expert.profiler
+        if profiler.enabled:
+            start = time.perf_counter_ns()
+
+        frame = expert.video.acquire()
+        if frame is None:
+            return
+
+        if profiler.enabled:
+            profiler.record("video_wait", start)
+            start = time.perf_counter_ns()
+
+        expert.environment.grab_frame(self.height, self.width, out=frame)
+
+        if profiler.enabled:
+            profiler.record("grab_frame", start)
+            start = time.perf_counter_ns()
+
+        expert.video.submit(frame)
+
+        if profiler.enabled:
+            profiler.record("video_write", start)
+
+    def finish(self, expert) -> None:
+        expert.stop_video()
+
+
+class RingCapture:
+    """
+    Keeps the last seconds of frames in a preallocated in-memory ring and only encodes them when Mario dies or the
+    game ends, or when flush is called.
+
+    Args:
+        seconds (float): The length of the kept history. Defaults to 10.
+        every (int): Capture every Nth step. Defaults to 1.
+        native (bool): Whether to record the native 160x144 screen instead of 300x240. Defaults to False.
+        fps (int): Frames per second of the videos. Defaults to 30.
+    """
+
+    def __init__(self, seconds: float = 10, every: int = 1, native: bool = False, fps: int = 30) -> None:
+        self.every = every
+        self.fps = fps
+        self.height, self.width = (NATIVE_HEIGHT, NATIVE_WIDTH) if native else (DEFAULT_HEIGHT, DEFAULT_WIDTH)
+
+        self._frames = np.empty((max(int(seconds * fps), 1), self.height, self.width, 3), dtype=np.uint8)
+        self._count = 0
+        self._steps = 0
+        self._lives = None
+        self.deaths = 0
+
+    def start(self, expert) -> None:
+        self._count = 0
+        self._steps = 0
+        self._lives = expert.environment.get_lives()
+        self.deaths = 0
+
+    def capture(self, expert) -> None:
+        environment = expert.environment
+
+        lives = environment.get_lives()
+        if lives < self._lives:
+            self.deaths += 1
+            self.flush(expert, f"{expert.results_path}/death_{self.deaths}.mp4")
+        self._lives = lives
+
+        self._steps += 1
+        if (self._steps - 1) % self.every != 0:
+            return
+
+        profiler = expert.profiler
+        if profiler.enabled:
+            start = time.perf_counter_ns()
+
+        environment.grab_frame(self.height, self.width, out=self._frames[self._count % len(self._frames)])
+        self._count += 1
+
+        if profiler.enabled:
+            profiler.record("grab_frame", start)
+
+    def flush(self, expert, video_name: str) -> None:
+        """
+        Encodes the kept frames, oldest first, into video_name and empties the ring.
+        """
+        if self._count == 0:
+            return
+
+        profiler = expert.profiler
+        if profiler.enabled:
+            start = time.perf_counter_ns()
+
+        slots = len(self._frames)
+        first = max(self._count - slots, 0)
+        writer = cv2.VideoWriter(video_name, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (self.width, self.height))
+        for index in range(first, self._count):
+            writer.write(self._frames[index % slots])
+        writer.release()
+
+        logging.info(f"Wrote the last {self._count - first} frames to {video_name}")
+        self._count = 0
+
+        if profiler.enabled:
+            profiler.record("video_flush", start)
+
+    def finish(self, expert) -> None:
+        if expert.environment.get_game_over():
+            self.flush(expert, f"{expert.results_path}/game_over.mp4")
+
+
+def create_policy(name: str, every: int = 1, native: bool = False, seconds: float = 10, fps: int = 30):
+    """
+    Builds a capture policy from its run.py name: "video", "none" or "ring".
+    """
+    if name == "none":
+        return NoCapture()
+    if name == "ring":
+        return RingCapture(seconds=seconds, every=every, native=native, fps=fps)
+    if name == "video":
+        return VideoCapture(every=every, native=native, fps=fps)
+    raise ValueError(f"Unknown capture policy {name}, expected one of video, none or ring")
@@ -0,0 +1,122 @@
+"""
+Memoisation of MarioExpert decisions.
+
+Consecutive frames often show Mario in the same situation, so the (state, action, hold_freq) decision is cached
+against a key made of the previous FSM state, Mario's position, the solid/air tiles of the two rows the FSM checks
+around Mario (from the left edge of the screen to 6 tiles ahead, the range the GOOMBA ABOVE wall check reads) and the
+enemy and jumping bug positions. With a world map attached to the scene the GAP and wall checks read the map instead
+(see Scene.gap_ahead and Scene.wall_ahead), so the key adds the map's gap bit of the column in front of Mario and the
+map's solid tiles of Mario's row over the same window. That is everything fsm_transition and choose_action read apart
+from the x position, so decisions in the x position dependent special case are never cached (see
+MarioExpert.decision_key).
+
+Custom fsm_rules configurations that read tiles outside of that window should be checked with validate=True, which
+recomputes every hit and compares it against the cached decision, counting mismatches.
+"""
+
+import logging
+from collections import OrderedDict
+
+import numpy as np
+from scene_decoder import AIR, SOLID
+
+# Tiles ahead of Mario covered by the key
+WINDOW_AHEAD = 6
+
+
+def scene_key(state: str, scene) -> tuple:
+    """
+    Returns the cache key of a decision taken from state in scene.
+    """
+    row, col = scene.mario_row, scene.mario_col
+    window = scene.flags[max(row, 0) : max(row + 2, 0), : max(col + WINDOW_AHEAD + 1, 0)] & (SOLID | AIR)
+    bugs = scene.jumping_bugs
+    key = (
+        state,
+        row,
+        col,
+        window.shape,
+        window.tobytes(),
+        scene.enemies.tobytes(),
+        np.ascontiguousarray(bugs[:, 1]).tobytes(),
+    )
+
+    world_map = scene.world_map
+    if world_map is None:
+        return key
+    # The map knows terrain a sprite covers and tells a pit from a step down, the scene's flags do not
+    origin = world_map.origin
+    walls = b""
+    if 0 <= row < world_map.rows:
+        walls = (world_map.flags[row, origin : origin + max(col + WINDOW_AHEAD + 1, 0)] & SOLID).tobytes()
+    return key + (scene.gap_ahead(), walls)
+
+
+class DecisionCache:
+    """
+    An LRU cache of decisions with hit/miss counters.
+
+    Args:
+        max_entries (int): The maximum number of cached decisions. Defaults to 4096.
+        validate (bool): Whether to recompute every hit and count the hits that differ. Defaults to False.
+    """
+
+    def __init__(self, max_entries: int = 4096, validate: bool = False) -> None:
+        self.max_entries = max_entries
+        self.validate = validate
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.mismatches = 0
+        self._decisions = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._decisions)
+
+    def lookup(self, key, decide):
+        """
+        Returns the decision cached for key, calling decide() to make (and cache) it on a miss. A key of None bypasses
+        the cache.
+        """
+        if key is None:
+            self.bypassed += 1
+            return decide()
+
+        decision = self._decisions.get(key)
+        if decision is None:
+            self.misses += 1
+            decision = decide()
+            self._decisions[key] = decision
+            if len(self._decisions) > self.max_entries:
+                self._decisions.popitem(last=False)
+                self.evictions += 1
+            return decision
+
+        self.hits += 1
+        self._decisions.move_to_end(key)
+
+        if self.validate:
+            expected = decide()
+            if expected != decision:
+                self.mismatches += 1
+                logging.warning(f"Decision cache returned {decision} instead of {expected} for state {key[0]}")
+                self._decisions[key] = expected
+                return expected
+
+        return decision
+
+    def clear(self) -> None:
+        self._decisions.clear()
+
+    def stats(self) -> dict[str, any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._decisions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "mismatches": self.mismatches,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,260 @@
+"""
+Enemy tracking from the sprite attribute table (OAM) instead of the game area grid.
+
+The 40 OAM entries (y, x, tile, flags at 0xFE00) are read as a single memory slice every update. Sprite tiles are
+classified with the game wrapper's compressed mapping and the scene decoder's lookup table, so a sprite is an enemy
+exactly when game_area() would have shown it as one (IDs 15, 16 and 18). Enemies are drawn from several 8x8 sprites,
+adjacent sprites of the same category are merged into one detection at the centre of their bounding box.
+
+Detections are associated with the tracks of the previous update by a greedy nearest-neighbour match over small
+fixed-size arrays. Each track keeps a smoothed velocity in pixels per frame and the column it is predicted to land in,
+given the solid tiles below it in the current scene.
+
+Positions are screen pixels, the game area cell of a pixel is (y // 8 - 2, x // 8) like pyboy's sprite overlay.
+"""
+
+import numpy as np
+from scene_decoder import ENEMY, JUMPING_BUG, SOLID, TILE_LUT
+
+OAM_START = 0xFE00
+OAM_SPRITES = 40
+
+# game_area() starts at the third tile row of the screen
+GAME_AREA_TOP = 2
+
+TRACKED = ENEMY | JUMPING_BUG
+
+
+class EnemyTracker:
+    """
+    Tracks the enemies on screen across updates.
+
+    Args:
+        mapping (np.ndarray): Sprite tile ID to compressed tile ID, the game wrapper's mapping_compressed.
+        lut (np.ndarray): Compressed tile ID to category bits. Defaults to scene_decoder.TILE_LUT.
+        max_enemies (int): The number of track slots. Defaults to 10.
+        max_distance (float): The furthest, in pixels, a detection may be from a track to continue it. Defaults to 16.
+        max_missed (int): The number of updates a track survives without a detection. Defaults to 2.
+        smoothing (float): The weight of the newest velocity measurement. Defaults to 0.5.
+    """
+
+    def __init__(
+        self,
+        mapping: np.ndarray,
+        lut: np.ndarray = TILE_LUT,
+        max_enemies: int = 10,
+        max_distance: float = 16,
+        max_missed: int = 2,
+        smoothing: float = 0.5,
+    ) -> None:
+        # OAM tile ID (0-255) straight to category bits
+        self.sprite_lut = lut[np.asarray(mapping)[:256]] & TRACKED
+        self._sprite_lut = self.sprite_lut.tolist()
+
+        self.max_enemies = max_enemies
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.smoothing = smoothing
+
+        self.position = np.zeros((max_enemies, 2), dtype=np.float32)  # (x, y) centre in pixels
+        self.velocity = np.zeros((max_enemies, 2), dtype=np.float32)  # (vx, vy) in pixels per frame
+        self.height = np.zeros(max_enemies, dtype=np.float32)
+        self.category = np.zeros(max_enemies, dtype=np.uint8)
+        self.ids = np.full(max_enemies, -1, dtype=np.int32)
+        self.missed = np.zeros(max_enemies, dtype=np.int32)
+        self.active = np.zeros(max_enemies, dtype=bool)
+        self.landing_column = np.full(max_enemies, -1, dtype=np.int32)
+
+        self.frame = None
+        self._next_id = 0
+
+    def reset(self) -> None:
+        self.active[:] = False
+        self.ids[:] = -1
+        self.frame = None
+
+    @property
+    def count(self) -> int:
+        return int(self.active.sum())
+
+    def read_sprites(self, memory) -> list[tuple]:
+        """
+        Returns the (x, y) top left pixel and category of every on-screen enemy sprite.
+        """
+        oam = memory[OAM_START : OAM_START + OAM_SPRITES * 4]
+        sprite_lut = self._sprite_lut
+
+        # 40 entries, plain Python beats NumPy's per-call overhead at this size
+        sprites = []
+        for index in range(2, OAM_SPRITES * 4, 4):
+            category = sprite_lut[oam[index]]
+            if category:
+                y = oam[index - 2] - 16
+                x = oam[index - 1] - 8
+                if -8 < y < 144 and -8 < x < 160:
+                    sprites.append((x, y, category))
+        return sprites
+
+    @staticmethod
+    def group_sprites(sprites: list[tuple]) -> list[tuple]:
+        """
+        Merges touching sprites of the same category into detections: a list of (x, y) centre, height and category
+        tuples.
+        """
+        # [left, top, right, bottom, category] of every group
+        groups = []
+        for x, y, category in sprites:
+            for group in groups:
+                if group[4] == category and group[0] - 8 <= x <= group[2] and group[1] - 8 <= y <= group[3]:
+                    group[0] = min(group[0], x)
+                    group[1] = min(group[1], y)
+                    group[2] = max(group[2], x + 8)
+                    group[3] = max(group[3], y + 8)
+                    break
+            else:
+                groups.append([x, y, x + 8, y + 8, category])
+
+        return [
+            ((left + right) / 2, (top + bottom) / 2, bottom - top, category) for left, top, right, bottom, category in groups
+        ]
+
+    def update(self, pyboy) -> None:
+        """
+        Reads the sprites of the current frame and moves the tracks on. Call predict_landing with the frame's decoded
+        scene afterwards to refresh the landing columns.
+        """
+        sprites = self.read_sprites(pyboy.memory)
+
+        frames = 1 if self.frame is None else max(pyboy.frame_count - self.frame, 1)
+        self.frame = pyboy.frame_count
+        if not sprites and not self.active.any():
+            return
+
+        detections = self.group_sprites(sprites)
+        position = self.position.tolist()
+        velocity = self.velocity.tolist()
+        tracks = np.flatnonzero(self.active).tolist()
+        track_category = self.category.tolist()
+
+        # Greedy nearest neighbour: the closest (track, detection) pairs of the same category first
+        pairs = []
+        for slot in tracks:
+            predicted_x = position[slot][0] + velocity[slot][0] * frames
+            predicted_y = position[slot][1] + velocity[slot][1] * frames
+            for detection, (centre_x, centre_y, _, detection_category) in enumerate(detections):
+                if detection_category != track_category[slot]:
+                    continue
+                distance = abs(centre_x - predicted_x) + abs(centre_y - predicted_y)
+                if distance <= self.max_distance:
+                    pairs.append((distance, slot, detection))
+        pairs.sort()
+
+        continued = set()
+        matched = set()
+        for _, slot, detection in pairs:
+            if slot in continued or detection in matched:
+                continue
+            centre_x, centre_y, height, _ = detections[detection]
+            measured_x = (centre_x - position[slot][0]) / frames
+            measured_y = (centre_y - position[slot][1]) / frames
+            self.velocity[slot, 0] += self.smoothing * (measured_x - velocity[slot][0])
+            self.velocity[slot, 1] += self.smoothing * (measured_y - velocity[slot][1])
+            self.position[slot] = centre_x, centre_y
+            self.height[slot] = height
+            self.missed[slot] = 0
+            continued.add(slot)
+            matched.add(detection)
+
+        # Tracks without a detection coast along their velocity until they have been missed too often
+        for slot in tracks:
+            if slot in continued:
+                continue
+            self.missed[slot] += 1
+            self.position[slot] += self.velocity[slot] * frames
+            if self.missed[slot] > self.max_missed:
+                self.active[slot] = False
+
+        for detection, (centre_x, centre_y, height, detection_category) in enumerate(detections):
+            if detection in matched:
+                continue
+            free = np.flatnonzero(~self.active)
+            if free.size == 0:
+                break
+            slot = free[0]
+            self.position[slot] = centre_x, centre_y
+            self.height[slot] = height
+            self.velocity[slot] = 0
+            self.category[slot] = detection_category
+            self.missed[slot] = 0
+            self.ids[slot] = self._next_id
+            self.active[slot] = True
+            self._next_id += 1
+
+    def predict_landing(self, scene) -> None:
+        """
+        Predicts the game area column every track lands in: where its path meets the first solid tile below it. Tracks
+        that are not falling land in their current column.
+        """
+        flags = scene.flags
+        rows, cols = flags.shape
+        for slot in np.flatnonzero(self.active):
+            x, y = self.position[slot]
+            vx, vy = self.velocity[slot]
+            col = int(x // 8)
+            if vy <= 0.25 or not 0 <= col < cols:
+                self.landing_column[slot] = col
+                continue
+
+            # The first solid cell below the enemy's feet, in the column it falls through
+            bottom = y + self.height[slot] / 2
+            row = max(int(bottom // 8) - GAME_AREA_TOP, 0)
+            solid = np.flatnonzero(flags[row:, col] & SOLID)
+            ground = (row + solid[0] + GAME_AREA_TOP) * 8 if solid.size else (rows + GAME_AREA_TOP) * 8
+            self.landing_column[slot] = int((x + vx * (ground - bottom) / vy) // 8)
+
+    def cells(self) -> np.ndarray:
+        """
+        The (row, col) game area cell of every track, with sub-tile precision.
+        """
+        position = self.position[self.active]
+        return np.column_stack((position[:, 1] / 8 - GAME_AREA_TOP, position[:, 0] / 8))
+
+    def enemies(self) -> list[dict]:
+        """
+        Every active track: its id, category, game area (row, col), (row, col) velocity in tiles per frame and landing
+        column.
+        """
+        result = []
+        for slot, (row, col) in zip(np.flatnonzero(self.active), self.cells()):
+            result.append(
+                {
+                    "id": int(self.ids[slot]),
+                    "category": int(self.category[slot]),
+                    "row": float(row),
+                    "col": float(col),
+                    "velocity": (float(self.velocity[slot, 1]) / 8, float(self.velocity[slot, 0]) / 8),
+                    "landing_column": int(self.landing_column[slot]),
+                }
+            )
+        return result
+
+    def landing_near(self, col: int, reach: int = 1) -> bool:
+        """
+        Whether a falling enemy is predicted to land within reach columns of col.
+        """
+        falling = self.active & (self.velocity[:, 1] > 0.25)
+        return bool((falling & (np.abs(self.landing_column - col) <= reach)).any())
+
+    def frames_to_contact(self, row: int, col: int):
+        """
+        The fewest frames until an enemy in row (or the row above it) closing in horizontally reaches col, None if
+        none is.
+        """
+        cells = self.cells()
+        velocity = self.velocity[self.active, 0] / 8
+        in_row = (cells[:, 0] >= row - 1) & (cells[:, 0] < row + 1)
+        ahead = cells[:, 1] - col
+        closing = in_row & (((ahead > 0) & (velocity < 0)) | ((ahead < 0) & (velocity > 0)))
+        if not closing.any():
+            return None
+        return float((np.abs(ahead[closing]) / np.abs(velocity[closing])).min())
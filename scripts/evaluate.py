@@ -0,0 +1,241 @@
+"""
+Local, offline evaluation of one or more Mario Expert agents.
+
+Every episode runs headless in its own subprocess (so a crashing or hanging agent only takes down its own episode),
+with at most one episode per core running at a time. Results are appended to an aggregated results.jsonl and to the
+SQLite results index (see results_index.py) as episodes finish, and ranked with compare_performance at the end.
+
+Evaluate every agent in a directory (either agent_name.py files or agent_name/mario_expert.py folders):
+
+    python3 evaluate.py --agents_dir ~/submissions
+
+Evaluate a single agent over several seeds and start states:
+
+    python3 evaluate.py --agent mario_expert.py --seeds 0 1 2 --start_states ../roms/mario/init.state
+
+Or from stages of the start-state library (see state_library.py), "world-stage[@x]":
+
+    python3 evaluate.py --agent mario_expert.py --stages 1-1 1-2 2-1@1024
+"""
+
+import argparse
+import glob
+import importlib.util
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import cmp_to_key
+from pathlib import Path
+
+import numpy as np
+from compare_results import compare_performance
+from results_index import DEFAULT_INDEX_PATH, ResultsIndex, episode_deaths
+from state_library import DEFAULT_LIBRARY_PATH, StateLibrary
+
+logging.basicConfig(level=logging.INFO)
+
+OK = "ok"
+CRASHED = "crashed"
+TIMEOUT = "timeout"
+
+
+def find_agents(agents_dir):
+    """
+    Returns {agent_name: path to its mario_expert module} for every agent in agents_dir.
+    """
+    agents = {}
+    for path in sorted(glob.glob(f"{agents_dir}/*")):
+        name = Path(path).stem
+        if os.path.isdir(path):
+            module_path = f"{path}/mario_expert.py"
+            if os.path.exists(module_path):
+                agents[name] = module_path
+        elif path.endswith(".py"):
+            agents[name] = path
+    return agents
+
+
+def build_episodes(agents, seeds, start_states, results_path):
+    episodes = []
+    for agent_name, agent_path in agents.items():
+        for seed in seeds:
+            for start_state in start_states:
+                state_name = Path(start_state).stem if start_state else "init"
+                episode_id = f"{agent_name}-{state_name}-seed{seed}"
+                episodes.append(
+                    {
+                        "episode_id": episode_id,
+                        "agent": agent_name,
+                        "agent_path": os.path.abspath(agent_path),
+                        "seed": seed,
+                        "start_state": os.path.abspath(start_state) if start_state else None,
+                        "results_path": f"{results_path}/{episode_id}",
+                    }
+                )
+    return episodes
+
+
+def run_episode(episode, timeout):
+    """
+    Runs a single episode in a subprocess and returns its record for the aggregated store.
+    """
+    os.makedirs(episode["results_path"], exist_ok=True)
+
+    # Never pick up the results of an earlier run of the same episode
+    results_file = f"{episode['results_path']}/results.json"
+    if os.path.exists(results_file):
+        os.remove(results_file)
+
+    python = episode.get("python") or sys.executable
+    command = [python, os.path.abspath(__file__), "--episode", json.dumps(episode)]
+
+    start = time.monotonic()
+    with open(f"{episode['results_path']}/episode.log", "w", encoding="utf-8") as log:
+        try:
+            process = subprocess.run(
+                command,
+                cwd=Path(__file__).parent,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                timeout=timeout,
+                check=False,
+            )
+            status = OK if process.returncode == 0 else CRASHED
+        except subprocess.TimeoutExpired:
+            status = TIMEOUT
+    duration = time.monotonic() - start
+
+    record = {key: episode[key] for key in ["episode_id", "agent", "seed", "start_state"]}
+    record["status"] = status
+    record["duration"] = duration
+
+    if status == OK and os.path.exists(results_file):
+        with open(results_file, "r", encoding="utf-8") as file:
+            record.update(json.load(file))
+    elif status == OK:
+        record["status"] = CRASHED
+
+    return record
+
+
+def episode_main(episode):
+    """
+    Entry point of the episode subprocess.
+    """
+    random.seed(episode["seed"])
+    np.random.seed(episode["seed"])
+
+    spec = importlib.util.spec_from_file_location(f"agent_{episode['agent']}", episode["agent_path"])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    expert = module.MarioExpert(results_path=episode["results_path"], headless=True)
+
+    environment = expert.environment
+    if episode["start_state"] is not None:
+        environment.init_path = episode["start_state"]
+    if hasattr(environment, "set_turbo"):
+        environment.set_turbo(True)
+    else:
+        environment.pyboy.set_emulation_speed(0)
+
+    expert.play()
+
+
+def evaluate(episodes, workers, timeout, results_path, index_path=DEFAULT_INDEX_PATH):
+    os.makedirs(results_path, exist_ok=True)
+
+    records = []
+    with open(f"{results_path}/results.jsonl", "a", encoding="utf-8") as store, ResultsIndex(index_path) as index:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_episode, episode, timeout) for episode in episodes]
+
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+
+                store.write(json.dumps(record) + "\n")
+                store.flush()
+                index.add(record, episode_deaths(f"{results_path}/{record['episode_id']}", record))
+
+                logging.info(
+                    f"[{len(records)}/{len(episodes)}] {record['episode_id']}: {record['status']} "
+                    f"in {record['duration']:.1f}s"
+                )
+
+    return records
+
+
+def rank(records):
+    completed = [record for record in records if record["status"] == OK]
+    completed = sorted(completed, key=cmp_to_key(compare_performance))
+
+    for i, result in enumerate(completed):
+        logging.info(
+            f"Rank {i + 1}: {result['episode_id']} - World: {result['world']} Stage: {result['stage']} Score: {result['score']}"
+        )
+
+    failed = [record for record in records if record["status"] != OK]
+    for record in failed:
+        logging.warning(f"{record['episode_id']}: {record['status']}")
+
+    return completed
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    agents = parse_args.add_mutually_exclusive_group(required=True)
+    agents.add_argument("--agents_dir", type=str)
+    agents.add_argument("--agent", type=str)
+    agents.add_argument("--episode", type=str, help=argparse.SUPPRESS)
+
+    parse_args.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parse_args.add_argument("--start_states", type=str, nargs="+", default=[None])
+    # Stages of the start-state library, used instead of --start_states
+    parse_args.add_argument("--stages", type=str, nargs="+", default=None)
+    parse_args.add_argument("--library", type=str, default=DEFAULT_LIBRARY_PATH)
+
+    parse_args.add_argument("--workers", type=int, default=os.cpu_count())
+    parse_args.add_argument("--timeout", type=float, default=600.0)
+    parse_args.add_argument("--index", type=str, default=DEFAULT_INDEX_PATH)
+
+    parse_args.add_argument(
+        "-r", "--results_path", type=str, default=f"{Path(__file__).parent.parent}/results/evaluation"
+    )
+
+    return parse_args.parse_args()
+
+
+def main():
+    args = get_args()
+
+    if args.episode is not None:
+        episode_main(json.loads(args.episode))
+        return
+
+    if args.agents_dir is not None:
+        agents = find_agents(args.agents_dir)
+    else:
+        agents = {Path(args.agent).stem: args.agent}
+    logging.info(f"Found {len(agents)} agents: {list(agents.keys())}")
+
+    start_states = args.start_states
+    if args.stages is not None:
+        library = StateLibrary(args.library)
+        start_states = [library.path_of(stage) for stage in args.stages]
+
+    episodes = build_episodes(agents, args.seeds, start_states, args.results_path)
+    logging.info(f"Running {len(episodes)} episodes on {args.workers} workers")
+
+    records = evaluate(episodes, args.workers, args.timeout, args.results_path, args.index)
+    rank(records)
+
+
+if __name__ == "__main__":
+    main()
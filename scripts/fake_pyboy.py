@@ -0,0 +1,174 @@
+"""
+A local stand-in for the pyboy.PyBoy object, driven by fixture frames instead of the ROM.
+
+Each frame holds a game_area() grid, the RAM values the MarioEnvironment getters read, the score (also as the six
+status bar digit tiles at 0x9820 the game wrapper sums) and the SCX scroll register. FakePyBoy serves them through the same attributes MarioController uses (memory, tick, send_input,
+screen.ndarray, screen.tilemap_position_list, game_wrapper, save_state/load_state), so the decision pipeline and the
+environment wrapper can be measured without the ROM or an emulator.
+
+fixtures/game_frames.json is synthetic, not a recording: 19 hand-made scenes, chosen so every FSM state is decided at
+least once, rather than consecutive frames of play. Its RAM is kept consistent with each scene (the level block and
+SCX give the scene's x position, the score digits match score, the timer counts down at the game's pace), but it is
+far shorter and simpler than real play, so baselines measured on it are only comparable with each other. Frames of a
+live game (needs the ROM) are recorded with:
+
+    python3 stub_benchmark.py record --steps 300 --name recorded_frames
+"""
+
+import contextlib
+import io
+import json
+from pathlib import Path
+
+import numpy as np
+import pyboy_environment
+
+FIXTURES_PATH = f"{Path(__file__).parent}/fixtures"
+
+# The RAM ranges read by MarioEnvironment/RamSnapshot, as [start, end) pairs
+FIXTURE_RANGES = [
+    (0x9820, 0x9826),
+    (0x982C, 0x9834),
+    (0xC0A4, 0xC0AD),
+    (0xC202, 0xC204),
+    (0xDA15, 0xDA16),
+    (0xFFA6, 0xFFA7),
+    (0xFFFA, 0xFFFB),
+]
+
+
+def load_frames(name: str = "game_frames") -> list[dict]:
+    with open(f"{FIXTURES_PATH}/{name}.json", "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def capture_frame(pyboy, game_area) -> dict:
+    """
+    Captures the current state of a real PyBoy in the fixture format.
+    """
+    ram = {}
+    for start, end in FIXTURE_RANGES:
+        for offset, value in enumerate(pyboy.memory[start:end]):
+            ram[f"{start + offset:04X}"] = value
+    return {
+        "game_area": np.asarray(game_area).tolist(),
+        "ram": ram,
+        "score": pyboy.game_wrapper.score,
+        "scx": pyboy.screen.tilemap_position_list[16][0],
+    }
+
+
+class FakeMemory:
+    def __init__(self) -> None:
+        self.data = bytearray(0x10000)
+
+    def __getitem__(self, addr):
+        if isinstance(addr, slice):
+            return list(self.data[addr])
+        return self.data[addr]
+
+    def __setitem__(self, addr, value) -> None:
+        self.data[addr] = value
+
+
+class FakeScreen:
+    def __init__(self) -> None:
+        self.ndarray = np.zeros((144, 160, 4), dtype=np.uint8)
+        self.scx = 0
+
+    @property
+    def tilemap_position_list(self):
+        return [[self.scx, 0, 0, 0] for _ in range(144)]
+
+
+class FakeGameWrapper:
+    mapping_compressed = np.arange(512, dtype=np.uint32)
+
+    def __init__(self) -> None:
+        self.grid = np.zeros((16, 20), dtype=np.uint32)
+        self.score = 0
+
+    def game_area_mapping(self, mapping, sprite_offset) -> None:
+        pass
+
+    def game_area(self) -> np.ndarray:
+        # pyboy returns a new array on every call
+        return self.grid.copy()
+
+
+class FakePyBoy:
+    """
+    Plays back fixture frames. Every tick advances to the next frame, wrapping around at the end.
+
+    Args:
+        frames (list[dict]): Frames in the fixture format, see capture_frame.
+    """
+
+    def __init__(self, frames: list[dict], *args, **kwargs) -> None:
+        self.frames = [self._decode(frame) for frame in frames]
+        self.memory = FakeMemory()
+        self.screen = FakeScreen()
+        self.game_wrapper = FakeGameWrapper()
+        self.frame_count = 0
+        self.frame_index = 0
+        self.inputs = 0
+        self.show_frame(0)
+
+    @staticmethod
+    def _decode(frame: dict):
+        ram = [(int(addr, 16), value) for addr, value in frame["ram"].items()]
+        grid = np.asarray(frame["game_area"], dtype=np.uint32)
+        return grid, ram, frame["score"], frame["scx"]
+
+    def show_frame(self, index: int) -> None:
+        self.frame_index = index % len(self.frames)
+        grid, ram, score, scx = self.frames[self.frame_index]
+        self.game_wrapper.grid = grid
+        self.game_wrapper.score = score
+        self.screen.scx = scx
+        for addr, value in ram:
+            self.memory.data[addr] = value
+
+    def tick(self, count: int = 1, render: bool = True) -> bool:
+        self.frame_count += count
+        self.show_frame(self.frame_index + 1)
+        return True
+
+    def send_input(self, event, delay: int = 0) -> None:
+        self.inputs += 1
+
+    def set_emulation_speed(self, target_speed: int) -> None:
+        pass
+
+    def save_state(self, file_like_object) -> None:
+        file_like_object.write(self.frame_index.to_bytes(4, "little"))
+
+    def load_state(self, file_like_object) -> None:
+        data = file_like_object.read()
+        self.show_frame(int.from_bytes(data[:4], "little") if len(data) >= 4 else 0)
+
+    def stop(self, save: bool = True) -> None:
+        pass
+
+
+@contextlib.contextmanager
+def fake_pyboy(frames: list[dict]):
+    """
+    While active, PyboyEnvironment creates a FakePyBoy playing back frames instead of a real PyBoy, and resets
+    restore the first frame instead of reading the init state from disk.
+    """
+    from mario_expert import MarioController
+
+    original_pyboy = pyboy_environment.PyBoy
+    original_reset = MarioController.reset
+
+    def reset(self) -> None:
+        self.load_state_buffer(io.BytesIO(b""))
+
+    pyboy_environment.PyBoy = lambda *args, **kwargs: FakePyBoy(frames)
+    MarioController.reset = reset
+    try:
+        yield
+    finally:
+        pyboy_environment.PyBoy = original_pyboy
+        MarioController.reset = original_reset
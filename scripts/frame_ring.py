@@ -0,0 +1,267 @@
+"""
+Shared-memory export of native emulator frames.
+
+The emulator process publishes each frame (the 144x160 RGBA screen.ndarray, untouched) into a ring of slots in a
+multiprocessing.shared_memory block. Any number of reader processes - dashboards, training jobs - attach to the block
+by name and get NumPy views of the slots without copying. Resizing and colour conversion only happen on the reader
+side, when a reader asks for them.
+
+Every frame carries a sequence number. The writer zeroes a slot's sequence number before overwriting it and sets it
+once the frame is complete, so readers can tell when a slot they hold was overwritten while they were using it, and
+readers that fall more than a ring behind the writer skip ahead and count the frames they missed.
+
+    ring = FrameRing(slots=8, name="mario")  # emulator process
+    environment.frame_ring = ring
+
+    reader = FrameRingReader("mario")  # any other process
+    frame = reader.read_next()
+    if frame is not None:
+        seq, pixels = frame
+        small = reader.convert(pixels, 72, 80)
+        if reader.valid(seq): ...
+"""
+
+import argparse
+import logging
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+FRAME_SHAPE = (144, 160, 4)
+
+MAGIC = 0x4D46524D  # "MRFM"
+
+# uint64 header fields
+_MAGIC, _SLOTS, _HEIGHT, _WIDTH, _CHANNELS, _HEAD = range(6)
+HEADER_FIELDS = 8
+
+# Names of the rings created by this process
+_OWNED = set()
+
+
+def _views(buffer, slots: int, shape: tuple):
+    header = np.ndarray((HEADER_FIELDS,), dtype=np.uint64, buffer=buffer)
+    sequences = np.ndarray((slots,), dtype=np.uint64, buffer=buffer, offset=header.nbytes)
+    frames = np.ndarray((slots, *shape), dtype=np.uint8, buffer=buffer, offset=header.nbytes + sequences.nbytes)
+    return header, sequences, frames
+
+
+def ring_size(slots: int, shape: tuple = FRAME_SHAPE) -> int:
+    return (HEADER_FIELDS + slots) * 8 + slots * int(np.prod(shape))
+
+
+class FrameRing:
+    """
+    The writer side of the ring, owned by the emulator process.
+
+    Args:
+        slots (int): The number of frames kept. Defaults to 8.
+        name (str): The shared memory block name readers attach to, a random one if None. Defaults to None.
+        shape (tuple): The frame shape. Defaults to the native (144, 160, 4) RGBA screen.
+    """
+
+    def __init__(self, slots: int = 8, name: str = None, shape: tuple = FRAME_SHAPE) -> None:
+        self.slots = slots
+        self.shape = tuple(shape)
+
+        self._memory = shared_memory.SharedMemory(name=name, create=True, size=ring_size(slots, self.shape))
+        self._header, self._sequences, self._frames = _views(self._memory.buf, slots, self.shape)
+
+        self._header[:] = 0
+        self._sequences[:] = 0
+        self._header[_SLOTS] = slots
+        self._header[_HEIGHT], self._header[_WIDTH], self._header[_CHANNELS] = self.shape
+        self._header[_MAGIC] = MAGIC
+        _OWNED.add(self._memory.name)
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    @property
+    def head(self) -> int:
+        """
+        The sequence number of the last published frame, 0 before the first one.
+        """
+        return int(self._header[_HEAD])
+
+    def publish(self, frame: np.ndarray) -> int:
+        """
+        Copies frame into the next slot and returns its sequence number.
+        """
+        seq = int(self._header[_HEAD]) + 1
+        slot = seq % self.slots
+
+        self._sequences[slot] = 0
+        np.copyto(self._frames[slot], frame)
+        self._sequences[slot] = seq
+        self._header[_HEAD] = seq
+        return seq
+
+    def close(self) -> None:
+        """
+        Closes and removes the shared memory block, attached readers keep their mapping until they close.
+        """
+        self._header = self._sequences = self._frames = None
+        self._memory.close()
+        self._memory.unlink()
+        _OWNED.discard(self._memory.name)
+
+
+class FrameRingReader:
+    """
+    A reader attached to a FrameRing by name.
+
+    Args:
+        name (str): The name of the writer's shared memory block.
+    """
+
+    def __init__(self, name: str) -> None:
+        self._memory = shared_memory.SharedMemory(name=name)
+        # Attaching registers the block with this process's resource tracker, which would remove it when this
+        # process exits - only the writer owns it
+        if self._memory.name not in _OWNED:
+            resource_tracker.unregister(self._memory._name, "shared_memory")
+
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.uint64, buffer=self._memory.buf)
+        if int(header[_MAGIC]) != MAGIC:
+            raise ValueError(f"Shared memory block {name} is not a frame ring")
+
+        self.slots = int(header[_SLOTS])
+        self.shape = (int(header[_HEIGHT]), int(header[_WIDTH]), int(header[_CHANNELS]))
+        self._header, self._sequences, self._frames = _views(self._memory.buf, self.slots, self.shape)
+
+        # The last sequence number returned, frames the writer overwrote before they were read and torn reads
+        self.last_seq = 0
+        self.dropped = 0
+        self.torn = 0
+
+        self._resize_buffer = None
+
+    @property
+    def head(self) -> int:
+        return int(self._header[_HEAD])
+
+    @property
+    def lag(self) -> int:
+        """
+        The number of frames published since the last one read.
+        """
+        return self.head - self.last_seq
+
+    def valid(self, seq: int) -> bool:
+        """
+        Whether the slot of frame seq still holds that frame.
+        """
+        return int(self._sequences[seq % self.slots]) == seq
+
+    def _read(self, seq: int):
+        frame = self._frames[seq % self.slots]
+        if not self.valid(seq):
+            self.torn += 1
+            return None
+        self.last_seq = seq
+        return seq, frame
+
+    def read_next(self):
+        """
+        Returns (seq, frame) for the frame after the last one read, or None if there is no new frame. frame is a view
+        of the ring slot; check valid(seq) after using it or copy it to rule out the writer overwriting it.
+
+        A reader that fell behind by more than the ring skips to the oldest frame still available, adding the frames
+        it missed to dropped.
+        """
+        head = self.head
+        if head == self.last_seq:
+            return None
+
+        seq = self.last_seq + 1
+        # One slot of margin for the frame the writer may be in the middle of
+        oldest = max(head - self.slots + 2, 1)
+        if seq < oldest:
+            self.dropped += oldest - seq
+            seq = oldest
+        return self._read(seq)
+
+    def latest(self):
+        """
+        Returns (seq, frame) for the newest frame, or None if there is no new frame since the last one read. Frames
+        skipped over are not counted as dropped.
+        """
+        head = self.head
+        if head == self.last_seq:
+            return None
+        return self._read(head)
+
+    def convert(self, frame: np.ndarray, height: int = None, width: int = None, bgr: bool = False, out=None):
+        """
+        Resizes frame to (height, width) and/or converts it from RGBA to 3 channel RGB (BGR if bgr is set). Returns
+        frame itself when nothing is requested.
+        """
+        if height is None and not bgr:
+            return frame
+
+        if height is not None and (height, width) != frame.shape[:2]:
+            if self._resize_buffer is None or self._resize_buffer.shape[:2] != (height, width):
+                self._resize_buffer = np.empty((height, width, frame.shape[2]), dtype=np.uint8)
+            frame = cv2.resize(frame, (width, height), dst=self._resize_buffer)
+
+        return cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR if bgr else cv2.COLOR_RGBA2RGB, dst=out)
+
+    def close(self) -> None:
+        self._header = self._sequences = self._frames = None
+        self._memory.close()
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("name", type=str)
+
+    parse_args.add_argument("--show", action="store_true")
+    parse_args.add_argument("--height", type=int, default=240)
+    parse_args.add_argument("--width", type=int, default=300)
+
+    return parse_args.parse_args()
+
+
+def main():
+    """
+    Follows a frame ring, logging the read rate and lag every second and optionally showing the frames.
+    """
+    args = get_args()
+    reader = FrameRingReader(args.name)
+
+    frames = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            frame = reader.read_next()
+            if frame is None:
+                time.sleep(0.001)
+            else:
+                frames += 1
+                if args.show:
+                    cv2.imshow(args.name, reader.convert(frame[1], args.height, args.width, bgr=True))
+                    cv2.waitKey(1)
+
+            elapsed = time.perf_counter() - start
+            if elapsed >= 1.0:
+                logging.info(
+                    f"{frames / elapsed:.0f} frames/sec, seq {reader.last_seq}, lag {reader.lag}, "
+                    f"dropped {reader.dropped}, torn {reader.torn}"
+                )
+                frames = 0
+                start = time.perf_counter()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Declarative rule engine for the MarioExpert FSM.
+
+The rules live in a JSON file (fsm_rules.json reproduces the hand written fsm_transition/choose_action chain) with:
+
+    states       the FSM states, their position is the integer state ID
+    params       named numbers rules refer to as "$name", e.g. hold_freqs and distance thresholds
+    transitions  ordered rules {"from": [states], "if": [predicates], "to": state}, first match wins
+    default      the {"action", "hold"} used when no action rule of the new state matches
+    actions      per state ordered rules {"if": [predicates], "action": id, "hold": frames}, first match wins
+
+A predicate is a name or a [name, *args] list from PREDICATES, "!name" negates it. Rules without "from" apply to every
+state and rules without "if" always match.
+
+Loading compiles the rules into a dispatch table indexed by state ID: each state gets the tuple of transition rules
+that can apply to it, cut off after its first unconditional rule, so a decision only evaluates the predicates that can
+still change its outcome. Predicates read single cells of the decoded Scene's flag grid or loop over its enemy and bug
+cell lists in plain Python, with only a handful of enemies on screen NumPy's per-call overhead would cost more than the
+loops. stub_benchmark.py rules measures a decision on par with the hand written chain.
+
+RuleEngine.poll reloads the file when it changes on disk, so rules can be edited while the game is running. Every rule
+file needs a DEFAULT state; a decision from a state the reloaded rules no longer have starts from DEFAULT.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+
+from scene_decoder import AIR, SOLID
+
+DEFAULT_RULES_PATH = f"{Path(__file__).parent}/fsm_rules.json"
+
+
+def _x_between(low, high):
+    return lambda scene, x_position: low < x_position < high
+
+
+def _solid(row_offset, col_offset):
+    def predicate(scene, x_position):
+        return bool(scene.flag_at(scene.mario_row + row_offset, scene.mario_col + col_offset) & SOLID)
+
+    return predicate
+
+
+def _air(row_offset, col_offset):
+    def predicate(scene, x_position):
+        return bool(scene.flag_at(scene.mario_row + row_offset, scene.mario_col + col_offset) & AIR)
+
+    return predicate
+
+
+def _on_board():
+    return lambda scene, x_position: scene.mario_row < scene.rows
+
+
+def _enemies():
+    return lambda scene, x_position: len(scene.enemy_cells) > 0
+
+
+def _bugs_ahead():
+    def predicate(scene, x_position):
+        mario_col = scene.mario_col
+        for _, col in scene.jumping_bug_cells:
+            if col > mario_col:
+                return True
+        return False
+
+    return predicate
+
+
+def _within(cells, scene, distance):
+    mario_col = scene.mario_col
+    for _, col in cells:
+        if 0 <= col - mario_col < distance:
+            return True
+    return False
+
+
+def _enemy_ahead(distance):
+    return lambda scene, x_position: _within(scene.enemy_cells, scene, distance)
+
+
+def _bug_ahead(distance):
+    return lambda scene, x_position: _within(scene.jumping_bug_cells, scene, distance)
+
+
+def _wall_ahead(distance):
+    return lambda scene, x_position: scene.wall_ahead(distance)
+
+
+def _gap_ahead():
+    return lambda scene, x_position: scene.gap_ahead()
+
+
+def _first_enemy(above):
+    """
+    Whether the first enemy (in scan order) that is not level with Mario is above him, or below him.
+    """
+
+    def predicate(scene, x_position):
+        mario_row = scene.mario_row
+        for row, _ in scene.enemy_cells:
+            if row < mario_row - 1:
+                return above
+            if row > mario_row:
+                return not above
+        return False
+
+    return predicate
+
+
+def _last_enemy_right():
+    return lambda scene, x_position: scene.enemy_cells[-1][1] > scene.mario_col
+
+
+def _last_enemy_behind(distance):
+    def predicate(scene, x_position):
+        col = scene.enemy_cells[-1][1]
+        return col - 1 < scene.mario_col and scene.mario_col - col < distance
+
+    return predicate
+
+
+# name -> factory(*args) returning predicate(scene, x_position) -> bool
+PREDICATES = {
+    "x_between": _x_between,
+    "solid": _solid,
+    "air": _air,
+    "on_board": _on_board,
+    "enemies": _enemies,
+    "bugs_ahead": _bugs_ahead,
+    "enemy_ahead": _enemy_ahead,
+    "bug_ahead": _bug_ahead,
+    "wall_ahead": _wall_ahead,
+    "gap_ahead": _gap_ahead,
+    "first_enemy_above": lambda: _first_enemy(above=True),
+    "first_enemy_below": lambda: _first_enemy(above=False),
+    "last_enemy_right": _last_enemy_right,
+    "last_enemy_behind": _last_enemy_behind,
+}
+
+
+def _negate(predicate):
+    return lambda scene, x_position: not predicate(scene, x_position)
+
+
+class RuleTable:
+    """
+    A compiled rule configuration, see the module docstring for the format.
+
+    Args:
+        config (dict): The rule configuration.
+        params (dict): Values overriding the configuration's params. Defaults to None.
+    """
+
+    def __init__(self, config: dict, params: dict = None) -> None:
+        self.states = list(config["states"])
+        self.state_ids = {state: state_id for state_id, state in enumerate(self.states)}
+        self.default_state = self._state_id("DEFAULT")
+        self.params = {**config.get("params", {}), **(params or {})}
+        self.x_windows = []
+
+        all_states = range(len(self.states))
+        self.transitions = [[] for _ in all_states]
+        for rule in config["transitions"]:
+            compiled = (self._predicates(rule.get("if", [])), self._state_id(rule["to"]))
+            sources = [self._state_id(state) for state in rule["from"]] if "from" in rule else all_states
+            for state_id in sources:
+                rules = self.transitions[state_id]
+                # Nothing after an unconditional rule can be reached
+                if not rules or rules[-1][0]:
+                    rules.append(compiled)
+        self.transitions = [tuple(rules) for rules in self.transitions]
+
+        default = config["default"]
+        self.default = (self._value(default["action"]), self._value(default["hold"]))
+
+        self.actions = [() for _ in all_states]
+        for state, rules in config.get("actions", {}).items():
+            self.actions[self._state_id(state)] = tuple(
+                (self._predicates(rule.get("if", [])), self._value(rule["action"]), self._value(rule["hold"]))
+                for rule in rules
+            )
+
+    def _state_id(self, state: str) -> int:
+        if state not in self.state_ids:
+            raise ValueError(f"Unknown FSM state {state}, expected one of {self.states}")
+        return self.state_ids[state]
+
+    def _value(self, value):
+        if isinstance(value, str) and value.startswith("$"):
+            name = value[1:]
+            if name not in self.params:
+                raise ValueError(f"Unknown rule parameter {name}")
+            return self.params[name]
+        return value
+
+    def _predicates(self, specs: list) -> tuple:
+        predicates = []
+        for spec in specs:
+            name, *args = [spec] if isinstance(spec, str) else spec
+            negate = name.startswith("!")
+            name = name.lstrip("!")
+            if name not in PREDICATES:
+                raise ValueError(f"Unknown rule predicate {name}, expected one of {list(PREDICATES)}")
+
+            args = [self._value(arg) for arg in args]
+            if name == "x_between":
+                self.x_windows.append(tuple(args))
+
+            predicate = PREDICATES[name](*args)
+            predicates.append(_negate(predicate) if negate else predicate)
+        return tuple(predicates)
+
+    def decide(self, scene, x_position: int, state_id: int):
+        """
+        Returns the (state ID, action, hold_freq) decision for scene taken from state_id.
+        """
+        # Plain loops rather than all(), a generator per rule costs more than most predicates
+        new_state = state_id
+        for predicates, target in self.transitions[state_id]:
+            for predicate in predicates:
+                if not predicate(scene, x_position):
+                    break
+            else:
+                new_state = target
+                break
+
+        for predicates, action, hold_freq in self.actions[new_state]:
+            for predicate in predicates:
+                if not predicate(scene, x_position):
+                    break
+            else:
+                return new_state, action, hold_freq
+        return (new_state, *self.default)
+
+
+class RuleEngine:
+    """
+    Loads a rule file into a RuleTable and reloads it when the file changes.
+
+    Args:
+        path (str): The rule file. Defaults to fsm_rules.json next to this module.
+        params (dict): Values overriding the file's params. Defaults to None.
+        check_interval (int): The number of poll calls between checks of the file's modification time. Defaults to 60.
+    """
+
+    def __init__(self, path: str = DEFAULT_RULES_PATH, params: dict = None, check_interval: int = 60) -> None:
+        self.path = path
+        self.params = params
+        self.check_interval = check_interval
+        self.version = 0
+
+        self._polls = 0
+        self._mtime = os.stat(path).st_mtime_ns
+        self.table = self._load()
+
+    def _load(self) -> RuleTable:
+        with open(self.path, "r", encoding="utf-8") as file:
+            return RuleTable(json.load(file), self.params)
+
+    @property
+    def states(self) -> list[str]:
+        return self.table.states
+
+    def poll(self) -> bool:
+        """
+        Reloads the rules if the file changed since the last check and returns whether they were replaced. A file that
+        fails to load is logged and the current rules are kept.
+        """
+        self._polls += 1
+        if self._polls % self.check_interval != 0:
+            return False
+
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        try:
+            table = self._load()
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logging.error(f"Keeping the current FSM rules, {self.path} failed to load: {error}")
+            return False
+
+        removed = [state for state in self.table.states if state not in table.state_ids]
+        if removed:
+            logging.warning(f"The reloaded FSM rules have no {removed} states, decisions from them start from DEFAULT")
+
+        self.table = table
+        self.version += 1
+        logging.info(f"Reloaded FSM rules from {self.path}")
+        return True
+
+    def x_dependent(self, x_position: int) -> bool:
+        """
+        Whether a decision at x_position can depend on the x position.
+        """
+        return any(low < x_position < high for low, high in self.table.x_windows)
+
+    def decide(self, scene, x_position: int, state: str):
+        """
+        Returns the (state, action, hold_freq) decision for scene taken from state, DEFAULT if the rules have no such
+        state (it was renamed or removed by a reload).
+        """
+        table = self.table
+        state_id, action, hold_freq = table.decide(scene, x_position, table.state_ids.get(state, table.default_state))
+        return table.states[state_id], action, hold_freq
@@ -0,0 +1,181 @@
+"""
+Deterministic record/replay of the (action, hold_freq) sequence passed to MarioController.run_action.
+
+A trace is a small binary file: a header with the CRC32 of the init state it was recorded from, then one 4 byte
+record per action and, every checksum_interval actions, a CRC32 of WRAM. Replaying drives a headless turbo emulator
+from the trace at maximum speed, verifies the checksums and reports the final game_state, so a replay doubles as a
+throughput benchmark for the emulator side without any agent logic.
+
+    python3 run.py --upi your_upi --record trace.bin
+    python3 input_trace.py trace.bin
+"""
+
+import argparse
+import json
+import logging
+import struct
+import time
+import zlib
+
+logging.basicConfig(level=logging.INFO)
+
+MAGIC = b"MTRC"
+VERSION = 1
+
+HEADER = struct.Struct("<4sBHI")  # magic, version, checksum interval, init state crc32
+TAG = struct.Struct("<B")
+ACTION = struct.Struct("<bH")  # action (-1 to 6), hold_freq
+CHECKSUM = struct.Struct("<II")  # action count, WRAM crc32
+
+TAG_ACTION = 0
+TAG_CHECKSUM = 1
+
+WRAM_START = 0xC000
+WRAM_END = 0xE000
+
+
+def state_checksum(pyboy) -> int:
+    return zlib.crc32(bytes(pyboy.memory[WRAM_START:WRAM_END]))
+
+
+def file_checksum(path: str) -> int:
+    with open(path, "rb") as f:
+        return zlib.crc32(f.read())
+
+
+class InputRecorder:
+    """
+    Records every run_action call of a MarioController once attached as its recorder.
+
+    Args:
+        path (str): The trace file to write.
+        init_path (str): The init state the episode starts from, its CRC32 is stored in the header.
+        checksum_interval (int): Number of actions between WRAM checksums. Defaults to 100.
+    """
+
+    def __init__(self, path: str, init_path: str, checksum_interval: int = 100) -> None:
+        self.checksum_interval = checksum_interval
+        self.actions = 0
+
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, checksum_interval, file_checksum(init_path)))
+
+    def record_action(self, action: int, hold_freq: int) -> None:
+        self._file.write(TAG.pack(TAG_ACTION) + ACTION.pack(action, hold_freq))
+
+    def after_action(self, pyboy) -> None:
+        self.actions += 1
+        if self.actions % self.checksum_interval == 0:
+            self._file.write(TAG.pack(TAG_CHECKSUM) + CHECKSUM.pack(self.actions, state_checksum(pyboy)))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_trace(path: str):
+    """
+    Returns (checksum_interval, init_crc, records) where records is a list of (TAG_ACTION, action, hold_freq) and
+    (TAG_CHECKSUM, action count, crc) tuples.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version, checksum_interval, init_crc = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} input trace")
+
+    records = []
+    offset = HEADER.size
+    while offset < len(data):
+        (tag,) = TAG.unpack_from(data, offset)
+        offset += TAG.size
+        if tag == TAG_ACTION:
+            records.append((tag, *ACTION.unpack_from(data, offset)))
+            offset += ACTION.size
+        elif tag == TAG_CHECKSUM:
+            records.append((tag, *CHECKSUM.unpack_from(data, offset)))
+            offset += CHECKSUM.size
+        else:
+            raise ValueError(f"Corrupt trace {path}: unknown record tag {tag} at byte {offset - TAG.size}")
+
+    return checksum_interval, init_crc, records
+
+
+def replay(path: str, init_path: str = None) -> dict[str, any]:
+    """
+    Replays a trace headless at maximum speed and returns the final game_state, checksum results and throughput.
+    """
+    from mario_expert import MarioController
+
+    _, init_crc, records = read_trace(path)
+
+    environment = MarioController(headless=True)
+    environment.set_turbo(True, render_frames=False)
+    if init_path is not None:
+        environment.init_path = init_path
+    if file_checksum(environment.init_path) != init_crc:
+        logging.warning(f"{environment.init_path} is not the init state {path} was recorded from")
+    environment.reset()
+
+    checksums = 0
+    mismatches = []
+    actions = 0
+    frames_start = environment.pyboy.frame_count
+    start = time.perf_counter()
+
+    for record in records:
+        if record[0] == TAG_ACTION:
+            environment.run_action(record[1], record[2])
+            actions += 1
+        else:
+            checksums += 1
+            if state_checksum(environment.pyboy) != record[2]:
+                mismatches.append(record[1])
+
+    elapsed = time.perf_counter() - start
+    frames = environment.pyboy.frame_count - frames_start
+
+    result = {
+        "game_state": environment.game_state(),
+        "actions": actions,
+        "checksums": checksums,
+        "mismatched_checksums": mismatches,
+        "seconds": elapsed,
+        "steps_per_sec": actions / elapsed if elapsed > 0 else 0.0,
+        "emulated_fps": frames / elapsed if elapsed > 0 else 0.0,
+    }
+    environment.pyboy.stop(save=False)
+    return result
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("trace", type=str)
+
+    parse_args.add_argument("--init_state", type=str, default=None)
+
+    return parse_args.parse_args()
+
+
+def main():
+    args = get_args()
+
+    result = replay(args.trace, args.init_state)
+
+    logging.info(f"Final Stats: {json.dumps(result['game_state'])}")
+    logging.info(
+        f"Replayed {result['actions']} actions in {result['seconds']:.2f}s - {result['steps_per_sec']:.1f} steps/sec, "
+        f"{result['emulated_fps']:.0f} frames/sec"
+    )
+    if result["mismatched_checksums"]:
+        logging.error(
+            f"{len(result['mismatched_checksums'])}/{result['checksums']} checksums differ, first after action "
+            f"{result['mismatched_checksums'][0]}"
+        )
+    else:
+        logging.info(f"All {result['checksums']} checksums match")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,24 @@ Your goal is to implement the functions and methods required to enable choose_ac
 Original Mario Manual: https://www.thegameisafootarcade.com/wp-content/uploads/2017/04/Super-Mario-Land-Game-Manual.pdf
 """
 
+import io
 import json
 import logging
 import random
+import time
 
 import cv2
 import numpy as np
 from mario_environment import MarioEnvironment
 from pyboy.utils import WindowEvent
+from capture import VideoCapture
+from decision_cache import scene_key
+from profiling import NULL_PROFILER
+from ram_snapshot import RamSnapshot
+from scene_decoder import SceneDecoder
+from snapshot_cache import SnapshotCache
+from tracing import NULL_TRACER
+from video_encoder import BLOCK, AsyncVideoWriter
 
 
 class MarioController(MarioEnvironment):
@@ -26,13 +36,41 @@ class MarioController(MarioEnvironment):
         act_freq (int): The frequency at which actions are performed. Defaults to 10.
         emulation_speed (int): The speed of the game emulation. Defaults to 0.
         headless (bool): Whether to run the game in headless mode. Defaults to False.
+        turbo (bool): Whether to start in turbo mode, see set_turbo. Defaults to False.
+        snapshot_bytes (int): Memory budget of the in-memory savestate cache. Defaults to 64MB.
     """
 
     def __init__(
         self,
         emulation_speed: int = 1,
         headless: bool = False,
+        turbo: bool = False,
+        snapshot_bytes: int = 64 * 1024 * 1024,
     ) -> None:
+        # Savestates are kept in memory - the base class resets from the cached init state during construction
+        self.snapshots = SnapshotCache(snapshot_bytes)
+        self._init_state = None
+        self._init_state_path = None
+
+        # Game state of the current tick, see ram_snapshot
+        self._ram = None
+
+        # Stage timings, see profiling.py
+        self.profiler = NULL_PROFILER
+
+        # Optional input_trace.InputRecorder that logs every run_action call
+        self.recorder = None
+
+        # Optional frame_ring.FrameRing the native screen is published into after every action
+        self.frame_ring = None
+
+        # Optional world_map.WorldMap of the level, see update_world_map
+        self.world_map = None
+
+        # Automatic checkpoints every checkpoint_interval pixels of x_position, None disables them
+        self.checkpoint_interval = None
+        self._last_milestone = -1
+
         super().__init__(
             emulation_speed=emulation_speed,
             headless=headless,
@@ -60,6 +98,130 @@ class MarioController(MarioEnvironment):
         self.valid_actions = valid_actions
         self.release_button = release_button
 
+        # Turbo mode advances all held frames in one tick call without rendering them.
+        # render_frames controls whether the last frame of an action is rendered for frame consumers (video, policy).
+        self.emulation_speed = emulation_speed
+        self.turbo = False
+        self.render_frames = True
+
+        self._frame_cache = None
+        self._frame_cache_key = None
+        self._resize_buffer = None
+
+        if turbo:
+            self.set_turbo(True)
+
+    def set_turbo(self, enabled: bool, render_frames: bool = True) -> None:
+        """
+        Switches turbo mode on or off. Turbo mode also removes the emulation speed limit.
+
+        Args:
+            enabled (bool): Whether to run actions in turbo mode.
+            render_frames (bool): Whether the last frame of each action is rendered. Disable when nothing grabs frames.
+        """
+        self.turbo = enabled
+        self.render_frames = render_frames
+        self.pyboy.set_emulation_speed(0 if enabled else self.emulation_speed)
+
+    def grab_frame(self, height: int = 240, width: int = 300, out: np.ndarray = None) -> np.ndarray:
+        """
+        Grabs the current screen as a resized BGR frame.
+
+        Without out the frame is only converted once per emulated frame, repeated calls until the next tick return the
+        same array. With out the frame is converted straight into the given (height, width, 3) buffer.
+        """
+        if out is not None:
+            return self._convert_frame(out)
+
+        key = (self.pyboy.frame_count, height, width)
+        if self._frame_cache_key != key:
+            self._frame_cache = super().grab_frame(height, width)
+            self._frame_cache_key = key
+        return self._frame_cache
+
+    def _convert_frame(self, out: np.ndarray) -> np.ndarray:
+        height, width, _ = out.shape
+        if (height, width) == self.screen.ndarray.shape[:2]:
+            # Native resolution, nothing to resize
+            cv2.cvtColor(self.screen.ndarray, cv2.COLOR_RGB2BGR, dst=out)
+            return out
+
+        if self._resize_buffer is None or self._resize_buffer.shape[:2] != (height, width):
+            self._resize_buffer = np.empty((height, width, self.screen.ndarray.shape[2]), dtype=np.uint8)
+
+        cv2.resize(self.screen.ndarray, (width, height), dst=self._resize_buffer)
+        cv2.cvtColor(self._resize_buffer, cv2.COLOR_RGB2BGR, dst=out)
+        return out
+
+    def reset(self) -> None:
+        """
+        Resets to the init state from an in-memory copy, the file is only read again if init_path changes.
+        """
+        if self._init_state is None or self._init_state_path != self.init_path:
+            with open(self.init_path, "rb") as f:
+                self._init_state = io.BytesIO(f.read())
+            self._init_state_path = self.init_path
+
+        self._init_state.seek(0)
+        self.load_state_buffer(self._init_state)
+        self._last_milestone = -1
+
+    def load_state_buffer(self, buffer: io.BytesIO) -> None:
+        buffer.seek(0)
+        self.pyboy.load_state(buffer)
+        # load_state leaves frame_count unchanged, so the per-frame caches (grab_frame, RamSnapshot), keyed by
+        # frame_count, would keep serving the state from before the load unless dropped here
+        self._frame_cache_key = None
+        self._ram = None
+
+    def save_snapshot(self, key) -> io.BytesIO:
+        """
+        Saves the current emulator state into the snapshot cache under key.
+        """
+        buffer = io.BytesIO()
+        self.pyboy.save_state(buffer)
+        self.snapshots.put(key, buffer)
+        return buffer
+
+    def restore_snapshot(self, key) -> None:
+        """
+        Restores a snapshot saved with save_snapshot. Raises KeyError if it is not (or no longer) cached.
+        """
+        self.load_state_buffer(self.snapshots.get(key))
+
+    def checkpoint_milestone(self) -> None:
+        """
+        Saves a ("x", milestone) snapshot the first time Mario passes each multiple of checkpoint_interval.
+        """
+        if self.checkpoint_interval is None:
+            return
+
+        milestone = self.get_x_position() // self.checkpoint_interval * self.checkpoint_interval
+        if milestone > self._last_milestone:
+            self.save_snapshot(("x", milestone))
+            self._last_milestone = milestone
+
+    def restore_checkpoint(self, x_position: int) -> int:
+        """
+        Restores the furthest milestone checkpoint at or before x_position and returns its x position, or -1 (and does
+        nothing) if there is none.
+        """
+        milestones = [key[1] for key in self.snapshots.keys() if key[0] == "x" and key[1] <= x_position]
+        if len(milestones) == 0:
+            return -1
+
+        milestone = max(milestones)
+        self.restore_snapshot(("x", milestone))
+        self._last_milestone = milestone
+        return milestone
+
+    def _after_action(self) -> None:
+        self.checkpoint_milestone()
+        if self.recorder is not None:
+            self.recorder.after_action(self.pyboy)
+        if self.frame_ring is not None:
+            self.frame_ring.publish(self.screen.ndarray)
+
     def run_action(self, action: int, hold_freq = 1) -> None:
         """
         This is a very basic example of how this function could be implemented
@@ -68,6 +230,19 @@ class MarioController(MarioEnvironment):
 
         You can change the action type to whatever you want or need just remember the base control of the game is pushing buttons
         """
+        if self.recorder is not None:
+            self.recorder.record_action(action, hold_freq)
+
+        if self.profiler.enabled:
+            start = time.perf_counter_ns()
+
+        if self.turbo:
+            self._run_action_turbo(action, hold_freq)
+            if self.profiler.enabled:
+                self.profiler.record("tick", start)
+            self._after_action()
+            return
+
         if action == 6:
             self.pyboy.send_input(self.valid_actions[2])
             self.pyboy.send_input(self.valid_actions[4])
@@ -91,9 +266,112 @@ class MarioController(MarioEnvironment):
         # Tick one more time for some reason or otherwise jumping doesnt work
         self.pyboy.tick()
 
+        if self.profiler.enabled:
+            self.profiler.record("tick", start)
+        self._after_action()
+
+    def simulate_action(self, action: int, hold_freq: int) -> None:
+        """
+        Runs an action as fast as possible for lookahead simulations: no rendering and no checkpoints.
+        """
+        render_frames = self.render_frames
+        self.render_frames = False
+        self._run_action_turbo(action, hold_freq)
+        self.render_frames = render_frames
+
+    def _run_action_turbo(self, action: int, hold_freq: int) -> None:
+        """
+        Same button sequence as run_action, but the held frames are emulated in a single call with rendering off.
+        Only the final frame is rendered, and only if something is going to look at it.
+        """
+        buttons = (2, 4) if action == 6 else (action,)
+
+        for button in buttons:
+            self.pyboy.send_input(self.valid_actions[button])
+
+        if hold_freq > 0:
+            self.pyboy.tick(hold_freq, False)
+
+        for button in buttons:
+            self.pyboy.send_input(self.release_button[button])
+
+        self.pyboy.tick(1, self.render_frames)
+
     def release_action(self, action: int) -> None:
         self.pyboy.send_input(self.release_button[action])
 
+    ############################################################################################################
+    # Game state getters served from a RamSnapshot that is read once per tick                                  #
+    ############################################################################################################
+    def ram_snapshot(self) -> RamSnapshot:
+        """
+        Returns the RamSnapshot of the current tick, reading it from memory on first use.
+        """
+        if self._ram is None or self._ram.frame != self.pyboy.frame_count:
+            self._ram = RamSnapshot(self.pyboy)
+        return self._ram
+
+    def game_state(self) -> dict[str, any]:
+        return self.ram_snapshot().game_state()
+
+    def camera_column(self) -> int:
+        """
+        The absolute tile column shown in game area column 0.
+
+        The game area is offset by SCX // 8 tiles and SCX wraps every 256 pixels, the level block counter (16 pixels
+        per block) tells which wrap the camera is on.
+        """
+        ram = self.ram_snapshot()
+        camera = ram.scx + 256 * round((ram.level_block * 16 - ram.scx) / 256)
+        return camera // 8
+
+    def update_world_map(self, game_area) -> None:
+        """
+        Adds game_area, the game area of the current tick, to world_map.
+        """
+        ram = self.ram_snapshot()
+        self.world_map.update(game_area, (ram.world, ram.stage), self.camera_column())
+
+    def get_time(self):
+        return self.ram_snapshot().time
+
+    def get_lives(self):
+        return self.ram_snapshot().lives
+
+    def get_score(self):
+        return self.ram_snapshot().score
+
+    def get_coins(self):
+        return self.ram_snapshot().coins
+
+    def get_stage(self):
+        return self.ram_snapshot().stage
+
+    def get_world(self):
+        return self.ram_snapshot().world
+
+    def get_game_over(self):
+        return self.ram_snapshot().game_over
+
+    def get_mario_pose(self):
+        return self.ram_snapshot().mario_pose
+
+    def get_dead_timer(self):
+        return self.ram_snapshot().dead_timer
+
+    def get_dead_jump_timer(self):
+        return self.ram_snapshot().dead_jump_timer
+
+    def get_x_position(self):
+        return self.ram_snapshot().x_position
+
+    def _read_bit(self, addr: int, bit: int) -> bool:
+        # Same result as the base class (including bit 8 being the padding bit) without string formatting
+        return ((256 + self._read_m(addr)) >> bit) & 1 == 1
+
+    def _bit_count(self, bits: int) -> int:
+        return bits.bit_count()
+
 class MarioExpert:
     """
     The MarioExpert class represents an expert agent for playing the Mario game.
@@ -119,97 +397,142 @@ class MarioExpert:
     
     previous_action = None
 
+    # Mario needs a long jump between these x positions
+    UNDER_GOOMBA_X = (1670, 1680)
+
+    # Enemy tracker timings without a rule file, the rule file's enemy_jump_frames, hold_enemy and hold_step_back
+    # params otherwise: jump (held for ENEMY_JUMP_HOLD) at an enemy closing in on Mario's row this many frames before
+    # contact, step back (held for STEP_BACK_HOLD) from an enemy about to land on him
+    ENEMY_JUMP_FRAMES = 20
+    ENEMY_JUMP_HOLD = 15
+    STEP_BACK_HOLD = 1
+
     def __init__(self, results_path: str, headless=False):
         self.results_path = results_path
         self.environment = MarioController(headless=headless)
         self.video = None
         self.current_state = "DEFAULT"
 
+        # Video frames are encoded on a background thread, see video_encoder.DROP_POLICIES
+        self.video_queue_size = 64
+        self.video_drop_policy = BLOCK
+
+        # What play records, see capture.py
+        self.capture = VideoCapture()
+
         # Initialize class attributes for storing positions and obstacles
         self.mario_row = -1
         self.mario_col = -1
         self.obstacles_np = None
         self.goombas_np = None
         self.jumping_bug_np = None
+        self.gaps_np = None
+
+        # Stage timings shared with the controller, see set_profiler
+        self.profiler = NULL_PROFILER
+
+        # Optional LookaheadPlanner, replaces choose_action when set
+        self.planner = None
+
+        # Structured tracing, see tracing.py. Replaced by a Tracer when tracing is enabled
+        self.tracer = NULL_TRACER
+
+        # Decoded game area, refreshed once per frame by scan_frame
+        self.decoder = SceneDecoder()
+        self.scene = None
+        self.x_position = 0
+
+        # Optional decision_cache.DecisionCache memoising choose_action
+        self.decision_cache = None
+
+        # Optional fsm_rules.RuleEngine, replaces the hand written FSM chain when set
+        self.rules = None
+
+        # Optional telemetry.TelemetryRecorder, records a row per step
+        self.telemetry = None
+
+        # Optional pipeline.DecisionPipeline, decides the next action while the current one runs
+        self.pipeline = None
+
+        # Optional enemy_tracker.EnemyTracker, refines enemy decisions with sprite positions and velocities
+        self.enemy_tracker = None
 
-    def scan_frame(self):
+    def set_profiler(self, profiler) -> None:
+        """
+        Times the agent's and the controller's stages with profiler (a profiling.StageProfiler).
+        """
+        self.profiler = profiler
+        self.environment.profiler = profiler
+
+    def scan_frame(self, game_area=None, x_position=None):
         """
         Updates the Mario position, obstacles, and goombas based on the current game area.
+
+        game_area and x_position default to the emulator's current ones. Passing both decodes an observation taken
+        earlier instead, without touching the emulator (see pipeline.py).
         """
-        game_area = self.environment.game_area()
-        game_area_np = np.array(game_area)
+        if self.profiler.enabled:
+            start = time.perf_counter_ns()
 
-        # Clear obstacle arrays
-        self.obstacles_np = None
-        self.goombas_np = None
-        self.gaps_np = None
+        observed = game_area is not None
+        if not observed:
+            game_area = self.environment.game_area()
+            x_position = self.environment.get_x_position()
+
+        if self.profiler.enabled:
+            self.profiler.record("game_area", start)
+            start = time.perf_counter_ns()
+
+        self.scene = self.decoder.decode(game_area)
+        self.x_position = x_position
 
-        print(game_area)
+        world_map = self.environment.world_map
+        if world_map is not None:
+            if not observed:
+                self.environment.update_world_map(game_area)
+            # Lookahead from the map's column indexes, the pipeline added the observation to the map when taking it
+            self.scene.world_map = world_map
+
+        if self.enemy_tracker is not None:
+            if not observed:
+                self.enemy_tracker.update(self.environment.pyboy)
+            self.enemy_tracker.predict_landing(self.scene)
+
+        if self.tracer.grid:
+            self.tracer.emit("grid", shape=self.scene.grid.shape, tiles=self.scene.grid.astype(np.uint8).tobytes().hex())
 
         # Update Mario's position
-        mario_positions = np.where(game_area_np == 1)
-        if mario_positions[0].size > 0:
-            self.mario_row = mario_positions[0][0] + 1
-            self.mario_col = mario_positions[1][0] + 1
-            print(f"Mario at Row: {self.mario_row}, Col: {self.mario_col}")
-
-        # Update obstacles (10 or 14)
-        obstacle_positions_10 = np.where(game_area_np == 10)
-        obstacle_positions_14 = np.where(game_area_np == 14)
-        self.obstacles_np = np.column_stack((
-            np.concatenate((obstacle_positions_10[0], obstacle_positions_14[0])),
-            np.concatenate((obstacle_positions_10[1], obstacle_positions_14[1]))
-        ))
-
-        # Update gaps (0) that are below and in front of Mario
-        gap_positions = np.where(game_area_np == 0)
-        self.gaps_np = np.column_stack((gap_positions[0], gap_positions[1]))
-        # Filter gaps to only include those below or in front of Mario
-        self.gaps_np = self.gaps_np[(self.gaps_np[:, 0] > self.mario_row) & 
-                                    (self.gaps_np[:, 1] > self.mario_col)]
-
-        # Update goombas (15) and koopas (16)
-        goomba_positions = np.where(game_area_np == 15)
-        koopa_positions = np.where(game_area_np == 16)
-        # Combine Goomba and Koopa positions
-        combined_positions = np.column_stack((
-            np.concatenate((goomba_positions[0], koopa_positions[0])),
-            np.concatenate((goomba_positions[1], koopa_positions[1]))
-        ))
-        # Save combined positions as goombas_np
-        self.goombas_np = combined_positions
-
-        # Update jumping bug (18) array
-        jumping_bug_positions = np.where(game_area_np == 18)
-        self.jumping_bug_np = np.column_stack(jumping_bug_positions)
+        self.mario_row = self.scene.mario_row
+        self.mario_col = self.scene.mario_col
+
+        # Obstacles (10 or 14), gaps (0) below and in front of Mario, goombas (15) and koopas (16), jumping bugs (18)
+        self.obstacles_np = self.scene.obstacles
+        self.gaps_np = self.scene.gaps
+        self.goombas_np = self.scene.enemies
+        self.jumping_bug_np = self.scene.jumping_bugs
+
+        if self.profiler.enabled:
+            self.profiler.record("scan_frame", start)
 
 
     def fsm_transition(self):
+        scene = self.scene
+
         # Edge case
-        print(self.environment.get_x_position())
-        if self.environment.get_x_position() > 1670 and self.environment.get_x_position() < 1680:
+        x_position = self.x_position
+        if x_position > self.UNDER_GOOMBA_X[0] and x_position < self.UNDER_GOOMBA_X[1]:
             return "UNDER + GOOMBA"
 
         # Check for obstacles in front of Mario
-        # if np.any((self.obstacles_np[:, 0] == self.mario_row) & 
-        #         (self.obstacles_np[:, 1] == self.mario_col + 1)) or \
-        # np.any((self.obstacles_np[:, 0] == self.mario_row - 1) & 
-        #         (self.obstacles_np[:, 1] == self.mario_col + 1)):
-        #     return "OBSTACLE"
-        
-        if np.any((self.obstacles_np[:, 0] == self.mario_row ) & 
-                (self.obstacles_np[:, 1] == self.mario_col + 1)): 
+        if scene.is_solid(self.mario_row, self.mario_col + 1):
             return "OBSTACLE"
         
         # Only check if mario is within the game board (aka not dead)
         if self.mario_row < 16:
             # Check if Mario is currently on top of a block (either 10 or 14)
-            block_below_mario = self.environment.game_area()[self.mario_row + 1][self.mario_col]
-            if block_below_mario in [10, 14]:
-                # Check for a gap directly below and 1 block in front of Mario using gaps_np
-                gap_below_and_front = (self.gaps_np[:, 0] == self.mario_row + 1) & \
-                                    (self.gaps_np[:, 1] == self.mario_col + 1)
-                if np.any(gap_below_and_front):
+            if scene.is_solid(self.mario_row + 1, self.mario_col):
+                # Check for a gap directly below and 1 block in front of Mario
+                if scene.gap_ahead():
                     return "GAP"
                 
         # Check if the jumping bug is there
@@ -225,7 +548,6 @@ class MarioExpert:
         # Check whether enemies are above or below mario
         elif self.current_state == "ENEMIES" or "GOOMBA ABOVE":
             for goomba_row, goomba_col in self.goombas_np:
-                print(f"Goomba at Row: {goomba_row}, Col: {goomba_col}")
                 if goomba_row < self.mario_row - 1:
                     return "GOOMBA ABOVE"
                 elif goomba_row > self.mario_row:
@@ -233,52 +555,111 @@ class MarioExpert:
             return "ENEMIES"
         
         return "DEFAULT"
+
+    def decision_key(self):
+        """
+        Returns the decision cache key of the current frame, or None if the decision depends on the x position.
+        """
+        # Tracked enemy motion is not part of the key
+        if self.enemy_tracker is not None and self.enemy_tracker.count:
+            return None
+
+        x_position = self.x_position
+        if self.rules is not None:
+            if self.rules.x_dependent(x_position):
+                return None
+        elif x_position > self.UNDER_GOOMBA_X[0] and x_position < self.UNDER_GOOMBA_X[1]:
+            return None
+        return scene_key(self.current_state, self.scene)
             
     def choose_action(self, action = 2):
         # Update the game state with the latest information
         self.scan_frame()
         state = self.environment.game_state()
-        frame = self.environment.grab_frame()
 
+        return self._transition(action)
+
+    def choose_action_from(self, game_area, x_position, action = 2):
+        """
+        choose_action for an observation taken earlier, safe to call while the emulator runs on another thread.
+        """
+        self.scan_frame(game_area, x_position)
+        return self._transition(action)
+
+    def _transition(self, action):
+        # Rule files can be edited while the game runs, cached decisions of the old rules are dropped
+        if self.rules is not None and self.rules.poll() and self.decision_cache is not None:
+            self.decision_cache.clear()
+
+        previous_state = self.current_state
+        if self.decision_cache is not None:
+            decision = self.decision_cache.lookup(self.decision_key(), lambda: self.decide(action))
+        else:
+            decision = self.decide(action)
+        self.current_state, action, hold_freq = decision
+
+        if self.tracer.fsm > 1 or (self.tracer.fsm and self.current_state != previous_state):
+            self.tracer.emit(
+                "fsm",
+                previous=previous_state,
+                state=self.current_state,
+                x_position=self.x_position,
+                mario=[int(self.mario_row), int(self.mario_col)],
+                mario_found=self.scene.mario_found,
+                enemies=self.goombas_np.tolist(),
+            )
+
+        return action, hold_freq
+
+    def decide(self, action = 2):
+        """
+        Returns the (state, action, hold_freq) decision for the scanned frame without changing the current state.
+        """
         # FSM Transition
-        self.current_state = self.fsm_transition()
-        print(self.current_state)
+        if self.profiler.enabled:
+            start = time.perf_counter_ns()
+
+        if self.rules is not None:
+            decision = self.rules.decide(self.scene, self.x_position, self.current_state)
+            if self.profiler.enabled:
+                self.profiler.record("fsm_rules", start)
+            if self.enemy_tracker is not None:
+                return self.track_enemies(*decision)
+            return decision
+
+        current_state = self.fsm_transition()
+
+        if self.profiler.enabled:
+            self.profiler.record("fsm_transition", start)
 
         # Default hold freq
         hold_freq = 10
 
         # Evaluates what action to do
         # Default jumping actions
-        if self.current_state == "UNDER + GOOMBA":
+        if current_state == "UNDER + GOOMBA":
             action = 6
             hold_freq = 100
 
-        if self.current_state == "OBSTACLE":
+        if current_state == "OBSTACLE":
             hold_freq = 15
             action = 4
         
-        if self.current_state == "GAP":
+        if current_state == "GAP":
             hold_freq = 30
             action = 6
 
-        if self.current_state == "ENEMIES":
+        if current_state == "ENEMIES":
             for goomba_row, goomba_col in self.goombas_np:
                 if goomba_col - self.mario_col < 3 and goomba_col >= self.mario_col:
                     hold_freq = 15 # for some reason need this or "GAP" doesnt work
                     action = 4  
 
         # If a goomba is above mario
-        elif self.current_state == "GOOMBA ABOVE":
+        elif current_state == "GOOMBA ABOVE":
         # Move forward until 4 blocks from a wall if Goomba is above
-            wall_in_front = False
-            for obstacle_row, obstacle_col in self.obstacles_np:
-                if obstacle_row == self.mario_row and (obstacle_col - self.mario_col) <= 6:
-                    wall_in_front = True
-                    print("the wall is in front")
-                    break
-            
-            if wall_in_front:
-                print("Pausing, waiting for Goomba to drop")
+            if self.scene.wall_ahead(6):
+                # Pausing, waiting for Goomba to drop
                 action = -1  # Pause action
                 #self.current_state = "ENEMIES"  # Change state back to ENEMIES
             else:
@@ -287,32 +668,51 @@ class MarioExpert:
                 hold_freq = 1
         
         # If a goomba is below
-        elif self.current_state == "GOOMBA BELOW":
+        elif current_state == "GOOMBA BELOW":
             for goomba_row, goomba_col in self.goombas_np:
                 hold_freq = 1
                 #if goomba is on the right
                 if goomba_col > self.mario_col:
-                    print("moving right")
                     action = 2
                 # If the goomba is to the left of mario, move left so mario lands on it unless the goomba is too far
                 elif goomba_col - 1 < self.mario_col and self.mario_col - goomba_col < 2 :
-                    print("moving left")
                     action = 1
                 else:
-                    print("stomping")
+                    # Stomping
                     action = -1
 
         # Jumping bug stuff
-        elif self.current_state == "JUMPING BUG":
+        elif current_state == "JUMPING BUG":
             for bug_row, bug_col in self.jumping_bug_np:
                 if bug_col - self.mario_col < 3 and bug_col >= self.mario_col:
                     hold_freq = 15 # for some reason need this or "GAP" doesnt work
                     action = 4  
                 
 
-        print(action)
         # action = -1 #uncomment for manual mode
-        return action, hold_freq
+        if self.enemy_tracker is not None:
+            return self.track_enemies(current_state, action, hold_freq)
+        return current_state, action, hold_freq
+
+    def track_enemies(self, state, action, hold_freq):
+        """
+        Adjusts a (state, action, hold_freq) decision with the enemy tracker's motion estimates.
+        """
+        tracker = self.enemy_tracker
+        # Sweeps and practice variants tune these through the rule file
+        params = self.rules.table.params if self.rules is not None else {}
+
+        # Step back from an enemy predicted to land on Mario rather than waiting under it
+        if state == "GOOMBA ABOVE" and tracker.landing_near(self.mario_col):
+            return state, 1, params.get("hold_step_back", self.STEP_BACK_HOLD)
+
+        # Jump at an enemy walking into Mario before the grid shows it within reach
+        if state in ("DEFAULT", "ENEMIES") and action == 2:
+            contact = tracker.frames_to_contact(self.mario_row, self.mario_col)
+            if contact is not None and contact <= params.get("enemy_jump_frames", self.ENEMY_JUMP_FRAMES):
+                return state, 4, params.get("hold_enemy", self.ENEMY_JUMP_HOLD)
+
+        return state, action, hold_freq
 
 
     def step(self):
@@ -322,44 +722,87 @@ class MarioExpert:
         This is just a very basic example
         """
 
+        self.tracer.next_step()
+        if self.tracer.timing:
+            start = time.perf_counter()
+        if self.profiler.enabled:
+            step_start = time.perf_counter_ns()
+        if self.telemetry is not None:
+            telemetry_start = time.perf_counter_ns()
+
         # Choose an action - button press or other...
-        action, hold_freq = self.choose_action()
+        if self.planner is not None:
+            action, hold_freq = self.planner.plan()
+        elif self.pipeline is not None:
+            action, hold_freq = self.pipeline.take()
+        else:
+            action, hold_freq = self.choose_action()
+
+        # The pipeline moves current_state on to the next decision while the action runs
+        state = self.current_state
+
+        if self.tracer.action:
+            self.tracer.emit("action", action=action, hold_freq=hold_freq, state=state)
+        if self.tracer.timing:
+            decided = time.perf_counter()
+
+        if self.pipeline is not None and self.planner is None:
+            self.pipeline.submit()
 
         # Run the action on the environment
         self.environment.run_action(action, hold_freq)
         self.previous_action = action
 
+        if self.telemetry is not None:
+            self.telemetry.record(self, state, action, hold_freq, time.perf_counter_ns() - telemetry_start)
+
+        if self.tracer.timing:
+            self.tracer.emit("timing", decide=decided - start, emulate=time.perf_counter() - decided)
+        if self.profiler.enabled:
+            self.profiler.record("step", step_start)
+
     def play(self):
         """
         Do NOT edit this method.
         """
         self.environment.reset()
 
-        frame = self.environment.grab_frame()
-        height, width, _ = frame.shape
+        capture = self.capture
+        capture.start(self)
 
-        self.start_video(f"{self.results_path}/mario_expert.mp4", width, height)
+        profiler = self.profiler
+        profiler.begin_episode(self.environment.pyboy.frame_count)
 
         while not self.environment.get_game_over():
-            frame = self.environment.grab_frame()
-            self.video.write(frame)
-
+            capture.capture(self)
             self.step()
 
+        profiler.end_episode(self.environment.pyboy.frame_count)
+
         final_stats = self.environment.game_state()
         logging.info(f"Final Stats: {final_stats}")
 
         with open(f"{self.results_path}/results.json", "w", encoding="utf-8") as file:
             json.dump(final_stats, file)
 
-        self.stop_video()
+        self.tracer.close()
+
+        capture.finish(self)
+        # After the encoder has drained so every video_encode timing is included
+        profiler.write_report(self.results_path)
 
     def start_video(self, video_name, width, height, fps=30):
         """
         Do NOT edit this method.
         """
-        self.video = cv2.VideoWriter(
-            video_name, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+        self.video = AsyncVideoWriter(
+            video_name,
+            width,
+            height,
+            fps=fps,
+            queue_size=self.video_queue_size,
+            policy=self.video_drop_policy,
+            profiler=self.profiler if self.profiler.enabled else None,
         )
 
     def stop_video(self) -> None:
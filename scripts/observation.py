@@ -0,0 +1,162 @@
+"""
+Batched observation preprocessing for learned controllers.
+
+ObservationPipeline turns the raw screens and game area grids of N environments (a VectorMarioEnv, or a single
+MarioController as a batch of one) into:
+
+    frames  (N, stack, H, W)    the last `stack` screens, oldest first, grayscale (or (N, stack, H, W, 3) RGB),
+                                downsampled by an integer factor and scaled to [0, 1]
+    grid    (N, classes, 16, 20) the game area one-hot encoded over the tile IDs of rules.txt
+
+Every array is allocated once. The screens of the whole batch are processed as one tall image: one area resize (the
+environments' rows never share a block, so this equals resizing each screen), one colour conversion and one scaling
+into the slot of a circular frame buffer. Tile IDs are mapped to classes through a lookup table and one-hot encoded
+with a single broadcast comparison into the output buffer.
+
+    env = VectorMarioEnv(8, frames=True)
+    pipeline = ObservationPipeline(8, stack=4, downsample=2)
+    observations, infos = env.reset()
+    frames, grid = pipeline.reset(env.frames, env.grids)
+    observations, rewards, terminated, truncated, infos = env.step(actions)
+    frames, grid = pipeline.step(env.frames, env.grids, terminated)
+
+The returned arrays are overwritten by the next step/reset, copy them to keep them.
+"""
+
+import cv2
+import numpy as np
+
+# Tile IDs from rules.txt, one class each. Every other ID is encoded as air
+TILE_CLASSES = [0, 1, 5, 6, 10, 11, 12, 13, 14, 15, 16, 18]
+
+# Large enough for the raw (uncompressed) pyboy tile identifiers as well
+CLASS_LUT = np.zeros(512, dtype=np.uint8)
+for _class, _tile in enumerate(TILE_CLASSES):
+    CLASS_LUT[_tile] = _class
+
+GRID_SHAPE = (16, 20)
+
+
+class ObservationPipeline:
+    """
+    Stacked, downsampled frames and one-hot grids for a batch of environments.
+
+    Args:
+        num_envs (int): The batch size.
+        stack (int): The number of stacked frames. Defaults to 4.
+        downsample (int): The integer factor the 144x160 screen is shrunk by. Defaults to 2.
+        grayscale (bool): Whether frames are converted to grayscale. Defaults to True.
+        screen_shape (tuple): The (height, width, channels) of the input screens, 3 channels for VectorMarioEnv
+            frames, 4 for screen.ndarray. Defaults to (144, 160, 3).
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        stack: int = 4,
+        downsample: int = 2,
+        grayscale: bool = True,
+        screen_shape: tuple = (144, 160, 3),
+    ) -> None:
+        height, width, channels = screen_shape
+        if height % downsample or width % downsample:
+            raise ValueError(f"The {height}x{width} screen is not divisible by the downsample factor {downsample}")
+
+        self.num_envs = num_envs
+        self.stack = stack
+        self.downsample = downsample
+        self.grayscale = grayscale
+        self.screen_shape = tuple(screen_shape)
+
+        self.frame_shape = (height // downsample, width // downsample) + (() if grayscale else (3,))
+
+        # The batch is converted as a single (num_envs * height, width) image
+        self._conversion = None
+        if grayscale:
+            self._conversion = cv2.COLOR_RGBA2GRAY if channels == 4 else cv2.COLOR_RGB2GRAY
+        elif channels == 4:
+            self._conversion = cv2.COLOR_RGBA2RGB
+        self._tall_shape = (num_envs * height, width, channels)
+        self._tall_size = (width // downsample, num_envs * height // downsample)
+        self._resized = np.zeros((num_envs * height // downsample, width // downsample, channels), dtype=np.uint8)
+        self._converted = np.zeros((num_envs, *self.frame_shape), dtype=np.uint8)
+        self._converted_tall = self._converted.reshape(num_envs * height // downsample, *self.frame_shape[1:])
+
+        # Circular frame buffer of (stack, num_envs, ...) so the slot of a step is contiguous, slot head is the newest
+        self._ring = np.zeros((stack, num_envs, *self.frame_shape), dtype=np.float32)
+        self._head = 0
+
+        self._grid = np.zeros((num_envs, *GRID_SHAPE), dtype=np.intp)
+        self._classes = np.zeros((num_envs, *GRID_SHAPE), dtype=np.uint8)
+        self._one_hot = np.zeros((num_envs, len(TILE_CLASSES), *GRID_SHAPE), dtype=bool)
+        self._class_ids = np.arange(len(TILE_CLASSES), dtype=np.uint8).reshape(1, -1, 1, 1)
+
+        self.frames = np.zeros((num_envs, stack, *self.frame_shape), dtype=np.float32)
+        self.grid = np.zeros((num_envs, len(TILE_CLASSES), *GRID_SHAPE), dtype=np.float32)
+
+    def _process_frames(self, screens: np.ndarray) -> None:
+        # Averaging and the colour conversion are both linear, resizing first leaves fewer pixels to convert
+        cv2.resize(screens.reshape(self._tall_shape), self._tall_size, dst=self._resized, interpolation=cv2.INTER_AREA)
+        if self._conversion is not None:
+            cv2.cvtColor(self._resized, self._conversion, dst=self._converted_tall)
+        else:
+            np.copyto(self._converted_tall, self._resized)
+
+        # Cast then scale in place, a mixed type multiply would allocate cast buffers
+        slot = self._ring[self._head]
+        np.copyto(slot, self._converted, casting="unsafe")
+        np.multiply(slot, np.float32(1 / 255), out=slot)
+
+    def _process_grids(self, grids: np.ndarray) -> None:
+        np.copyto(self._grid, grids, casting="unsafe")
+        np.take(CLASS_LUT, self._grid, out=self._classes, mode="clip")
+        np.equal(self._classes[:, None], self._class_ids, out=self._one_hot)
+        np.copyto(self.grid, self._one_hot, casting="unsafe")
+
+    def _stack(self) -> None:
+        for i in range(self.stack):
+            np.copyto(self.frames[:, i], self._ring[(self._head + 1 + i) % self.stack])
+
+    def reset(self, screens: np.ndarray, grids: np.ndarray):
+        """
+        Starts every environment's stack over, filled with the given screens. Returns (frames, grid).
+        """
+        self._head = 0
+        self._process_frames(screens)
+        self._ring[1:] = self._ring[0]
+        self._process_grids(grids)
+        self._stack()
+        return self.frames, self.grid
+
+    def step(self, screens: np.ndarray, grids: np.ndarray, reset=None):
+        """
+        Pushes the screens of a step. Environments flagged in reset (e.g. VectorMarioEnv's terminated, which already
+        show the first observation of their next episode) have their stack filled with the new screen. Returns
+        (frames, grid).
+        """
+        self._head = (self._head + 1) % self.stack
+        self._process_frames(screens)
+        if reset is not None:
+            for index in np.flatnonzero(reset):
+                self._ring[:, index] = self._ring[self._head, index]
+        self._process_grids(grids)
+        self._stack()
+        return self.frames, self.grid
+
+
+def naive_observation(history: list, screen: np.ndarray, grid, stack: int, downsample: int) -> tuple:
+    """
+    The per-frame reference ObservationPipeline is benchmarked and checked against: copy, convert, resize, scale and
+    stack one grayscale screen, one-hot encode one grid. history is the list of previous frames, updated in place.
+    """
+    frame = np.array(screen)
+    gray = cv2.cvtColor(frame[:, :, :3], cv2.COLOR_RGB2GRAY).astype(np.float32)
+    small = cv2.resize(gray, (frame.shape[1] // downsample, frame.shape[0] // downsample), interpolation=cv2.INTER_AREA)
+    history.append(small / 255.0)
+    while len(history) < stack:
+        history.insert(0, history[0])
+    del history[:-stack]
+
+    classes = CLASS_LUT[np.array(grid)]
+    one_hot = np.eye(len(TILE_CLASSES), dtype=np.float32)[classes].transpose(2, 0, 1)
+    return np.stack(history), one_hot
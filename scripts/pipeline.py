@@ -0,0 +1,126 @@
+"""
+Pipelined decision making for MarioExpert.step.
+
+In the synchronous loop the agent decides, then the emulator runs the action's held frames, then the agent decides
+again. With a DecisionPipeline attached as expert.pipeline the next decision is computed on a background thread, from
+the game area observed just before the current action starts, while the emulator runs that action:
+
+    step k:  take the decision made during step k-1 | observe | submit decision k+1 | run action k
+                                                                  \\___ decided on the pipeline thread ___/
+
+A precomputed decision is max_staleness frames old at most: when its observation is older than that by the time it
+is needed (long held actions such as a 30 frame jump), it is dropped and the step decides synchronously from the
+current frame instead. The default max_staleness of 10 is below the 11 frames between observations at the default
+hold of 10, so by default only decisions after short actions (such as a one frame step back) are pipelined and the
+agent plays as it does synchronously. Raising it to 11 or more lets default-hold decisions through as well, made from
+the observation taken before the previous action ran: that is faster but changes how the agent plays, the decisions
+lag a full action behind the game.
+
+The emulator is only ever touched by the main thread, the pipeline thread only decodes the observation it was handed
+(MarioExpert.choose_action_from). The pipeline thread's tracer records and profiler timings are deferred and replayed
+on the main thread when the decision is taken, so they are tagged with the step that runs the decision.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DecisionPipeline:
+    """
+    Overlaps the next decision of an expert with the emulation of its current action.
+
+    Args:
+        expert (MarioExpert): The expert to decide for.
+        max_staleness (int): The oldest observation, in frames, a precomputed decision may come from. Defaults to 10.
+    """
+
+    def __init__(self, expert, max_staleness: int = 10) -> None:
+        self.expert = expert
+        self.max_staleness = max_staleness
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decision-pipeline")
+        self._pending = None
+        self._pending_frame = 0
+        self._pending_state = None
+
+        self.pipelined = 0
+        self.synchronous = 0
+        self.stale = 0
+        self.staleness_frames = 0
+        self.wait_ns = 0
+
+    def take(self):
+        """
+        Returns the (action, hold_freq) to run now: the precomputed decision if it is fresh enough, otherwise one made
+        synchronously from the current frame.
+        """
+        start = time.perf_counter_ns()
+        expert = self.expert
+
+        if self._pending is not None:
+            decision, records, timings = self._pending.result()
+            self._pending = None
+            expert.tracer.replay(records)
+            expert.profiler.replay(timings)
+
+            staleness = expert.environment.pyboy.frame_count - self._pending_frame
+            if staleness <= self.max_staleness:
+                self.pipelined += 1
+                self.staleness_frames += staleness
+                self.wait_ns += time.perf_counter_ns() - start
+                return decision
+
+            # Decide again from the FSM state the dropped decision started from
+            self.stale += 1
+            expert.current_state = self._pending_state
+
+        decision = expert.choose_action()
+        self.synchronous += 1
+        self.wait_ns += time.perf_counter_ns() - start
+        return decision
+
+    def submit(self) -> None:
+        """
+        Observes the current frame and starts deciding the next action from it in the background. Call right before
+        running the action returned by take.
+        """
+        environment = self.expert.environment
+        game_area = environment.game_area()
+        x_position = environment.get_x_position()
+        if environment.world_map is not None:
+            environment.update_world_map(game_area)
+        if self.expert.enemy_tracker is not None:
+            self.expert.enemy_tracker.update(environment.pyboy)
+
+        self._pending_frame = environment.pyboy.frame_count
+        self._pending_state = self.expert.current_state
+        self._pending = self._executor.submit(self._decide, game_area, x_position)
+
+    def _decide(self, game_area, x_position) -> tuple:
+        # Runs on the pipeline thread, the tracer and profiler are only written to from the main thread
+        expert = self.expert
+        expert.tracer.defer()
+        expert.profiler.defer()
+        try:
+            decision = expert.choose_action_from(game_area, x_position)
+        finally:
+            records = expert.tracer.collect()
+            timings = expert.profiler.collect()
+        return decision, records, timings
+
+    def stats(self) -> dict[str, any]:
+        decisions = self.pipelined + self.synchronous
+        return {
+            "decisions": decisions,
+            "pipelined": self.pipelined,
+            "synchronous": self.synchronous,
+            "stale": self.stale,
+            "mean_staleness_frames": self.staleness_frames / self.pipelined if self.pipelined else 0.0,
+            "mean_decision_us": self.wait_ns / decisions / 1e3 if decisions else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+        self._executor.shutdown()
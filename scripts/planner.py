@@ -0,0 +1,222 @@
+"""
+Lookahead search over short action sequences using emulator savestates.
+
+From the current state the planner simulates (action, hold_freq) macro actions from the expert's 0-6 action set,
+scores the outcomes by x progress, score and death, and returns the first macro action of the best sequence found
+within a per-step time budget. The search tree is kept between steps: after the chosen macro action is executed the
+matching child becomes the new root, so its already simulated subtree does not have to be simulated again.
+"""
+
+import io
+import time
+from collections import deque
+
+# RAM used to identify duplicate emulator states (WRAM)
+STATE_HASH_START = 0xC000
+STATE_HASH_END = 0xE000
+
+
+class _Node:
+    __slots__ = (
+        "state",
+        "state_hash",
+        "action",
+        "hold_freq",
+        "parent",
+        "depth",
+        "x_position",
+        "lives",
+        "score",
+        "value",
+        "dead",
+        "children",
+        "untried",
+    )
+
+    def __init__(self, state, state_hash, action, hold_freq, parent, depth, observation, value, dead):
+        self.state = state
+        self.state_hash = state_hash
+        self.action = action
+        self.hold_freq = hold_freq
+        self.parent = parent
+        self.depth = depth
+        self.x_position, self.lives, self.score = observation
+        self.value = value
+        self.dead = dead
+        self.children = []
+        self.untried = None
+
+
+class LookaheadPlanner:
+    """
+    Chooses actions by simulating macro actions ahead of the real emulator.
+
+    Args:
+        environment (MarioController): The controller to plan with. Its state is restored after every search.
+        actions (list[int]): The actions to consider. Defaults to 0-6.
+        hold_freqs (list[int]): The hold_freq variants to try for every action. Defaults to 1, 10, 15 and 30.
+        max_depth (int): The maximum number of macro actions in a sequence. Defaults to 3.
+        time_budget (float): Seconds of search per step. Defaults to 0.05.
+        death_penalty (float): Value subtracted from a sequence that loses a life. Defaults to 1000.
+        score_weight (float): Value of one point of score relative to one pixel of x progress. Defaults to 0.01.
+        memo_size (int): Maximum number of (x_position, RAM hash) entries kept for duplicate detection.
+    """
+
+    def __init__(
+        self,
+        environment,
+        actions=(0, 1, 2, 3, 4, 5, 6),
+        hold_freqs=(1, 10, 15, 30),
+        max_depth: int = 3,
+        time_budget: float = 0.05,
+        death_penalty: float = 1000.0,
+        score_weight: float = 0.01,
+        memo_size: int = 100000,
+    ) -> None:
+        self.environment = environment
+        self.macros = [(action, hold_freq) for action in actions for hold_freq in hold_freqs]
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.death_penalty = death_penalty
+        self.score_weight = score_weight
+        self.memo_size = memo_size
+
+        self.root = None
+        self._memo = set()
+
+        self.simulations = 0
+        self.duplicates = 0
+        self.reused = 0
+
+    def reset(self) -> None:
+        self.root = None
+        self._memo.clear()
+
+    def plan(self):
+        """
+        Returns the (action, hold_freq) to execute next.
+        """
+        deadline = time.perf_counter() + self.time_budget
+
+        root = self._current_root()
+        frontier = deque(self._expandable(root))
+
+        while frontier and time.perf_counter() < deadline:
+            node = frontier[0]
+            child = self._expand_one(node)
+            if child is not None and child.depth < self.max_depth and not child.dead:
+                frontier.append(child)
+            if not node.untried:
+                frontier.popleft()
+
+        self.environment.load_state_buffer(root.state)
+
+        best = self._best_child(root)
+        self.root = best
+        if best is None:
+            # Nothing simulated in time, keep running right
+            return 2, 10
+        return best.action, best.hold_freq
+
+    def _current_root(self) -> _Node:
+        """
+        Reuses the subtree of the previously chosen macro action if the emulator is in the state it predicted.
+        """
+        state, state_hash, observation = self._capture()
+
+        if self.root is not None and (self.root.x_position, self.root.state_hash) == (observation[0], state_hash):
+            self.reused += 1
+            root = self.root
+            root.parent = None
+            self._rebase(root, root.depth)
+            return root
+
+        # A fresh tree, states remembered from the old one must not prune it
+        self._memo.clear()
+        self._memo.add((observation[0], state_hash))
+
+        return _Node(state, state_hash, None, None, None, 0, observation, 0.0, False)
+
+    def _rebase(self, node, depth) -> None:
+        node.depth -= depth
+        for child in node.children:
+            self._rebase(child, depth)
+
+    def _expandable(self, root):
+        # Breadth first over the nodes of a (possibly reused) tree that still have untried macro actions
+        nodes = []
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            if node.dead or node.depth >= self.max_depth:
+                continue
+            if node.untried is None or node.untried:
+                nodes.append(node)
+            queue.extend(node.children)
+        return nodes
+
+    def _expand_one(self, node):
+        if node.untried is None:
+            node.untried = list(self.macros)
+
+        action, hold_freq = node.untried.pop(0)
+
+        self.environment.load_state_buffer(node.state)
+        self.environment.simulate_action(action, hold_freq)
+        self.simulations += 1
+
+        state, state_hash, observation = self._capture()
+        x_position, lives, score = observation
+
+        key = (x_position, state_hash)
+        if key in self._memo:
+            self.duplicates += 1
+            return None
+        if len(self._memo) < self.memo_size:
+            self._memo.add(key)
+
+        dead = (
+            self.environment.get_game_over()
+            or self.environment.get_dead_timer() != 0
+            or lives < node.lives
+        )
+
+        value = node.value + (x_position - node.x_position)
+        value += self.score_weight * (score - node.score)
+        if dead:
+            value -= self.death_penalty
+
+        child = _Node(state, state_hash, action, hold_freq, node, node.depth + 1, observation, value, dead)
+        node.children.append(child)
+        return child
+
+    def _capture(self):
+        """
+        Returns the savestate, RAM hash and (x_position, lives, score) of the current emulator state.
+
+        Only valid right after a tick - the score comes from the game wrapper, which is not updated by load_state.
+        """
+        state = io.BytesIO()
+        self.environment.pyboy.save_state(state)
+        memory = self.environment.pyboy.memory[STATE_HASH_START:STATE_HASH_END]
+        observation = (self.environment.get_x_position(), self.environment.get_lives(), self.environment.get_score())
+        return state, hash(bytes(memory)), observation
+
+    def _best_child(self, root):
+        """
+        Returns the child of root on the path to the highest value node.
+        """
+        best_child = None
+        best_value = None
+        for child in root.children:
+            value = self._best_value(child)
+            if best_value is None or value > best_value:
+                best_child = child
+                best_value = value
+        return best_child
+
+    def _best_value(self, node):
+        best = node.value
+        for child in node.children:
+            best = max(best, self._best_value(child))
+        return best
@@ -0,0 +1,324 @@
+"""
+Practice mode: replay the hard sections of a stage instead of the whole stage.
+
+The stage is split into section_width pixel wide sections of x position. When Mario enters a section for the first time
+the emulator state is saved into the snapshot cache, and the snapshot becomes the rewind point once Mario has survived
+safe_steps more steps (so a state already doomed, e.g. mid-air over a pit, is never rewound to). When Mario dies
+(get_dead_timer becomes non-zero, or get_lives drops) the latest safe snapshot is restored immediately and the section
+is retried with the next parameter variant of fsm_rules.json. After max_attempts failed attempts a section is given up
+and Mario's death plays out as it would in a normal game.
+
+Every attempt is recorded per section, with the variant used and whether it reached the next section. A rewind saves
+the frames a normal game would have spent replaying the stage up to the snapshot, counted from the stage's first frame
+(Super Mario Land restarts a stage from its beginning after a death), or from the first frame of the practice run when
+it starts mid-stage.
+
+    python3 practice.py --stage 1-1@1536 --variants 4
+    python3 practice.py --variants_file ../results/sweep/best.json
+"""
+
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+
+from fsm_rules import DEFAULT_RULES_PATH, RuleEngine
+from state_library import DEFAULT_LIBRARY_PATH, StateLibrary, parse_stage
+from sweep import DEFAULT_SPACE, TRACKER_SPACE, random_configs
+
+logging.basicConfig(level=logging.INFO)
+
+PENDING = ("practice", "pending")
+SAFE = ("practice", "safe")
+
+
+class Practice:
+    """
+    Plays an expert in practice mode.
+
+    Args:
+        expert (MarioExpert): The expert to practice with, its rules are replaced by the variants.
+        variants (list[dict]): fsm_rules.json params overrides, tried in order. The first is used on every first
+            attempt. Defaults to [{}], the file's own params.
+        section_width (int): The width of a section in pixels of x position. Defaults to 256.
+        safe_steps (int): The steps Mario has to survive before a section snapshot can be rewound to. Defaults to 3.
+        max_attempts (int): The attempts per section before it is given up. Defaults to 5.
+        rules_path (str): The rule file the variants apply to. Defaults to fsm_rules.json.
+    """
+
+    def __init__(
+        self,
+        expert,
+        variants: list[dict] = None,
+        section_width: int = 256,
+        safe_steps: int = 3,
+        max_attempts: int = 5,
+        rules_path: str = DEFAULT_RULES_PATH,
+    ) -> None:
+        self.expert = expert
+        self.environment = expert.environment
+        self.variants = variants or [{}]
+        self.section_width = section_width
+        self.safe_steps = safe_steps
+        self.max_attempts = max_attempts
+
+        self._rules = [RuleEngine(rules_path, params=variant) for variant in self.variants]
+
+        # "world-stage@x" section -> {attempts, successes, deaths, variants: {variant: [attempts, successes]}}
+        self.sections = {}
+        self.rewinds = 0
+        self.given_up = 0
+        self.emulated_frames = 0
+        self.frames_saved = 0
+
+        self._stage = None
+        self._stage_start_frame = 0
+        self._safe_section = None
+        self._safe_frame = 0
+        self._pending_section = None
+        self._pending_frame = 0
+        self._pending_steps = 0
+        self._furthest_section = -1
+        self._variant = 0
+        self._lives = 0
+        self._dying = False
+
+    def _section_name(self, section: int) -> str:
+        return f"{self._stage[0]}-{self._stage[1]}@{section * self.section_width}"
+
+    def _section(self, section: int) -> dict:
+        return self.sections.setdefault(
+            self._section_name(section), {"attempts": 0, "successes": 0, "deaths": 0, "variants": {}}
+        )
+
+    def _use_variant(self, variant: int) -> None:
+        self._variant = variant
+        self.expert.rules = self._rules[variant]
+        # Cached decisions were made with the previous parameters
+        if self.expert.decision_cache is not None:
+            self.expert.decision_cache.clear()
+
+    def _start_attempt(self, section: int) -> None:
+        record = self._section(section)
+        record["attempts"] += 1
+        record["variants"].setdefault(str(self._variant), [0, 0])[0] += 1
+
+    def _end_attempt(self, success: bool) -> None:
+        if self._safe_section is None:
+            return
+        record = self._section(self._safe_section)
+        if success:
+            record["successes"] += 1
+            record["variants"][str(self._variant)][1] += 1
+        else:
+            record["deaths"] += 1
+
+    def _start_stage(self) -> None:
+        environment = self.environment
+        self._stage = environment.get_world(), environment.get_stage()
+        self._stage_start_frame = environment.pyboy.frame_count
+        self._safe_section = None
+        self._pending_section = None
+        self._furthest_section = -1
+        self._lives = environment.get_lives()
+        self._use_variant(0)
+
+    def _dead(self) -> bool:
+        return self.environment.get_dead_timer() != 0 or self.environment.get_lives() < self._lives
+
+    def _progress(self) -> None:
+        environment = self.environment
+        section = environment.get_x_position() // self.section_width
+
+        # A snapshot becomes the rewind point once Mario survived safe_steps steps after it was taken
+        if self._pending_section is not None:
+            self._pending_steps += 1
+            if self._pending_steps >= self.safe_steps:
+                self._end_attempt(success=True)
+                environment.snapshots.put(SAFE, environment.snapshots.pop(PENDING))
+                self._safe_section = self._pending_section
+                self._safe_frame = self._pending_frame
+                self._pending_section = None
+                self._use_variant(0)
+                self._start_attempt(self._safe_section)
+
+        if section > self._furthest_section:
+            self._furthest_section = section
+            environment.save_snapshot(PENDING)
+            self._pending_section = section
+            self._pending_frame = environment.pyboy.frame_count
+            self._pending_steps = 0
+
+    def _rewind(self) -> bool:
+        """
+        Rewinds to the latest safe snapshot with the next variant, or returns False if the section is given up.
+        """
+        environment = self.environment
+        self._end_attempt(success=False)
+        if self._safe_section is None or SAFE not in environment.snapshots:
+            return False
+        if self._section(self._safe_section)["attempts"] >= self.max_attempts:
+            self.given_up += 1
+            logging.info(f"Giving up section {self._section_name(self._safe_section)}")
+            # Playing on from here, the death counts as a normal one
+            self._safe_section = None
+            return False
+
+        environment.restore_snapshot(SAFE)
+        self.rewinds += 1
+        # load_state leaves frame_count as it is, the replay a rewind saves ends at the frame the snapshot was taken
+        self.frames_saved += self._safe_frame - self._stage_start_frame
+
+        # Sections after the rewind point are entered again
+        self._pending_section = None
+        self._furthest_section = self._safe_section
+        if PENDING in environment.snapshots:
+            environment.snapshots.pop(PENDING)
+
+        self.expert.current_state = "DEFAULT"
+        if self.expert.enemy_tracker is not None:
+            self.expert.enemy_tracker.reset()
+        self._use_variant((self._variant + 1) % len(self.variants))
+        self._start_attempt(self._safe_section)
+        return True
+
+    def run(self, max_steps: int, until_stage_end: bool = True) -> dict[str, any]:
+        """
+        Practices from the environment's current state for up to max_steps steps, until game over or, with
+        until_stage_end, until the stage is cleared. Returns the stats.
+        """
+        expert = self.expert
+        environment = self.environment
+        self._start_stage()
+        self._progress()
+
+        cleared = False
+        for _ in range(max_steps):
+            if environment.get_game_over():
+                break
+
+            frame = environment.pyboy.frame_count
+            expert.step()
+            self.emulated_frames += environment.pyboy.frame_count - frame
+
+            if (environment.get_world(), environment.get_stage()) != self._stage:
+                self._end_attempt(success=True)
+                cleared = True
+                if until_stage_end:
+                    break
+                self._start_stage()
+
+            # A death that is not rewound plays out like in a normal game
+            if self._dying:
+                if environment.get_dead_timer() == 0:
+                    self._dying = False
+                    self._lives = environment.get_lives()
+                continue
+
+            if self._dead():
+                self._dying = not self._rewind()
+                continue
+
+            self._progress()
+
+        return self.stats(cleared)
+
+    def stats(self, cleared: bool = False) -> dict[str, any]:
+        sections = {
+            name: {**record, "success_rate": record["successes"] / record["attempts"] if record["attempts"] else 0.0}
+            for name, record in self.sections.items()
+        }
+        return {
+            "cleared": cleared,
+            "rewinds": self.rewinds,
+            "given_up": self.given_up,
+            "emulated_frames": self.emulated_frames,
+            "frames_saved": self.frames_saved,
+            "variants": self.variants,
+            "sections": sections,
+        }
+
+
+def load_variants(args) -> list[dict]:
+    if args.variants_file is not None:
+        with open(args.variants_file, "r", encoding="utf-8") as file:
+            variants = json.load(file)
+        # A sweep's best.json holds a single ranked result
+        if isinstance(variants, dict):
+            variants = [variants.get("config", variants)]
+        return [{}] + variants
+    space = {**DEFAULT_SPACE, **TRACKER_SPACE} if args.enemy_tracker else DEFAULT_SPACE
+    return [{}] + random_configs(space, args.variants - 1, args.seed)
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    # "world-stage[@x]" of the start-state library, the default init state if not given
+    parse_args.add_argument("--stage", type=str, default=None)
+    parse_args.add_argument("--library", type=str, default=DEFAULT_LIBRARY_PATH)
+
+    parse_args.add_argument("--variants", type=int, default=4)
+    parse_args.add_argument("--variants_file", type=str, default=None)
+    parse_args.add_argument("--seed", type=int, default=0)
+    parse_args.add_argument("--rules", type=str, default=DEFAULT_RULES_PATH)
+    # Variants also vary the tracker's params
+    parse_args.add_argument("--enemy_tracker", action="store_true")
+
+    parse_args.add_argument("--section_width", type=int, default=256)
+    parse_args.add_argument("--safe_steps", type=int, default=3)
+    parse_args.add_argument("--max_attempts", type=int, default=5)
+    parse_args.add_argument("--max_steps", type=int, default=5000)
+    parse_args.add_argument("--keep_playing", action="store_true", help="Practice on past the end of the stage")
+
+    parse_args.add_argument("-o", "--output_path", type=str, default=f"{Path(__file__).parent.parent}/results/practice")
+
+    return parse_args.parse_args()
+
+
+def main():
+    from mario_expert import MarioExpert
+
+    args = get_args()
+    os.makedirs(args.output_path, exist_ok=True)
+
+    expert = MarioExpert(results_path=args.output_path, headless=True)
+    environment = expert.environment
+    if args.enemy_tracker:
+        from enemy_tracker import EnemyTracker
+
+        expert.enemy_tracker = EnemyTracker(environment.pyboy.game_wrapper.mapping_compressed)
+    environment.set_turbo(True, render_frames=False)
+    if args.stage is not None:
+        environment.init_path = StateLibrary(args.library).path(*parse_stage(args.stage))
+    environment.reset()
+
+    practice = Practice(
+        expert,
+        load_variants(args),
+        section_width=args.section_width,
+        safe_steps=args.safe_steps,
+        max_attempts=args.max_attempts,
+        rules_path=args.rules,
+    )
+    stats = practice.run(args.max_steps, until_stage_end=not args.keep_playing)
+    environment.pyboy.stop(save=False)
+
+    for name, record in stats["sections"].items():
+        logging.info(
+            f"{name}: {record['attempts']} attempts, {record['successes']} cleared "
+            f"({record['success_rate']:.0%}), variants {record['variants']}"
+        )
+    total = stats["emulated_frames"] + stats["frames_saved"]
+    logging.info(
+        f"{stats['rewinds']} rewinds, {stats['given_up']} sections given up, {stats['emulated_frames']} frames emulated, "
+        f"{stats['frames_saved']} saved ({stats['frames_saved'] / total if total else 0.0:.0%} of full replays)"
+    )
+
+    with open(f"{args.output_path}/practice.json", "w", encoding="utf-8") as file:
+        json.dump(stats, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Per-stage timing of the agent step loop.
+
+Stages are timed with time.perf_counter_ns and accumulated into per-stage counters and log-scale histograms (8
+buckets per power of two, so percentiles are within ~10%). Call sites check profiler.enabled first, so the default
+NULL_PROFILER costs one attribute lookup:
+
+    if self.profiler.enabled:
+        start = time.perf_counter_ns()
+    game_area = self.environment.game_area()
+    if self.profiler.enabled:
+        self.profiler.record("game_area", start)
+
+Timings are only accumulated on the main thread. A worker thread calls defer first, its timings are collected and
+replayed on the main thread (see pipeline.py).
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+
+# Histogram buckets: 3 mantissa bits per power of two of nanoseconds
+SUB_BITS = 3
+NUM_BUCKETS = 64 << SUB_BITS
+
+
+def _bucket(ns: int) -> int:
+    bits = ns.bit_length()
+    if bits <= SUB_BITS:
+        return ns
+    return (bits - SUB_BITS) << SUB_BITS | (ns >> (bits - SUB_BITS - 1)) & ((1 << SUB_BITS) - 1)
+
+
+def _bucket_value(bucket: int) -> float:
+    """
+    The midpoint of the nanosecond range covered by a bucket.
+    """
+    if bucket < 1 << SUB_BITS:
+        return float(bucket)
+    shift = (bucket >> SUB_BITS) - 1
+    low = ((1 << SUB_BITS) | bucket & ((1 << SUB_BITS) - 1)) << shift
+    return low + (1 << shift) / 2
+
+
+class _Stage:
+    __slots__ = ("count", "total_ns", "max_ns", "histogram")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.histogram = [0] * NUM_BUCKETS
+
+    def add(self, ns: int) -> None:
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+        self.histogram[_bucket(ns)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= target:
+                return min(_bucket_value(bucket), self.max_ns)
+        return float(self.max_ns)
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "total_ms": self.total_ns / 1e6,
+            "mean_us": self.total_ns / self.count / 1e3 if self.count else 0.0,
+            "p50_us": self.percentile(0.50) / 1e3,
+            "p95_us": self.percentile(0.95) / 1e3,
+            "max_us": self.max_ns / 1e3,
+        }
+
+
+class StageProfiler:
+    """
+    Collects per-stage timings over an episode and writes an end-of-episode report.
+
+    Args:
+        cprofile (bool): Whether to also run cProfile over the episode. Defaults to False.
+    """
+
+    enabled = True
+
+    def __init__(self, cprofile: bool = False) -> None:
+        self.stages = {}
+        self._deferred = threading.local()
+        self._cprofile = cProfile.Profile() if cprofile else None
+        self._start_ns = 0
+        self._start_frame = 0
+        self.elapsed_ns = 0
+        self.frames = 0
+
+    def record(self, stage: str, start_ns: int) -> None:
+        """
+        Adds the time since start_ns (from time.perf_counter_ns) to stage.
+        """
+        ns = time.perf_counter_ns() - start_ns
+        deferred = getattr(self._deferred, "timings", None)
+        if deferred is not None:
+            deferred.append((stage, ns))
+            return
+        self._add(stage, ns)
+
+    def _add(self, stage: str, ns: int) -> None:
+        timings = self.stages.get(stage)
+        if timings is None:
+            timings = self.stages[stage] = _Stage()
+        timings.add(ns)
+
+    def defer(self) -> None:
+        """
+        Holds back the timings the calling thread records until collect.
+        """
+        self._deferred.timings = []
+
+    def collect(self) -> list[tuple]:
+        timings = self._deferred.timings
+        self._deferred.timings = None
+        return timings
+
+    def replay(self, timings: list[tuple]) -> None:
+        """
+        Adds (stage, ns) timings collected on another thread.
+        """
+        for stage, ns in timings:
+            self._add(stage, ns)
+
+    def begin_episode(self, frame_count: int) -> None:
+        self._start_frame = frame_count
+        self._start_ns = time.perf_counter_ns()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def end_episode(self, frame_count: int) -> None:
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        self.elapsed_ns = time.perf_counter_ns() - self._start_ns
+        self.frames = frame_count - self._start_frame
+
+    def report(self) -> dict[str, any]:
+        seconds = self.elapsed_ns / 1e9
+        steps = self.stages["step"].count if "step" in self.stages else 0
+        return {
+            "seconds": seconds,
+            "steps": steps,
+            "steps_per_sec": steps / seconds if seconds > 0 else 0.0,
+            "emulated_frames": self.frames,
+            "emulated_fps": self.frames / seconds if seconds > 0 else 0.0,
+            "stages": {stage: timings.summary() for stage, timings in self.stages.items()},
+        }
+
+    def write_report(self, results_path: str) -> dict[str, any]:
+        """
+        Writes profile.json (and profile.prof/profile.txt in cProfile mode) into results_path.
+        """
+        report = self.report()
+        with open(f"{results_path}/profile.json", "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(f"{results_path}/profile.prof")
+            text = io.StringIO()
+            pstats.Stats(self._cprofile, stream=text).sort_stats("cumulative").print_stats(40)
+            with open(f"{results_path}/profile.txt", "w", encoding="utf-8") as file:
+                file.write(text.getvalue())
+
+        return report
+
+
+class NullProfiler:
+    """
+    The profiler used when profiling is off.
+    """
+
+    enabled = False
+
+    def record(self, stage: str, start_ns: int) -> None:
+        pass
+
+    def defer(self) -> None:
+        pass
+
+    def collect(self) -> list[tuple]:
+        return []
+
+    def replay(self, timings: list[tuple]) -> None:
+        pass
+
+    def begin_episode(self, frame_count: int) -> None:
+        pass
+
+    def end_episode(self, frame_count: int) -> None:
+        pass
+
+    def write_report(self, results_path: str) -> None:
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -1,7 +1,7 @@
 import os
-import subprocess
 from pathlib import Path
 
+import evaluate
 import virtualenv
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
@@ -44,7 +44,7 @@ def print_folders(directory, tab=0):
         print_folders(folder, tab=tab + 5)
 
 
-def run_venv(upi, requirement_path):
+def build_venv(upi, requirement_path):
     path = f"{os.path.expanduser('~')}/venv"
     venv_dir = os.path.join(path, f"{upi}")
     virtualenv.cli_run([venv_dir])
@@ -54,7 +54,7 @@ def run_venv(upi, requirement_path):
     command = f". {venv_dir}/bin/activate && pip install -r {requirement_path}/requirements.txt"
     os.system(command)
 
-    return subprocess.Popen([python_bin, "run.py", "--upi", upi, "--headless"])
+    return python_bin
 
 
 def main():
@@ -70,7 +70,11 @@ def main():
 
     print_folders(directory)
 
-    sub_processes = {}
+    submissions_path = f"{Path(__file__).parent.parent}/submissions"
+    results_path = f"{Path(__file__).parent.parent}/results"
+
+    agents = {}
+    pythons = {}
     for folders in directory["folders"]:
         upi = folders["title"]
         print(f"Title: {upi}")
@@ -79,20 +83,26 @@ def main():
         requirements_id = files["requirements.txt"]["id"]
         mario_expert_id = files["mario_expert.py"]["id"]
 
-        requirement_path = f"{Path(__file__).parent.parent}"
+        requirement_path = f"{submissions_path}/{upi}"
+        os.makedirs(requirement_path, exist_ok=True)
 
         file = drive.CreateFile({"id": requirements_id})
         file.GetContentFile(f"{requirement_path}/requirements.txt")
 
         file = drive.CreateFile({"id": mario_expert_id})
-        file.GetContentFile("mario_expert.py")
+        file.GetContentFile(f"{requirement_path}/mario_expert.py")
+
+        agents[upi] = f"{requirement_path}/mario_expert.py"
+        pythons[upi] = build_venv(upi, requirement_path)
 
-        p = run_venv(upi, requirement_path)
-        sub_processes[upi] = p
+    # Episodes run headless in a pool sized to the core count, see evaluate.py
+    episodes = evaluate.build_episodes(agents, [0], [None], results_path)
+    for episode in episodes:
+        episode["python"] = pythons[episode["agent"]]
 
-    for upi, p in sub_processes.items():
-        exit_code = p.wait()
-        print(f"Exit code: {exit_code} {upi}")
+    records = evaluate.evaluate(episodes, os.cpu_count(), 600.0, results_path)
+    for record in records:
+        print(f"Status: {record['status']} {record['agent']}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""
+Per-tick snapshot of the RAM values behind MarioEnvironment.game_state.
+
+Every address the getters need is read once per tick, contiguous addresses as a single memory slice, and decoded with
+integer arithmetic only. The decoded values are identical to the ones the MarioEnvironment getters return.
+
+https://datacrystal.tcrf.net/wiki/Super_Mario_Land/RAM_map
+"""
+
+# VRAM 0x982C-0x9833: world, stage and the three time digits shown in the status bar
+VRAM_START = 0x982C
+VRAM_END = 0x9834
+# WRAM 0xC0A4-0xC0AC: game over flag, level block and dead jump timer
+WRAM_START = 0xC0A4
+WRAM_END = 0xC0AD
+# WRAM 0xC202-0xC203: Mario's x position on screen and pose
+MARIO_START = 0xC202
+MARIO_END = 0xC204
+
+ADDR_LIVES = 0xDA15
+ADDR_DEAD_TIMER = 0xFFA6
+ADDR_COINS = 0xFFFA
+
+GAME_OVER = 0x39
+
+
+def concat_digits(*values) -> int:
+    """
+    Integer equivalent of int("".join(str(value) for value in values)) for non-negative values.
+    """
+    result = 0
+    for value in values:
+        width = 10
+        while width <= value:
+            width *= 10
+        result = result * width + value
+    return result
+
+
+class RamSnapshot:
+    """
+    The game state values of a single tick.
+
+    Args:
+        pyboy (PyBoy): The emulator to read from.
+    """
+
+    __slots__ = (
+        "frame",
+        "lives",
+        "score",
+        "coins",
+        "stage",
+        "world",
+        "x_position",
+        "time",
+        "dead_timer",
+        "dead_jump_timer",
+        "game_over",
+        "mario_pose",
+        "level_block",
+        "mario_x",
+        "scx",
+    )
+
+    def __init__(self, pyboy) -> None:
+        memory = pyboy.memory
+
+        vram = memory[VRAM_START:VRAM_END]
+        wram = memory[WRAM_START:WRAM_END]
+        mario = memory[MARIO_START:MARIO_END]
+
+        self.frame = pyboy.frame_count
+
+        self.world = vram[0x982C - VRAM_START]
+        self.stage = vram[0x982E - VRAM_START]
+        self.time = concat_digits(
+            vram[0x9831 - VRAM_START], vram[0x9832 - VRAM_START], vram[0x9833 - VRAM_START]
+        )
+
+        self.game_over = wram[0xC0A4 - WRAM_START] == GAME_OVER
+        self.level_block = wram[0xC0AB - WRAM_START]
+        self.dead_jump_timer = wram[0xC0AC - WRAM_START]
+
+        self.mario_x = mario[0xC202 - MARIO_START]
+        self.mario_pose = mario[0xC203 - MARIO_START]
+
+        self.lives = memory[ADDR_LIVES]
+        self.dead_timer = memory[ADDR_DEAD_TIMER]
+        self.coins = memory[ADDR_COINS]
+
+        self.score = pyboy.game_wrapper.score
+
+        # Same calculation as MarioEnvironment.get_x_position
+        self.scx = pyboy.screen.tilemap_position_list[16][0]
+        real = (self.scx - 7) % 16
+        if real == 0:
+            real = 16
+        self.x_position = self.level_block * 16 + real + self.mario_x
+
+    def game_state(self) -> dict[str, any]:
+        return {
+            "lives": self.lives,
+            "score": self.score,
+            "coins": self.coins,
+            "stage": self.stage,
+            "world": self.world,
+            "x_position": self.x_position,
+            "time": self.time,
+            "dead_timer": self.dead_timer,
+            "dead_jump_timer": self.dead_jump_timer,
+            "game_over": self.game_over,
+        }
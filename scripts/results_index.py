@@ -0,0 +1,322 @@
+"""
+Incremental SQLite index of episode results.
+
+Episodes are added once, when they finish (evaluate.py does so as it collects them), instead of every results.json
+being globbed and parsed again on each query. Each row stores a precomputed rank key:
+
+    rank_key = world * 2**40 + stage * 2**32 + score
+
+Ordering by rank_key descending is the compare_performance order (world, then stage, then score, each higher first)
+for scores below 2**32, so rankings are a walk down the rank_key index. Per-agent statistics use the (agent, score)
+index, percentiles are a single indexed OFFSET lookup. Every episode ends at game over, so the final x position is
+where the last life was lost; episodes that recorded telemetry add the x position of every lost life.
+
+    python3 results_index.py import ../results
+    python3 results_index.py rank --limit 20
+    python3 results_index.py stats --agent mario_expert
+    python3 results_index.py deaths --agent mario_expert --bin 64
+"""
+
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_INDEX_PATH = f"{Path(__file__).parent.parent}/results/results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    episode_id TEXT NOT NULL UNIQUE,
+    agent TEXT NOT NULL,
+    seed INTEGER,
+    start_state TEXT,
+    start_world INTEGER NOT NULL,
+    start_stage INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    world INTEGER,
+    stage INTEGER,
+    score INTEGER,
+    lives INTEGER,
+    coins INTEGER,
+    x_position INTEGER,
+    time INTEGER,
+    completed INTEGER NOT NULL,
+    rank_key INTEGER,
+    duration REAL,
+    added REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS episodes_rank ON episodes (rank_key DESC);
+CREATE INDEX IF NOT EXISTS episodes_world ON episodes (world);
+CREATE INDEX IF NOT EXISTS episodes_stage ON episodes (stage);
+CREATE INDEX IF NOT EXISTS episodes_score ON episodes (score);
+CREATE INDEX IF NOT EXISTS episodes_agent_score ON episodes (agent, score);
+CREATE INDEX IF NOT EXISTS episodes_agent_rank ON episodes (agent, rank_key DESC);
+
+CREATE TABLE IF NOT EXISTS deaths (
+    episode INTEGER NOT NULL REFERENCES episodes (id) ON DELETE CASCADE,
+    x_position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deaths_episode ON deaths (episode);
+"""
+
+# Start states of the state library are named w<world>-<stage>-x<x>.state, anything else starts at 1-1
+_LIBRARY_STATE = re.compile(r"w(\d+)-(\d+)-x\d+")
+
+
+def rank_key(result: dict) -> int:
+    """
+    An integer that sorts results like compare_performance when ordered descending.
+    """
+    return (result["world"] << 40) + (result["stage"] << 32) + result["score"]
+
+
+def start_stage(start_state: str) -> tuple[int, int]:
+    match = _LIBRARY_STATE.search(Path(start_state).stem) if start_state else None
+    return (int(match.group(1)), int(match.group(2))) if match else (1, 1)
+
+
+class ResultsIndex:
+    """
+    The SQLite results index.
+
+    Args:
+        path (str): The database file, created if missing. Defaults to results/results.db.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM episodes").fetchone()[0]
+
+    def add(self, record: dict, death_positions: list[int] = None) -> None:
+        """
+        Adds (or replaces) an episode record: the evaluate.py record fields and, for finished episodes, the final
+        game_state. death_positions defaults to the final x position.
+        """
+        finished = "world" in record
+        world, stage = start_stage(record.get("start_state"))
+        completed = finished and (record["world"], record["stage"]) > (world, stage)
+        if death_positions is None:
+            death_positions = [record["x_position"]] if finished else []
+
+        with self.connection:
+            self.connection.execute("DELETE FROM episodes WHERE episode_id = ?", (record["episode_id"],))
+            cursor = self.connection.execute(
+                "INSERT INTO episodes (episode_id, agent, seed, start_state, start_world, start_stage, status, world, "
+                "stage, score, lives, coins, x_position, time, completed, rank_key, duration, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record["episode_id"],
+                    record["agent"],
+                    record.get("seed"),
+                    record.get("start_state"),
+                    world,
+                    stage,
+                    record.get("status", "ok"),
+                    record.get("world"),
+                    record.get("stage"),
+                    record.get("score"),
+                    record.get("lives"),
+                    record.get("coins"),
+                    record.get("x_position"),
+                    record.get("time"),
+                    int(completed),
+                    rank_key(record) if finished else None,
+                    record.get("duration"),
+                    time.time(),
+                ),
+            )
+            self.connection.executemany(
+                "INSERT INTO deaths (episode, x_position) VALUES (?, ?)",
+                [(cursor.lastrowid, int(x_position)) for x_position in death_positions],
+            )
+
+    def rank(self, limit: int = 20, agent: str = None) -> list[dict]:
+        """
+        The best finished episodes in compare_performance order.
+        """
+        query = "SELECT episode_id, agent, world, stage, score FROM episodes WHERE rank_key IS NOT NULL"
+        parameters = ()
+        if agent is not None:
+            query += " AND agent = ?"
+            parameters = (agent,)
+        query += " ORDER BY rank_key DESC LIMIT ?"
+        rows = self.connection.execute(query, parameters + (limit,)).fetchall()
+        return [dict(zip(["episode_id", "agent", "world", "stage", "score"], row)) for row in rows]
+
+    def agents(self) -> list[str]:
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT agent FROM episodes ORDER BY agent")]
+
+    def percentile(self, agent: str, percentile: float):
+        """
+        The nearest-rank score percentile of an agent's finished episodes, None if it has none.
+        """
+        count = self.connection.execute(
+            "SELECT COUNT(*) FROM episodes WHERE agent = ? AND score IS NOT NULL", (agent,)
+        ).fetchone()[0]
+        if count == 0:
+            return None
+        offset = min(max(math.ceil(percentile / 100 * count) - 1, 0), count - 1)
+        return self.connection.execute(
+            "SELECT score FROM episodes WHERE agent = ? AND score IS NOT NULL ORDER BY score LIMIT 1 OFFSET ?",
+            (agent, offset),
+        ).fetchone()[0]
+
+    def stats(self, agent: str, percentiles: tuple = (50, 90)) -> dict[str, any]:
+        """
+        An agent's episode count, failures, mean/max/percentile scores, completion rate and best result.
+        """
+        episodes, failed, finished, mean_score, max_score, completed = self.connection.execute(
+            "SELECT COUNT(*), SUM(status != 'ok'), COUNT(score), AVG(score), MAX(score), SUM(completed) "
+            "FROM episodes WHERE agent = ?",
+            (agent,),
+        ).fetchone()
+        best = self.rank(1, agent)
+        return {
+            "agent": agent,
+            "episodes": episodes,
+            "failed": failed or 0,
+            "mean_score": mean_score,
+            "max_score": max_score,
+            **{f"p{percentile}_score": self.percentile(agent, percentile) for percentile in percentiles},
+            "completion_rate": (completed or 0) / finished if finished else 0.0,
+            "best": best[0] if best else None,
+        }
+
+    def deaths_by_x(self, agent: str = None, bin_size: int = 64) -> dict[int, int]:
+        """
+        The number of lost lives per bin_size wide x position bin, keyed by the start of the bin.
+        """
+        query = "SELECT deaths.x_position / ? * ? AS bin, COUNT(*) FROM deaths"
+        parameters = (bin_size, bin_size)
+        if agent is not None:
+            query += " JOIN episodes ON episodes.id = deaths.episode WHERE episodes.agent = ?"
+            parameters += (agent,)
+        query += " GROUP BY bin ORDER BY bin"
+        return dict(self.connection.execute(query, parameters).fetchall())
+
+    def import_results(self, results_path: str) -> int:
+        """
+        Adds every episode below results_path that is not indexed yet: evaluate.py's results.jsonl stores and
+        run.py/compare_results.py style <agent>/results.json directories. Returns the number of episodes added.
+        """
+        known = {row[0] for row in self.connection.execute("SELECT episode_id FROM episodes")}
+        added = 0
+
+        for store in glob.glob(f"{results_path}/**/results.jsonl", recursive=True):
+            with open(store, "r", encoding="utf-8") as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record["episode_id"] not in known:
+                        self.add(record, episode_deaths(f"{os.path.dirname(store)}/{record['episode_id']}", record))
+                        known.add(record["episode_id"])
+                        added += 1
+
+        for results_file in glob.glob(f"{results_path}/**/results.json", recursive=True):
+            directory = os.path.dirname(results_file)
+            episode_id = os.path.relpath(directory, results_path)
+            if episode_id in known or os.path.basename(directory) in known:
+                continue
+            with open(results_file, "r", encoding="utf-8") as file:
+                record = json.load(file)
+            record.update({"episode_id": episode_id, "agent": os.path.basename(directory)})
+            self.add(record, episode_deaths(directory, record))
+            known.add(episode_id)
+            added += 1
+
+        return added
+
+
+def episode_deaths(results_path: str, record: dict):
+    """
+    The x position of every lost life from an episode's telemetry, None (the final x position) if it has none.
+    """
+    if not glob.glob(f"{results_path}/telemetry*"):
+        return None
+    from telemetry import TelemetryStore
+
+    store = TelemetryStore(results_path)
+    if len(store) == 0:
+        return None
+    positions = store.death_positions().tolist()
+    # The last life is lost on the final step, after the last telemetry row
+    if "x_position" in record:
+        positions.append(record["x_position"])
+    return positions
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("command", type=str, choices=["import", "rank", "stats", "deaths"])
+    parse_args.add_argument("results_path", type=str, nargs="?", default=None)
+
+    parse_args.add_argument("--index", type=str, default=DEFAULT_INDEX_PATH)
+    parse_args.add_argument("--agent", type=str, default=None)
+    parse_args.add_argument("--limit", type=int, default=20)
+    parse_args.add_argument("--percentiles", type=float, nargs="+", default=[50, 90])
+    parse_args.add_argument("--bin", type=int, default=64)
+
+    return parse_args.parse_args()
+
+
+def main():
+    args = get_args()
+
+    with ResultsIndex(args.index) as index:
+        start = time.perf_counter()
+
+        if args.command == "import":
+            if args.results_path is None:
+                raise ValueError("import needs the results directory")
+            added = index.import_results(args.results_path)
+            logging.info(f"Added {added} episodes, the index has {len(index)}")
+
+        elif args.command == "rank":
+            for i, result in enumerate(index.rank(args.limit, args.agent)):
+                logging.info(
+                    f"Rank {i + 1}: {result['episode_id']} ({result['agent']}) - World: {result['world']} "
+                    f"Stage: {result['stage']} Score: {result['score']}"
+                )
+
+        elif args.command == "stats":
+            agents = [args.agent] if args.agent is not None else index.agents()
+            for agent in agents:
+                logging.info(json.dumps(index.stats(agent, tuple(args.percentiles))))
+
+        else:
+            for x_position, deaths in index.deaths_by_x(args.agent, args.bin).items():
+                logging.info(f"x {x_position:>5}-{x_position + args.bin - 1:<5}: {deaths} deaths")
+
+        logging.info(f"Answered in {(time.perf_counter() - start) * 1e3:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
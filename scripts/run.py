@@ -9,7 +9,19 @@ import logging
 import os
 from pathlib import Path
 
+from capture import create_policy
+from decision_cache import DecisionCache
+from enemy_tracker import EnemyTracker
+from frame_ring import FrameRing
+from fsm_rules import DEFAULT_RULES_PATH, RuleEngine
+from input_trace import InputRecorder
 from mario_expert import MarioExpert
+from pipeline import DecisionPipeline
+from planner import LookaheadPlanner
+from profiling import StageProfiler
+from telemetry import TelemetryRecorder
+from tracing import Tracer, parse_levels
+from world_map import WorldMap
 
 logging.basicConfig(level=logging.INFO)
 
@@ -21,10 +33,91 @@ def get_args():
 
     parse_args.add_argument("--upi", type=str, required=True)
 
+    parse_args.add_argument("--turbo", action="store_true")
+
+    parse_args.add_argument("--plan", action="store_true")
+    parse_args.add_argument("--plan_budget", type=float, default=0.05)
+
+    # e.g. --trace fsm,action or --trace all=2, see tracing.py
+    parse_args.add_argument("--trace", type=str, default="")
+    parse_args.add_argument("--trace_path", type=str, default=None)
+
+    # Writes profile.json next to results.json, cprofile also writes profile.prof/profile.txt
+    parse_args.add_argument("--profile", type=str, choices=["stages", "cprofile"], default=None)
+
+    # Records the run_action inputs for input_trace.py replays
+    parse_args.add_argument("--record", type=str, default=None)
+
+    # Memoises choose_action decisions, --validate_cache recomputes every hit to check the cache
+    parse_args.add_argument("--decision_cache", type=int, default=0)
+    parse_args.add_argument("--validate_cache", action="store_true")
+
+    # Runs the FSM from a rule file (fsm_rules.json by default), which is reloaded whenever it is edited. Decides as
+    # fast as the built-in chain (stub_benchmark.py rules)
+    parse_args.add_argument("--rules", type=str, nargs="?", const=DEFAULT_RULES_PATH, default=None)
+
+    # Publishes native frames into a shared memory ring other processes can follow, see frame_ring.py
+    parse_args.add_argument("--frame_ring", type=str, default=None)
+    parse_args.add_argument("--frame_ring_slots", type=int, default=8)
+
+    # Tracks enemies from the sprite table and uses their motion in choose_action, see enemy_tracker.py
+    parse_args.add_argument("--enemy_tracker", action="store_true")
+
+    # Builds a level-wide tile map while playing, the gap and wall lookahead use its column indexes, see world_map.py
+    parse_args.add_argument(
+        "--world_map",
+        action="store_true",
+        help="Also changes decisions: GAP only jumps over pits (bottom row air), not down steps from platforms",
+    )
+
+    # Writes per-step telemetry next to results.json, see telemetry.py
+    parse_args.add_argument("--telemetry", action="store_true")
+
+    # Decides the next action while the current one is emulated, from observations at most N frames old
+    parse_args.add_argument(
+        "--pipeline",
+        type=int,
+        nargs="?",
+        const=10,
+        default=None,
+        help="Max staleness N in frames (default 10). At the default hold of 10 an observation is 11 frames old when "
+        "used, so with N >= 11 decisions lag a full action behind the game: this changes how the agent plays and is "
+        "not a pure speed-up",
+    )
+
+    # What play records, see capture.py - the default records every step at 300x240
+    parse_args.add_argument("--capture", type=str, choices=["video", "none", "ring"], default="video")
+    parse_args.add_argument("--capture_every", type=int, default=1)
+    parse_args.add_argument("--capture_native", action="store_true")
+    parse_args.add_argument("--capture_seconds", type=float, default=10.0)
+
     return parse_args.parse_args()
 
 
-def run(upi, headless):
+def run(
+    upi,
+    headless,
+    turbo=False,
+    plan=False,
+    plan_budget=0.05,
+    trace="",
+    trace_path=None,
+    profile=None,
+    record=None,
+    decision_cache=0,
+    validate_cache=False,
+    rules=None,
+    frame_ring=None,
+    frame_ring_slots=8,
+    world_map=False,
+    telemetry=False,
+    capture="video",
+    capture_every=1,
+    capture_native=False,
+    capture_seconds=10.0,
+    pipeline=None,
+    enemy_tracker=False,
+):
     if upi == "your_upi":
         raise ValueError("Please set your UPI in the run.py file")
 
@@ -35,13 +128,75 @@ def run(upi, headless):
         os.makedirs(results_path)
 
     expert = MarioExpert(results_path=results_path, headless=headless)
+    if turbo:
+        expert.environment.set_turbo(True)
+    if plan:
+        expert.planner = LookaheadPlanner(expert.environment, time_budget=plan_budget)
+    levels = parse_levels(trace)
+    if levels:
+        expert.tracer = Tracer(trace_path or f"{results_path}/trace.jsonl", levels)
+    if profile is not None:
+        expert.set_profiler(StageProfiler(cprofile=profile == "cprofile"))
+    if record is not None:
+        expert.environment.recorder = InputRecorder(record, expert.environment.init_path)
+    if rules is not None:
+        expert.rules = RuleEngine(rules)
+    if frame_ring is not None:
+        expert.environment.frame_ring = FrameRing(frame_ring_slots, name=frame_ring)
+    if world_map:
+        expert.environment.world_map = WorldMap()
+    if enemy_tracker:
+        expert.enemy_tracker = EnemyTracker(expert.environment.pyboy.game_wrapper.mapping_compressed)
+    expert.capture = create_policy(capture, capture_every, capture_native, capture_seconds)
+    if pipeline is not None:
+        expert.pipeline = DecisionPipeline(expert, max_staleness=pipeline)
+    if telemetry:
+        expert.telemetry = TelemetryRecorder(f"{results_path}/telemetry", expert.mario_state)
+    if decision_cache > 0:
+        expert.decision_cache = DecisionCache(decision_cache, validate=validate_cache)
+
     expert.play()
 
+    if record is not None:
+        expert.environment.recorder.close()
+    if frame_ring is not None:
+        expert.environment.frame_ring.close()
+    if telemetry:
+        expert.telemetry.close()
+    if pipeline is not None:
+        expert.pipeline.close()
+        logging.info(f"Decision pipeline: {expert.pipeline.stats()}")
+    if expert.decision_cache is not None:
+        logging.info(f"Decision cache: {expert.decision_cache.stats()}")
+
 
 def main():
     args = get_args()
 
-    run(args.upi, args.headless)
+    run(
+        args.upi,
+        args.headless,
+        args.turbo,
+        args.plan,
+        args.plan_budget,
+        args.trace,
+        args.trace_path,
+        args.profile,
+        args.record,
+        args.decision_cache,
+        args.validate_cache,
+        args.rules,
+        args.frame_ring,
+        args.frame_ring_slots,
+        args.world_map,
+        args.telemetry,
+        args.capture,
+        args.capture_every,
+        args.capture_native,
+        args.capture_seconds,
+        args.pipeline,
+        args.enemy_tracker,
+    )
 
 
 if __name__ == "__main__":
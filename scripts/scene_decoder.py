@@ -0,0 +1,237 @@
+"""
+Single pass decoder for the compressed game area grid.
+
+The game area is classified once per frame through a lookup table that maps each tile ID (see rules.txt) onto a set
+of category bits. Every query the expert needs - Mario's position, obstacle/enemy/gap positions and "is there a solid
+tile at (r, c)" style neighbourhood checks - is then answered from that single classified grid.
+"""
+
+import numpy as np
+
+# Category bits - a tile can belong to more than one category
+AIR = 1 << 0
+MARIO = 1 << 1
+SOLID = 1 << 2
+GOOMBA = 1 << 3
+KOOPA = 1 << 4
+JUMPING_BUG = 1 << 5
+
+ENEMY = GOOMBA | KOOPA
+
+# Tile IDs from rules.txt
+TILE_CATEGORIES = {
+    0: AIR,
+    1: MARIO,
+    10: SOLID,
+    14: SOLID,
+    15: GOOMBA,
+    16: KOOPA,
+    18: JUMPING_BUG,
+}
+
+# Large enough for the raw (uncompressed) pyboy tile identifiers as well
+TILE_LUT = np.zeros(512, dtype=np.uint8)
+for _tile, _category in TILE_CATEGORIES.items():
+    TILE_LUT[_tile] = _category
+
+_NO_POSITIONS = np.empty((0, 2), dtype=np.intp)
+
+
+class Scene:
+    """
+    The decoded contents of a single game area frame.
+
+    Mario's row/column follow the convention used by MarioExpert (one more than the grid index of the first Mario tile)
+    while every other position array holds raw grid indices as (row, col) pairs.
+    """
+
+    __slots__ = (
+        "grid",
+        "flags",
+        "mario_row",
+        "mario_col",
+        "mario_found",
+        "_obstacles",
+        "_enemies",
+        "_jumping_bugs",
+        "_gaps",
+        "_enemy_cells",
+        "_jumping_bug_cells",
+        "world_map",
+    )
+
+    def __init__(self, grid, flags, mario_row, mario_col, mario_found):
+        self.grid = grid
+        self.flags = flags
+        self.mario_row = mario_row
+        self.mario_col = mario_col
+        self.mario_found = mario_found
+
+        # Position arrays are only built if something asks for them
+        self._obstacles = None
+        self._enemies = None
+        self._jumping_bugs = None
+        self._gaps = None
+        self._enemy_cells = None
+        self._jumping_bug_cells = None
+
+        # Optional world_map.WorldMap holding this frame, wall_ahead and gap_ahead use its column indexes
+        self.world_map = None
+
+    @property
+    def rows(self):
+        return self.flags.shape[0]
+
+    @property
+    def cols(self):
+        return self.flags.shape[1]
+
+    def flag_at(self, row, col) -> int:
+        """
+        Returns the category bits of the tile at (row, col), or 0 if it is outside of the game area.
+        """
+        if 0 <= row < self.flags.shape[0] and 0 <= col < self.flags.shape[1]:
+            return int(self.flags[row, col])
+        return 0
+
+    def tile_at(self, row, col) -> int:
+        """
+        Returns the tile ID at (row, col), or -1 if it is outside of the game area.
+        """
+        if 0 <= row < self.grid.shape[0] and 0 <= col < self.grid.shape[1]:
+            return int(self.grid[row, col])
+        return -1
+
+    def is_solid(self, row, col) -> bool:
+        return bool(self.flag_at(row, col) & SOLID)
+
+    def is_air(self, row, col) -> bool:
+        return bool(self.flag_at(row, col) & AIR)
+
+    def is_enemy(self, row, col) -> bool:
+        return bool(self.flag_at(row, col) & ENEMY)
+
+    def _positions(self, category):
+        rows, cols = np.nonzero(self.flags & category)
+        if rows.size == 0:
+            return _NO_POSITIONS
+        return np.column_stack((rows, cols))
+
+    def _positions_by_tile(self, category):
+        # Row-major per tile ID, lowest ID first - the same order the per-ID np.where scans produced
+        flat = np.flatnonzero(self.flags & category)
+        if flat.size == 0:
+            return _NO_POSITIONS
+        flat = flat[np.argsort(self.grid.ravel()[flat], kind="stable")]
+        rows, cols = np.divmod(flat, self.flags.shape[1])
+        return np.column_stack((rows, cols))
+
+    @property
+    def obstacles(self):
+        if self._obstacles is None:
+            self._obstacles = self._positions_by_tile(SOLID)
+        return self._obstacles
+
+    @property
+    def enemies(self):
+        """
+        Goomba (15) positions followed by koopa (16) positions.
+        """
+        if self._enemies is None:
+            self._enemies = self._positions_by_tile(ENEMY)
+        return self._enemies
+
+    @property
+    def jumping_bugs(self):
+        if self._jumping_bugs is None:
+            self._jumping_bugs = self._positions(JUMPING_BUG)
+        return self._jumping_bugs
+
+    @property
+    def gaps(self):
+        """
+        Air tiles that are below and in front of Mario.
+        """
+        if self._gaps is None:
+            mask = (self.flags & AIR).astype(bool)
+            mask[: max(self.mario_row + 1, 0), :] = False
+            mask[:, : max(self.mario_col + 1, 0)] = False
+            rows, cols = np.nonzero(mask)
+            self._gaps = np.column_stack((rows, cols)) if rows.size else _NO_POSITIONS
+        return self._gaps
+
+    @property
+    def enemy_cells(self) -> list:
+        """
+        enemies as a list of [row, col] lists, plain Python beats NumPy's per-call overhead for a handful of enemies.
+        """
+        if self._enemy_cells is None:
+            self._enemy_cells = self.enemies.tolist()
+        return self._enemy_cells
+
+    @property
+    def jumping_bug_cells(self) -> list:
+        if self._jumping_bug_cells is None:
+            self._jumping_bug_cells = self.jumping_bugs.tolist()
+        return self._jumping_bug_cells
+
+    def has_enemies(self) -> bool:
+        return bool(self.enemies.shape[0])
+
+    def wall_ahead(self, distance) -> bool:
+        """
+        Whether Mario's row has a solid tile at most distance columns in front of him (or anywhere behind him).
+        """
+        world_map = self.world_map
+        if world_map is None:
+            obstacles = self.obstacles
+            return bool(((obstacles[:, 0] == self.mario_row) & (obstacles[:, 1] - self.mario_col <= distance)).any())
+
+        col = world_map.next_solid(world_map.origin, self.mario_row)
+        return col is not None and col - world_map.origin <= min(self.mario_col + distance, world_map.width - 1)
+
+    def gap_ahead(self) -> bool:
+        """
+        Whether the column in front of Mario drops away: the tile below it is air, or, with a world map, its bottom row
+        is (a pit rather than a step down from a platform).
+        """
+        world_map = self.world_map
+        if world_map is None:
+            return self.is_air(self.mario_row + 1, self.mario_col + 1)
+
+        if not 0 <= self.mario_col + 1 < world_map.width:
+            return False
+        col = world_map.origin + self.mario_col + 1
+        return world_map.next_gap(col) == col
+
+
+class SceneDecoder:
+    """
+    Decodes game area grids into Scene objects.
+
+    The decoder remembers Mario's last known position so frames where Mario is not visible (e.g. while dying) report
+    the previous position, matching the behaviour of the original per-ID scans.
+    """
+
+    def __init__(self, lut: np.ndarray = TILE_LUT) -> None:
+        self.lut = lut
+        self.mario_row = -1
+        self.mario_col = -1
+
+    def reset(self) -> None:
+        self.mario_row = -1
+        self.mario_col = -1
+
+    def decode(self, game_area) -> Scene:
+        grid = np.asarray(game_area)
+        flags = self.lut[grid]
+
+        mario_found = False
+        mario = np.flatnonzero(flags & MARIO)
+        if mario.size > 0:
+            row, col = divmod(int(mario[0]), flags.shape[1])
+            self.mario_row = row + 1
+            self.mario_col = col + 1
+            mario_found = True
+
+        return Scene(grid, flags, self.mario_row, self.mario_col, mario_found)
@@ -0,0 +1,65 @@
+"""
+In-memory cache of emulator savestates.
+
+Savestates are kept as io.BytesIO buffers and evicted least recently used first once their total size goes over the
+configured byte budget.
+"""
+
+import io
+from collections import OrderedDict
+
+
+class SnapshotCache:
+    """
+    A byte-bounded LRU cache of savestate buffers.
+
+    Args:
+        max_bytes (int): The maximum total size of the cached savestates. Defaults to 64MB.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._snapshots = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        return key in self._snapshots
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def keys(self) -> list:
+        return list(self._snapshots.keys())
+
+    def put(self, key, buffer: io.BytesIO) -> None:
+        if key in self._snapshots:
+            self._remove(key)
+
+        self._snapshots[key] = buffer
+        self.total_bytes += buffer.getbuffer().nbytes
+
+        # Never evict the snapshot that was just saved
+        while self.total_bytes > self.max_bytes and len(self._snapshots) > 1:
+            self._remove(next(iter(self._snapshots)))
+
+    def get(self, key) -> io.BytesIO:
+        """
+        Returns the snapshot buffer rewound to the start. Raises KeyError if the snapshot is not cached.
+        """
+        buffer = self._snapshots[key]
+        self._snapshots.move_to_end(key)
+        buffer.seek(0)
+        return buffer
+
+    def pop(self, key) -> io.BytesIO:
+        buffer = self._snapshots[key]
+        self._remove(key)
+        return buffer
+
+    def clear(self) -> None:
+        self._snapshots.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key) -> None:
+        buffer = self._snapshots.pop(key)
+        self.total_bytes -= buffer.getbuffer().nbytes
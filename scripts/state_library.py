@@ -0,0 +1,217 @@
+"""
+A library of savestates to start episodes from, indexed by (world, stage, checkpoint x).
+
+The library is a directory of savestate files next to an index.json of their keys:
+
+    roms/mario/library/index.json
+    roms/mario/library/w1-2-x0.state
+    roms/mario/library/w1-2-x1024.state
+    ...
+
+The generator plays the game headless with the expert and saves a state whenever get_world/get_stage changes, and
+optionally every --checkpoint_every pixels of x position within a stage:
+
+    python3 state_library.py generate --max_steps 20000 --checkpoint_every 1024
+    python3 state_library.py list
+
+Only the index is read when the library is opened. A state file is read when an episode resets from it (its path
+becomes the environment's init_path), or memory-mapped by open_state for restoring it in-process:
+
+    python3 evaluate.py --agent mario_expert.py --library ../roms/mario/library --stages 1-2 2-1@1024
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_LIBRARY_PATH = f"{Path(__file__).parent.parent}/roms/mario/library"
+
+# "1-2" is the start of world 1 stage 2, "1-2@1024" the furthest checkpoint at or before x position 1024
+_STAGE_PATTERN = re.compile(r"^(\d+)-(\d+)(?:@(\d+))?$")
+
+
+def parse_stage(spec: str) -> tuple[int, int, int]:
+    """
+    Parses a "world-stage[@x]" spec into a (world, stage, x) key, x defaults to 0.
+    """
+    match = _STAGE_PATTERN.match(spec)
+    if match is None:
+        raise ValueError(f"Invalid stage {spec}, expected world-stage or world-stage@x, e.g. 1-2 or 1-2@1024")
+    world, stage, x_position = match.groups()
+    return int(world), int(stage), int(x_position or 0)
+
+
+def state_name(world: int, stage: int, x_position: int) -> str:
+    return f"w{world}-{stage}-x{x_position}.state"
+
+
+class StateLibrary:
+    """
+    The savestates of a library directory.
+
+    Args:
+        root (str): The library directory. Defaults to roms/mario/library.
+    """
+
+    def __init__(self, root: str = DEFAULT_LIBRARY_PATH) -> None:
+        self.root = root
+        self.index_path = f"{root}/index.json"
+
+        # (world, stage) -> sorted checkpoint x positions, and (world, stage, x) -> its index entry
+        self._checkpoints = {}
+        self._entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                for entry in json.load(file):
+                    self._add_entry(entry)
+
+    def _add_entry(self, entry: dict) -> None:
+        key = entry["world"], entry["stage"], entry["x"]
+        if key not in self._entries:
+            bisect.insort(self._checkpoints.setdefault(key[:2], []), key[2])
+        self._entries[key] = entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def keys(self) -> list[tuple[int, int, int]]:
+        return sorted(self._entries)
+
+    def stages(self) -> list[tuple[int, int]]:
+        return sorted(self._checkpoints)
+
+    def resolve(self, world: int, stage: int, x_position: int = 0) -> tuple[int, int, int]:
+        """
+        The key of the furthest checkpoint of (world, stage) at or before x_position, or its first checkpoint if all of
+        them are further. Raises KeyError if the library has no state of the stage.
+        """
+        checkpoints = self._checkpoints.get((world, stage))
+        if not checkpoints:
+            raise KeyError(f"No start state for world {world} stage {stage} in {self.root}")
+        index = max(bisect.bisect_right(checkpoints, x_position) - 1, 0)
+        return world, stage, checkpoints[index]
+
+    def path(self, world: int, stage: int, x_position: int = 0) -> str:
+        """
+        The savestate file of the resolved checkpoint, see resolve.
+        """
+        return f"{self.root}/{self._entries[self.resolve(world, stage, x_position)]['file']}"
+
+    def path_of(self, spec: str) -> str:
+        return self.path(*parse_stage(spec))
+
+    def open_state(self, world: int, stage: int, x_position: int = 0) -> mmap.mmap:
+        """
+        Memory-maps the savestate of the resolved checkpoint. The map is file-like, pass it to
+        MarioController.load_state_buffer, and close it when done.
+        """
+        with open(self.path(world, stage, x_position), "rb") as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def add(self, world: int, stage: int, x_position: int, pyboy, frame: int = None) -> str:
+        """
+        Saves the current state of pyboy as the (world, stage, x_position) checkpoint, replacing an existing one, and
+        returns its path.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        name = state_name(world, stage, x_position)
+        path = f"{self.root}/{name}"
+        with open(path, "wb") as file:
+            pyboy.save_state(file)
+
+        self._add_entry({"world": world, "stage": stage, "x": x_position, "file": name, "frame": frame})
+        self._write_index()
+        return path
+
+    def _write_index(self) -> None:
+        entries = [self._entries[key] for key in sorted(self._entries)]
+        # Written next to the index and moved over it, so an interrupted write never leaves a broken index
+        descriptor, temp_path = tempfile.mkstemp(dir=self.root, suffix=".json")
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            json.dump(entries, file, indent=2)
+        os.replace(temp_path, self.index_path)
+
+
+def generate(library: StateLibrary, max_steps: int, checkpoint_every: int = None, init_path: str = None) -> int:
+    """
+    Plays the expert headless from init_path (the default init state if None) and saves a state at the start of every
+    stage reached, plus every checkpoint_every pixels of x position within a stage. Returns the number of states saved.
+    """
+    from mario_expert import MarioExpert
+
+    with tempfile.TemporaryDirectory() as results_path:
+        expert = MarioExpert(results_path=results_path, headless=True)
+        environment = expert.environment
+        environment.set_turbo(True, render_frames=False)
+        if init_path is not None:
+            environment.init_path = init_path
+        environment.reset()
+
+        saved = 0
+        stage = None
+        next_checkpoint = None
+        for _ in range(max_steps):
+            if environment.get_game_over():
+                break
+
+            current = environment.get_world(), environment.get_stage()
+            x_position = environment.get_x_position()
+            if current != stage:
+                # A stage transition, the state is saved as the stage's x 0 checkpoint
+                stage = current
+                next_checkpoint = checkpoint_every
+                library.add(*stage, 0, environment.pyboy, environment.pyboy.frame_count)
+                saved += 1
+                logging.info(f"Saved world {stage[0]} stage {stage[1]} start")
+            elif checkpoint_every is not None and x_position >= next_checkpoint:
+                checkpoint = x_position // checkpoint_every * checkpoint_every
+                library.add(*stage, checkpoint, environment.pyboy, environment.pyboy.frame_count)
+                next_checkpoint = checkpoint + checkpoint_every
+                saved += 1
+                logging.info(f"Saved world {stage[0]} stage {stage[1]} x {checkpoint}")
+
+            expert.step()
+
+        environment.pyboy.stop(save=False)
+    return saved
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("command", type=str, choices=["generate", "list"])
+    parse_args.add_argument("--library", type=str, default=DEFAULT_LIBRARY_PATH)
+
+    parse_args.add_argument("--max_steps", type=int, default=20000)
+    parse_args.add_argument("--checkpoint_every", type=int, default=None)
+    parse_args.add_argument("--init_state", type=str, default=None)
+
+    return parse_args.parse_args()
+
+
+def main():
+    args = get_args()
+    library = StateLibrary(args.library)
+
+    if args.command == "generate":
+        saved = generate(library, args.max_steps, args.checkpoint_every, args.init_state)
+        logging.info(f"Saved {saved} states, the library has {len(library)}")
+        return
+
+    for world, stage, x_position in library.keys():
+        logging.info(f"{world}-{stage}@{x_position}: {library.path(world, stage, x_position)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Micro-benchmarks of the agent's hot code against fixture frames and a stubbed PyBoy (see fake_pyboy.py). The
+default fixture is synthetic, see fake_pyboy.py before comparing its numbers with real play.
+
+Measures the decision pipeline (scan_frame, fsm_transition, choose_action) in microseconds per decision and the
+environment wrapper (run_action, game_area, game_state, get_x_position) overhead per step, without the ROM.
+
+    python3 stub_benchmark.py run --save_baseline baseline.json
+    python3 stub_benchmark.py run --baseline baseline.json --tolerance 0.25
+
+The comparison run exits with status 1 if any metric is slower than its baseline by more than the tolerance.
+"rules" times the hand written FSM chain against the fsm_rules engine on the same frames and counts the decisions
+they disagree on:
+
+    python3 stub_benchmark.py rules --rules fsm_rules.json
+
+Record frames from the real game (needs the ROM) and benchmark them with:
+
+    python3 stub_benchmark.py record --steps 300 --name recorded_frames
+    python3 stub_benchmark.py run --name recorded_frames
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+
+import numpy as np
+from decision_cache import DecisionCache
+from fake_pyboy import FIXTURES_PATH, capture_frame, fake_pyboy, load_frames
+from fsm_rules import DEFAULT_RULES_PATH, RuleEngine
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _summary(samples_ns) -> dict[str, float]:
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1e3
+    return {
+        "mean_us": float(samples.mean()),
+        "p50_us": float(np.percentile(samples, 50)),
+        "p95_us": float(np.percentile(samples, 95)),
+    }
+
+
+def benchmark_decisions(expert, repeats):
+    """
+    Times choose_action on every recorded frame, per FSM state and overall.
+    """
+    pyboy = expert.environment.pyboy
+    frames = len(pyboy.frames)
+
+    samples = []
+    per_state = {}
+    for _ in range(repeats):
+        for index in range(frames):
+            pyboy.show_frame(index)
+            # A new frame number invalidates the per-tick caches, as a real tick would
+            pyboy.frame_count += 1
+
+            start = time.perf_counter_ns()
+            expert.choose_action()
+            elapsed = time.perf_counter_ns() - start
+
+            samples.append(elapsed)
+            per_state.setdefault(expert.current_state, []).append(elapsed)
+
+    result = _summary(samples)
+    result["states"] = {state: _summary(state_samples) for state, state_samples in per_state.items()}
+    return result
+
+
+def benchmark_environment(environment, steps):
+    """
+    Times one step of environment wrapper work: run_action, game_area, game_state and three get_x_position calls.
+    """
+    samples = []
+    for _ in range(steps):
+        start = time.perf_counter_ns()
+        environment.run_action(2, 10)
+        environment.game_area()
+        environment.game_state()
+        for _ in range(3):
+            environment.get_x_position()
+        samples.append(time.perf_counter_ns() - start)
+    return _summary(samples)
+
+
+def run(args):
+    frames = load_frames(args.name)
+
+    with fake_pyboy(frames), tempfile.TemporaryDirectory() as results_path:
+        from mario_expert import MarioExpert
+
+        expert = MarioExpert(results_path=results_path, headless=True)
+        expert.environment.set_turbo(args.turbo, render_frames=False)
+        if args.decision_cache > 0:
+            expert.decision_cache = DecisionCache(args.decision_cache, validate=args.validate_cache)
+
+        # Warm up caches and lazy imports
+        benchmark_decisions(expert, 1)
+
+        results = {
+            "frames": len(frames),
+            "decision": benchmark_decisions(expert, args.repeats),
+            "environment_step": benchmark_environment(expert.environment, args.repeats * len(frames)),
+        }
+        if expert.decision_cache is not None:
+            results["decision_cache"] = expert.decision_cache.stats()
+
+    logging.info(f"Decision: {results['decision']['mean_us']:.1f}us mean, {results['decision']['p95_us']:.1f}us p95")
+    for state, summary in sorted(results["decision"]["states"].items()):
+        logging.info(f"  {state:>15}: {summary['mean_us']:.1f}us mean")
+    logging.info(f"Environment step: {results['environment_step']['mean_us']:.1f}us mean")
+    if "decision_cache" in results:
+        logging.info(f"Decision cache: {results['decision_cache']}")
+
+    return results
+
+
+def benchmark_rules(args):
+    """
+    Times MarioExpert.decide with the hand written chain and with the rule engine, from every FSM state.
+    """
+    frames = load_frames(args.name)
+
+    with fake_pyboy(frames), tempfile.TemporaryDirectory() as results_path:
+        from mario_expert import MarioExpert
+
+        expert = MarioExpert(results_path=results_path, headless=True)
+        engine = RuleEngine(args.rules)
+        pyboy = expert.environment.pyboy
+
+        samples = {"chain": [], "rules": []}
+        mismatches = 0
+        for _ in range(args.repeats):
+            for index in range(len(frames)):
+                pyboy.show_frame(index)
+                pyboy.frame_count += 1
+                expert.scan_frame()
+
+                for state in expert.mario_state:
+                    expert.current_state = state
+                    decisions = {}
+                    for name, rules in (("chain", None), ("rules", engine)):
+                        expert.rules = rules
+                        start = time.perf_counter_ns()
+                        decisions[name] = expert.decide()
+                        samples[name].append(time.perf_counter_ns() - start)
+                    mismatches += decisions["chain"] != decisions["rules"]
+
+    results = {name: _summary(name_samples) for name, name_samples in samples.items()}
+    results["mismatches"] = mismatches
+    for name in samples:
+        logging.info(f"{name}: {results[name]['mean_us']:.2f}us mean, {results[name]['p95_us']:.2f}us p95")
+    logging.info(f"{mismatches}/{len(samples['chain'])} decisions differ")
+    return results
+
+
+def _metrics(results) -> dict[str, float]:
+    return {
+        "decision": results["decision"]["mean_us"],
+        "environment_step": results["environment_step"]["mean_us"],
+    }
+
+
+def compare(results, baseline, tolerance) -> bool:
+    """
+    Logs every metric against its baseline and returns False if any regressed by more than tolerance.
+    """
+    passed = True
+    current = _metrics(results)
+    for metric, baseline_us in _metrics(baseline).items():
+        ratio = current[metric] / baseline_us if baseline_us > 0 else 0.0
+        regressed = ratio > 1.0 + tolerance
+        passed = passed and not regressed
+        logging.info(
+            f"{metric}: {current[metric]:.1f}us vs baseline {baseline_us:.1f}us ({ratio:.2f}x)"
+            f"{' REGRESSION' if regressed else ''}"
+        )
+    return passed
+
+
+def record(args):
+    """
+    Records frames in the fixture format while the expert plays the real game.
+    """
+    from mario_expert import MarioExpert
+
+    frames = []
+    with tempfile.TemporaryDirectory() as results_path:
+        expert = MarioExpert(results_path=results_path, headless=True)
+        environment = expert.environment
+        environment.set_turbo(True, render_frames=False)
+        environment.reset()
+
+        while len(frames) < args.steps and not environment.get_game_over():
+            frames.append(capture_frame(environment.pyboy, environment.game_area()))
+            expert.step()
+
+        environment.pyboy.stop(save=False)
+
+    path = f"{FIXTURES_PATH}/{args.name}.json"
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(frames, file, separators=(",", ":"))
+    logging.info(f"Recorded {len(frames)} frames into {path}")
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("command", type=str, choices=["run", "rules", "record"])
+
+    parse_args.add_argument("--name", type=str, default="game_frames")
+    parse_args.add_argument("--repeats", type=int, default=200)
+    parse_args.add_argument("--steps", type=int, default=300)
+    parse_args.add_argument("--turbo", action="store_true")
+    parse_args.add_argument("--decision_cache", type=int, default=0)
+    parse_args.add_argument("--validate_cache", action="store_true")
+    parse_args.add_argument("--rules", type=str, default=DEFAULT_RULES_PATH)
+
+    parse_args.add_argument("--save_baseline", type=str, default=None)
+    parse_args.add_argument("--baseline", type=str, default=None)
+    parse_args.add_argument("--tolerance", type=float, default=0.25)
+
+    return parse_args.parse_args()
+
+
+def main():
+    args = get_args()
+
+    if args.command == "record":
+        record(args)
+        return
+    if args.command == "rules":
+        if benchmark_rules(args)["mismatches"] > 0:
+            sys.exit(1)
+        return
+
+    results = run(args)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        logging.info(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Hyperparameter sweeps over the FSM's numeric parameters (the "params" of fsm_rules.json: hold_freqs, distance
+thresholds and the special case x window, plus the enemy tracker's timings with --enemy_tracker).
+
+Every configuration plays headless turbo episodes from the given start states in a process pool. Each worker keeps
+one emulator alive and resets it from the in-memory savestate cache, and an episode stops at game over, at Mario's
+first death or after max_steps actions. Configurations are ranked with compare_performance (world, stage, score),
+ties broken by the furthest x position reached.
+
+Search strategies:
+
+    grid      every combination of the parameter space
+    random    --samples configurations drawn from the space
+    halving   successive halving: --samples random configurations get --min_steps actions, the best 1/eta get eta
+              times as many, and so on up to --max_steps
+
+Every finished episode is appended to sweep.jsonl in the output directory and already evaluated (configuration, start
+state, steps) episodes are skipped, so an interrupted sweep picks up where it left off when run again with the same
+arguments.
+
+    python3 sweep.py halving --samples 27 --workers 8
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import cmp_to_key
+from pathlib import Path
+
+from compare_results import compare_performance
+from fsm_rules import DEFAULT_RULES_PATH
+
+logging.basicConfig(level=logging.INFO)
+
+# Candidate values of every swept parameter, the defaults of fsm_rules.json included
+DEFAULT_SPACE = {
+    "hold_default": [1, 10, 15],
+    "hold_obstacle": [10, 15, 30],
+    "hold_gap": [15, 30, 100],
+    "hold_enemy": [10, 15, 30],
+    "hold_bug": [10, 15, 30],
+    "hold_goomba_above": [1, 10],
+    "hold_under_goomba": [30, 100],
+    "enemy_ahead": [2, 3, 4],
+    "bug_ahead": [2, 3, 4],
+    "wall_ahead": [4, 6, 8],
+    "under_goomba_x_min": [1660, 1670],
+    "under_goomba_x_max": [1680, 1690],
+}
+
+# The enemy tracker's params, only swept with --enemy_tracker
+TRACKER_SPACE = {
+    "enemy_jump_frames": [10, 20, 30],
+    "hold_step_back": [1, 5],
+}
+
+# The emulator, rule file and default init state of a pool worker, see _init_worker
+_expert = None
+_rules_path = None
+_default_init_path = None
+
+
+def config_id(config: dict) -> str:
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def grid_configs(space: dict) -> list[dict]:
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space: dict, samples: int, seed: int) -> list[dict]:
+    """
+    Draws up to samples distinct configurations, the same ones for the same seed.
+    """
+    rng = random.Random(seed)
+    names = sorted(space)
+    total = 1
+    for name in names:
+        total *= len(space[name])
+
+    configs = {}
+    while len(configs) < min(samples, total):
+        config = {name: rng.choice(space[name]) for name in names}
+        configs[config_id(config)] = config
+    return list(configs.values())
+
+
+def _init_worker(rules_path: str, enemy_tracker: bool = False) -> None:
+    global _expert, _rules_path, _default_init_path
+    import tempfile
+
+    from mario_expert import MarioExpert
+
+    _expert = MarioExpert(results_path=tempfile.mkdtemp(prefix="sweep-"), headless=True)
+    _expert.environment.set_turbo(True, render_frames=False)
+    _rules_path = rules_path
+    _default_init_path = _expert.environment.init_path
+    if enemy_tracker:
+        from enemy_tracker import EnemyTracker
+
+        _expert.enemy_tracker = EnemyTracker(_expert.environment.pyboy.game_wrapper.mapping_compressed)
+
+
+def _run_episode(config: dict, start_state: str, max_steps: int, stop_on_death: bool) -> dict:
+    """
+    Plays one episode in a pool worker and returns its final game_state with the furthest x position reached.
+    """
+    from fsm_rules import RuleEngine
+
+    expert = _expert
+    environment = expert.environment
+
+    expert.rules = RuleEngine(_rules_path, params=config)
+    expert.current_state = "DEFAULT"
+    expert.decoder.reset()
+    if expert.enemy_tracker is not None:
+        expert.enemy_tracker.reset()
+
+    # Every start state is read from disk once per worker, later episodes restore it from the snapshot cache
+    key = ("sweep_start", start_state)
+    if key in environment.snapshots:
+        environment.restore_snapshot(key)
+    else:
+        # None is the worker's default start, not whichever state the previous episode started from
+        environment.init_path = start_state if start_state is not None else _default_init_path
+        environment.reset()
+        environment.save_snapshot(key)
+
+    lives = environment.get_lives()
+    max_x = environment.get_x_position()
+    steps = 0
+    died = False
+    while steps < max_steps and not environment.get_game_over():
+        expert.step()
+        steps += 1
+        max_x = max(max_x, environment.get_x_position())
+        if environment.get_lives() < lives:
+            died = True
+            if stop_on_death:
+                break
+
+    result = environment.game_state()
+    result.update({"max_x": max_x, "steps": steps, "died": died})
+    return result
+
+
+class Sweep:
+    """
+    Runs and persists the episodes of a sweep.
+
+    Args:
+        output_path (str): The directory sweep.jsonl and best.json are written to.
+        start_states (list[str]): The start states every configuration is played from, None for the default.
+        workers (int): The number of worker processes.
+        rules_path (str): The rule file the swept params are applied to. Defaults to fsm_rules.json.
+        stop_on_death (bool): Whether episodes end at Mario's first death. Defaults to True.
+        enemy_tracker (bool): Whether the experts track enemies (see enemy_tracker.py). Defaults to False.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        start_states: list,
+        workers: int,
+        rules_path: str = DEFAULT_RULES_PATH,
+        stop_on_death: bool = True,
+        enemy_tracker: bool = False,
+    ) -> None:
+        self.output_path = output_path
+        self.start_states = [os.path.abspath(state) if state else None for state in start_states]
+        self.workers = workers
+        self.rules_path = os.path.abspath(rules_path)
+        self.stop_on_death = stop_on_death
+        self.enemy_tracker = enemy_tracker
+
+        os.makedirs(output_path, exist_ok=True)
+        self.store_path = f"{output_path}/sweep.jsonl"
+
+        # Everything besides the configuration an episode's result depends on, stored with every record so a sweep
+        # re-run into the same directory with other settings does not reuse its episodes
+        self.settings = {
+            "rules_path": self.rules_path,
+            "stop_on_death": stop_on_death,
+            "enemy_tracker": enemy_tracker,
+        }
+
+        # (config id, start state, max_steps, settings) -> episode record
+        self.records = {}
+        if os.path.exists(self.store_path):
+            with open(self.store_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        record = json.loads(line)
+                        settings = {name: record.get(name) for name in self.settings}
+                        key = self._key(record["config_id"], record["start_state"], record["max_steps"], settings)
+                        self.records[key] = record
+            settings = tuple(self.settings.values())
+            current = sum(key[3] == settings for key in self.records)
+            logging.info(
+                f"Resuming sweep with {current} finished episodes from {self.store_path} "
+                f"({len(self.records) - current} more were run with other settings)"
+            )
+
+    def _key(self, identifier: str, start_state: str, max_steps: int, settings: dict = None) -> tuple:
+        settings = self.settings if settings is None else settings
+        return identifier, start_state, max_steps, tuple(settings[name] for name in self.settings)
+
+    def evaluate(self, configs: list[dict], max_steps: int) -> list[dict]:
+        """
+        Plays every configuration from every start state for up to max_steps actions and returns one aggregated
+        result per configuration, best first.
+        """
+        pending = []
+        for config in configs:
+            for start_state in self.start_states:
+                if self._key(config_id(config), start_state, max_steps) not in self.records:
+                    pending.append((config, start_state))
+
+        logging.info(f"{len(configs)} configurations at {max_steps} steps: {len(pending)} episodes to run")
+
+        if pending:
+            context = mp.get_context("spawn")
+            with open(self.store_path, "a", encoding="utf-8") as store, ProcessPoolExecutor(
+                self.workers, mp_context=context, initializer=_init_worker, initargs=(self.rules_path, self.enemy_tracker)
+            ) as pool:
+                futures = {
+                    pool.submit(_run_episode, config, start_state, max_steps, self.stop_on_death): (config, start_state)
+                    for config, start_state in pending
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    config, start_state = futures[future]
+                    record = {
+                        "config_id": config_id(config),
+                        "config": config,
+                        "start_state": start_state,
+                        "max_steps": max_steps,
+                        **self.settings,
+                        **future.result(),
+                    }
+                    self.records[self._key(record["config_id"], start_state, max_steps)] = record
+
+                    store.write(json.dumps(record) + "\n")
+                    store.flush()
+                    logging.info(
+                        f"[{done}/{len(pending)}] {record['config_id']}: world {record['world']} stage "
+                        f"{record['stage']} score {record['score']} x {record['max_x']}"
+                    )
+
+        return self.rank([self._aggregate(config, max_steps) for config in configs])
+
+    def _aggregate(self, config: dict, max_steps: int) -> dict:
+        """
+        Combines a configuration's episodes: the least progress made (world, stage) and the summed score and x.
+        """
+        episodes = [self.records[self._key(config_id(config), state, max_steps)] for state in self.start_states]
+        progress = min((episode["world"], episode["stage"]) for episode in episodes)
+        return {
+            "config_id": config_id(config),
+            "config": config,
+            "max_steps": max_steps,
+            "world": progress[0],
+            "stage": progress[1],
+            "score": sum(episode["score"] for episode in episodes),
+            "max_x": sum(episode["max_x"] for episode in episodes),
+            "deaths": sum(episode["died"] for episode in episodes),
+        }
+
+    @staticmethod
+    def rank(results: list[dict]) -> list[dict]:
+        # Stable sorts, so max_x only breaks compare_performance ties
+        results = sorted(results, key=lambda result: result["max_x"], reverse=True)
+        return sorted(results, key=cmp_to_key(compare_performance))
+
+    def successive_halving(self, configs: list[dict], min_steps: int, max_steps: int, eta: int) -> list[dict]:
+        steps = min_steps
+        while True:
+            ranked = self.evaluate(configs, steps)
+            if steps >= max_steps or len(configs) <= 1:
+                return ranked
+            keep = max(len(configs) // eta, 1)
+            configs = [result["config"] for result in ranked[:keep]]
+            steps = min(steps * eta, max_steps)
+
+    def write_best(self, ranked: list[dict]) -> None:
+        with open(f"{self.output_path}/best.json", "w", encoding="utf-8") as file:
+            json.dump(ranked[0], file, indent=2)
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("strategy", type=str, choices=["grid", "random", "halving"])
+
+    # JSON object of {param: [values]}, defaults to DEFAULT_SPACE (and TRACKER_SPACE with --enemy_tracker)
+    parse_args.add_argument("--space", type=str, default=None)
+    parse_args.add_argument("--rules", type=str, default=DEFAULT_RULES_PATH)
+    parse_args.add_argument("--enemy_tracker", action="store_true")
+
+    parse_args.add_argument("--samples", type=int, default=27)
+    parse_args.add_argument("--seed", type=int, default=0)
+    parse_args.add_argument("--min_steps", type=int, default=200)
+    parse_args.add_argument("--max_steps", type=int, default=2000)
+    parse_args.add_argument("--eta", type=int, default=3)
+
+    parse_args.add_argument("--start_states", type=str, nargs="+", default=[None])
+    parse_args.add_argument("--keep_playing", action="store_true", help="Play on after a death until game over")
+
+    parse_args.add_argument("--workers", type=int, default=os.cpu_count())
+    parse_args.add_argument("-o", "--output_path", type=str, default=f"{Path(__file__).parent.parent}/results/sweep")
+
+    return parse_args.parse_args()
+
+
+def main():
+    args = get_args()
+
+    space = {**DEFAULT_SPACE, **TRACKER_SPACE} if args.enemy_tracker else DEFAULT_SPACE
+    if args.space is not None:
+        with open(args.space, "r", encoding="utf-8") as file:
+            space = json.load(file)
+
+    sweep = Sweep(
+        args.output_path,
+        args.start_states,
+        args.workers,
+        args.rules,
+        stop_on_death=not args.keep_playing,
+        enemy_tracker=args.enemy_tracker,
+    )
+
+    if args.strategy == "grid":
+        ranked = sweep.evaluate(grid_configs(space), args.max_steps)
+    elif args.strategy == "random":
+        ranked = sweep.evaluate(random_configs(space, args.samples, args.seed), args.max_steps)
+    else:
+        configs = random_configs(space, args.samples, args.seed)
+        ranked = sweep.successive_halving(configs, args.min_steps, args.max_steps, args.eta)
+
+    for i, result in enumerate(ranked[:10]):
+        logging.info(
+            f"Rank {i + 1}: {result['config_id']} - World: {result['world']} Stage: {result['stage']} "
+            f"Score: {result['score']} x: {result['max_x']} {json.dumps(result['config'], sort_keys=True)}"
+        )
+
+    sweep.write_best(ranked)
+
+
+if __name__ == "__main__":
+    main()
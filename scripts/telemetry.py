@@ -0,0 +1,283 @@
+"""
+Per-step telemetry of MarioExpert episodes.
+
+TelemetryRecorder buffers one row per step (x position, FSM state, action, hold_freq, lives, score, timers and the step
+latency) in preallocated NumPy arrays and flushes them in chunks of columns: as row groups of telemetry.parquet when
+pyarrow is installed, otherwise as telemetry.partN.npz files that are merged into one uncompressed telemetry.npz when
+the episode ends. Chunks of an episode that never finished are still readable.
+
+TelemetryStore memory-maps the columns of any number of episodes (members of uncompressed npz files are mapped in
+place, parquet files through pyarrow's memory map) for aggregate queries across runs:
+
+    python3 run.py --upi your_upi --telemetry
+    python3 telemetry.py ../results --bin 64
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logging.basicConfig(level=logging.INFO)
+
+COLUMNS = {
+    "step": np.int32,
+    "frame": np.int64,
+    "world": np.uint8,
+    "stage": np.uint8,
+    "x_position": np.int32,
+    "state": np.uint8,
+    "action": np.int8,
+    "hold_freq": np.uint16,
+    "lives": np.uint8,
+    "score": np.int32,
+    "time": np.uint16,
+    "dead_timer": np.uint8,
+    "dead_jump_timer": np.uint8,
+    "latency_us": np.float32,
+}
+
+NPZ = "npz"
+PARQUET = "parquet"
+
+
+class TelemetryRecorder:
+    """
+    Records one row per MarioExpert.step once attached as the expert's telemetry.
+
+    Args:
+        path (str): The file path without extension, e.g. results/upi/telemetry.
+        states (list[str]): The FSM states, rows store the index of the state.
+        chunk_size (int): The number of rows buffered between flushes. Defaults to 4096.
+        file_format (str): "parquet", "npz" or None for parquet if pyarrow is installed, else npz. Defaults to None.
+    """
+
+    def __init__(self, path: str, states: list[str], chunk_size: int = 4096, file_format: str = None) -> None:
+        if file_format is None:
+            file_format = PARQUET if pq is not None else NPZ
+        if file_format == PARQUET and pq is None:
+            raise ValueError("The parquet telemetry format needs pyarrow")
+
+        self.path = path
+        self.states = list(states)
+        self.state_ids = {state: state_id for state_id, state in enumerate(self.states)}
+        self.chunk_size = chunk_size
+        self.file_format = file_format
+
+        self.rows = 0
+        self._chunks = 0
+        self._size = 0
+        self._columns = {name: np.zeros(chunk_size, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._writer = None
+
+    def record(self, expert, state: str, action: int, hold_freq: int, latency_ns: int) -> None:
+        """
+        Adds the game state after a step of expert, which decided (action, hold_freq) in FSM state and took latency_ns.
+        """
+        ram = expert.environment.ram_snapshot()
+        columns = self._columns
+        i = self._size
+
+        columns["step"][i] = self.rows
+        columns["frame"][i] = ram.frame
+        columns["world"][i] = ram.world
+        columns["stage"][i] = ram.stage
+        columns["x_position"][i] = ram.x_position
+        columns["state"][i] = self.state_ids.get(state, 255)
+        columns["action"][i] = action
+        columns["hold_freq"][i] = hold_freq
+        columns["lives"][i] = ram.lives
+        columns["score"][i] = ram.score
+        columns["time"][i] = ram.time
+        columns["dead_timer"][i] = ram.dead_timer
+        columns["dead_jump_timer"][i] = ram.dead_jump_timer
+        columns["latency_us"][i] = latency_ns / 1e3
+
+        self.rows += 1
+        self._size += 1
+        if self._size == self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._size == 0:
+            return
+
+        chunk = {name: column[: self._size] for name, column in self._columns.items()}
+        if self.file_format == PARQUET:
+            table = pa.table(chunk)
+            if self._writer is None:
+                schema = table.schema.with_metadata({"states": json.dumps(self.states)})
+                self._writer = pq.ParquetWriter(f"{self.path}.parquet", schema)
+            self._writer.write_table(table.replace_schema_metadata(self._writer.schema.metadata))
+        else:
+            np.savez(f"{self.path}.part{self._chunks}.npz", **chunk)
+
+        self._chunks += 1
+        self._size = 0
+
+    def close(self) -> None:
+        """
+        Flushes the remaining rows and, for npz, merges the chunks into telemetry.npz.
+        """
+        self.flush()
+        if self.file_format == PARQUET:
+            if self._writer is not None:
+                self._writer.close()
+            return
+
+        parts = [f"{self.path}.part{chunk}.npz" for chunk in range(self._chunks)]
+        columns = {name: [] for name in COLUMNS}
+        for part in parts:
+            with np.load(part) as data:
+                for name in COLUMNS:
+                    columns[name].append(data[name])
+
+        merged = {
+            name: np.concatenate(chunks) if chunks else np.zeros(0, dtype=COLUMNS[name])
+            for name, chunks in columns.items()
+        }
+        np.savez(f"{self.path}.npz", states=np.array(self.states), **merged)
+        for part in parts:
+            os.remove(part)
+
+
+def _read_npy_header(file):
+    version = np.lib.format.read_magic(file)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(file)
+    return np.lib.format.read_array_header_2_0(file)
+
+
+def mmap_npz(path: str) -> dict[str, np.ndarray]:
+    """
+    Maps the members of an uncompressed npz file in place. Compressed members are read into memory.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as file:
+        for info in archive.infolist():
+            name = info.filename[: -len(".npy")] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+
+            # The member data follows its local file header (30 bytes, then the file name and extra field)
+            file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", file.read(4))
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            shape, fortran_order, dtype = _read_npy_header(file)
+
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                order = "F" if fortran_order else "C"
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=file.tell(), shape=shape, order=order)
+    return arrays
+
+
+class TelemetryStore:
+    """
+    The telemetry of every episode below a directory.
+
+    Args:
+        root (str): The directory searched recursively for telemetry files.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.episodes = {}
+        for path in sorted(glob.glob(f"{root}/**/telemetry*", recursive=True)):
+            episode = os.path.relpath(os.path.dirname(path), root)
+            if path.endswith(".parquet") and pq is not None:
+                self.episodes[episode] = self._load_parquet(path)
+            elif path.endswith(".npz") and ".part" not in os.path.basename(path):
+                self.episodes[episode] = mmap_npz(path)
+
+        # Episodes that did not finish only have their chunks
+        for path in sorted(glob.glob(f"{root}/**/telemetry.part*.npz", recursive=True)):
+            episode = os.path.relpath(os.path.dirname(path), root)
+            if episode in self.episodes and "states" in self.episodes[episode]:
+                continue
+            chunk = mmap_npz(path)
+            columns = self.episodes.setdefault(episode, {name: [] for name in COLUMNS})
+            for name in COLUMNS:
+                columns[name].append(chunk[name])
+        for episode, columns in self.episodes.items():
+            for name in COLUMNS:
+                if isinstance(columns[name], list):
+                    columns[name] = np.concatenate(columns[name])
+
+    @staticmethod
+    def _load_parquet(path: str) -> dict[str, np.ndarray]:
+        table = pq.read_table(path, memory_map=True)
+        columns = {name: table.column(name).to_numpy() for name in table.column_names}
+        if table.schema.metadata and b"states" in table.schema.metadata:
+            columns["states"] = np.array(json.loads(table.schema.metadata[b"states"]))
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.episodes)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        The column across every episode, concatenated.
+        """
+        return np.concatenate([columns[name] for columns in self.episodes.values()])
+
+    def death_positions(self) -> np.ndarray:
+        """
+        The x position of the last step before every lost life, across every episode.
+        """
+        positions = []
+        for columns in self.episodes.values():
+            lives = columns["lives"].astype(np.int16)
+            died = np.flatnonzero(lives[1:] < lives[:-1])
+            positions.append(np.asarray(columns["x_position"][died]))
+        return np.concatenate(positions) if positions else np.zeros(0, dtype=np.int32)
+
+    def deaths_by_x(self, bin_size: int = 64) -> dict[int, int]:
+        """
+        The number of deaths per bin_size wide x position bin, keyed by the start of the bin.
+        """
+        bins = self.death_positions() // bin_size * bin_size
+        values, counts = np.unique(bins, return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+
+def get_args():
+    parse_args = argparse.ArgumentParser()
+
+    parse_args.add_argument("root", type=str)
+
+    parse_args.add_argument("--bin", type=int, default=64)
+
+    return parse_args.parse_args()
+
+
+def main():
+    args = get_args()
+
+    store = TelemetryStore(args.root)
+    steps = sum(len(columns["step"]) for columns in store.episodes.values())
+    logging.info(f"Loaded {len(store)} episodes, {steps} steps")
+
+    if steps:
+        latency = store.column("latency_us")
+        logging.info(f"Step latency: {latency.mean():.1f}us mean, {np.percentile(latency, 95):.1f}us p95")
+
+    for x_position, deaths in sorted(store.deaths_by_x(args.bin).items()):
+        logging.info(f"x {x_position:>5}-{x_position + args.bin - 1:<5}: {deaths} deaths")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Structured tracing for the agent step loop.
+
+Each category (grid, fsm, action, timing) has its own level: 0 is off, 1 records the essentials and 2 is verbose. Call
+sites check the category level before building a record, so a disabled tracer costs one attribute lookup:
+
+    if self.tracer.fsm:
+        self.tracer.emit("fsm", state=self.current_state)
+
+Enabled records are written as JSON lines by a background thread in batches. Only the main thread writes into the
+batch: a worker thread calls defer first, its records are collected and replayed on the main thread (see pipeline.py).
+"""
+
+import json
+import queue
+import sys
+import threading
+import time
+
+CATEGORIES = ["grid", "fsm", "action", "timing"]
+
+_STOP = None
+
+
+def parse_levels(spec: str) -> dict[str, int]:
+    """
+    Parses a "grid,fsm=2,action" style specification into {category: level}. "all" enables every category.
+    """
+    levels = {}
+    if not spec:
+        return levels
+
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        level = int(level) if level else 1
+        names = CATEGORIES if name == "all" else [name]
+        for category in names:
+            if category not in CATEGORIES:
+                raise ValueError(f"Unknown trace category {category}, expected one of {CATEGORIES}")
+            levels[category] = level
+    return levels
+
+
+class Tracer:
+    """
+    Buffers trace records and writes them as JSON lines from a background thread.
+
+    Args:
+        path (str): The file to write to, "-" for stdout.
+        levels (dict[str, int]): The level of each category, missing categories are off.
+        batch_size (int): The number of records handed to the writer thread at a time. Defaults to 256.
+    """
+
+    def __init__(self, path: str, levels: dict[str, int], batch_size: int = 256) -> None:
+        self.grid = levels.get("grid", 0)
+        self.fsm = levels.get("fsm", 0)
+        self.action = levels.get("action", 0)
+        self.timing = levels.get("timing", 0)
+
+        self.step = 0
+        self.batch_size = batch_size
+        self._buffer = []
+        self._deferred = threading.local()
+
+        self._file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._write, name="tracer", daemon=True)
+        self._thread.start()
+
+    def next_step(self) -> None:
+        self.step += 1
+
+    def emit(self, category: str, **fields) -> None:
+        fields["category"] = category
+        fields["time"] = time.monotonic()
+
+        deferred = getattr(self._deferred, "records", None)
+        if deferred is not None:
+            deferred.append(fields)
+            return
+
+        fields["step"] = self.step
+        self._buffer.append(fields)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def defer(self) -> None:
+        """
+        Holds back the records the calling thread emits until collect.
+        """
+        self._deferred.records = []
+
+    def collect(self) -> list[dict]:
+        records = self._deferred.records
+        self._deferred.records = None
+        return records
+
+    def replay(self, records: list[dict]) -> None:
+        """
+        Emits records collected on another thread, tagged with the current step.
+        """
+        for fields in records:
+            fields["step"] = self.step
+            self._buffer.append(fields)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._queue.put(self._buffer)
+            self._buffer = []
+
+    def close(self) -> None:
+        self.flush()
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._file is not sys.stdout:
+            self._file.close()
+
+    def _write(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is _STOP:
+                break
+            self._file.write("".join(json.dumps(record) + "\n" for record in batch))
+        self._file.flush()
+
+
+class NullTracer:
+    """
+    The tracer used when tracing is off. Every category is disabled and every method does nothing.
+    """
+
+    grid = 0
+    fsm = 0
+    action = 0
+    timing = 0
+    step = 0
+
+    def next_step(self) -> None:
+        pass
+
+    def emit(self, category: str, **fields) -> None:
+        pass
+
+    def defer(self) -> None:
+        pass
+
+    def collect(self) -> list[dict]:
+        return []
+
+    def replay(self, records: list[dict]) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+NULL_TRACER = NullTracer()
@@ -0,0 +1,238 @@
+"""
+Gymnasium-style vectorized environment running several headless MarioControllers in worker processes.
+
+Observations (game area grids and optionally native RGB frames), rewards and termination flags are written by the
+workers straight into multiprocessing.shared_memory arrays, so only the commands and the small info dicts go through
+the pipes.
+
+    env = VectorMarioEnv(4)
+    observations, infos = env.reset()
+    observations, rewards, terminated, truncated, infos = env.step([2, 2, 4, 6])
+    env.close()
+"""
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+GRID_SHAPE = (16, 20)
+FRAME_SHAPE = (144, 160, 3)
+
+
+def _create_array(shape, dtype):
+    dtype = np.dtype(dtype)
+    memory = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _attach_array(name, shape, dtype):
+    # Workers share the parent's resource tracker, the parent unlinks the block in close
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+
+
+def _worker(index, conn, layout, options):
+    blocks = {}
+    arrays = {}
+    for key, (name, shape, dtype) in layout.items():
+        blocks[key], arrays[key] = _attach_array(name, shape, dtype)
+
+    try:
+        _serve(index, conn, arrays, options)
+    finally:
+        arrays.clear()
+        for block in blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                # Still referenced by a traceback, the block is released when the process exits
+                pass
+        conn.close()
+
+
+def _serve(index, conn, arrays, options):
+    # Imported here so the parent process does not need an emulator
+    from mario_expert import MarioController
+
+    grids = arrays["grids"][index]
+    rewards = arrays["rewards"]
+    terminated = arrays["terminated"]
+    frames = arrays["frames"][index] if "frames" in arrays else None
+
+    environment = MarioController(headless=True, turbo=True)
+    environment.set_turbo(True, render_frames=frames is not None)
+
+    def observe():
+        np.copyto(grids, environment.game_area(), casting="unsafe")
+        if frames is not None:
+            np.copyto(frames, environment.screen.ndarray[:, :, :3])
+        return {
+            "x_position": environment.get_x_position(),
+            "score": environment.get_score(),
+            "lives": environment.get_lives(),
+        }
+
+    try:
+        while True:
+            command, data = conn.recv()
+
+            if command == "step":
+                action, hold_freq = data
+                x_position = environment.get_x_position()
+                score = environment.get_score()
+
+                environment.run_action(action, hold_freq)
+
+                reward = environment.get_x_position() - x_position
+                reward += options["score_weight"] * (environment.get_score() - score)
+                rewards[index] = reward
+
+                done = environment.get_game_over()
+                terminated[index] = done
+                final_info = environment.game_state() if done else None
+                if done:
+                    environment.reset()
+
+                info = observe()
+                if final_info is not None:
+                    info["final_info"] = final_info
+                conn.send(info)
+
+            elif command == "reset":
+                environment.reset()
+                rewards[index] = 0.0
+                terminated[index] = False
+                conn.send(observe())
+
+            elif command == "close":
+                break
+    finally:
+        environment.pyboy.stop(save=False)
+
+
+class VectorMarioEnv:
+    """
+    N headless MarioControllers stepped in lockstep.
+
+    The reward of a step is the change in x position plus score_weight times the change in score. Environments reset
+    automatically when get_game_over becomes true - the returned observation is then the first one of the new episode
+    and the final game_state is in that environment's info under "final_info".
+
+    The returned arrays are views of shared memory and are overwritten by the next step/reset, copy them to keep them.
+
+    Args:
+        num_envs (int): The number of environments/worker processes.
+        frames (bool): Whether observations include native 144x160 RGB frames. Defaults to False.
+        hold_freq (int): The hold_freq used when step is only given actions. Defaults to 10.
+        score_weight (float): Reward of one point of score relative to one pixel of x progress. Defaults to 0.01.
+        start_method (str): The multiprocessing start method. Defaults to "spawn".
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        frames: bool = False,
+        hold_freq: int = 10,
+        score_weight: float = 0.01,
+        start_method: str = "spawn",
+    ) -> None:
+        self.num_envs = num_envs
+        self.hold_freq = hold_freq
+
+        self._blocks = {}
+        self._layout = {}
+        arrays = {
+            "grids": ((num_envs, *GRID_SHAPE), np.uint8),
+            "rewards": ((num_envs,), np.float32),
+            "terminated": ((num_envs,), np.bool_),
+        }
+        if frames:
+            arrays["frames"] = ((num_envs, *FRAME_SHAPE), np.uint8)
+
+        for key, (shape, dtype) in arrays.items():
+            block, array = _create_array(shape, dtype)
+            self._blocks[key] = block
+            self._layout[key] = (block.name, shape, np.dtype(dtype).str)
+            setattr(self, key, array)
+        if not frames:
+            self.frames = None
+
+        self.truncated = np.zeros(num_envs, dtype=np.bool_)
+
+        context = mp.get_context(start_method)
+        options = {"score_weight": score_weight}
+
+        self._connections = []
+        self._processes = []
+        for index in range(num_envs):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker, args=(index, child_conn, self._layout, options), daemon=True
+            )
+            process.start()
+            child_conn.close()
+
+            self._connections.append(parent_conn)
+            self._processes.append(process)
+
+        self.closed = False
+
+    def _observations(self):
+        if self.frames is None:
+            return self.grids
+        return {"game_area": self.grids, "frames": self.frames}
+
+    def reset(self):
+        """
+        Resets every environment and returns (observations, infos).
+        """
+        for conn in self._connections:
+            conn.send(("reset", None))
+        infos = [conn.recv() for conn in self._connections]
+        return self._observations(), infos
+
+    def step(self, actions, hold_freqs=None):
+        """
+        Runs one action in every environment and returns (observations, rewards, terminated, truncated, infos).
+
+        Args:
+            actions (list[int]): One action (0-6, see rules.txt) per environment.
+            hold_freqs (list[int]): Optional hold_freq per environment, defaults to the environment's hold_freq.
+        """
+        if hold_freqs is None:
+            hold_freqs = [self.hold_freq] * self.num_envs
+
+        for conn, action, hold_freq in zip(self._connections, actions, hold_freqs):
+            conn.send(("step", (int(action), int(hold_freq))))
+        infos = [conn.recv() for conn in self._connections]
+
+        return self._observations(), self.rewards, self.terminated, self.truncated, infos
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        for conn in self._connections:
+            try:
+                conn.send(("close", None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+        # The arrays have to go before the shared memory they point into can be closed
+        self.grids = self.rewards = self.terminated = self.frames = None
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,160 @@
+"""
+Background video encoding for MarioExpert.play.
+
+Frames are handed to an encoder thread through a bounded queue of pre-allocated frame buffers, so mp4v encoding runs
+alongside the game loop instead of inside it. OpenCV releases the GIL while encoding. An exception on the encoder
+thread stops it and is raised again from the next acquire, write or release call.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# What to do when every frame buffer is waiting to be encoded
+BLOCK = "block"  # wait for the encoder to catch up (no frames lost)
+DROP_NEWEST = "drop_newest"  # skip the incoming frame
+DROP_OLDEST = "drop_oldest"  # overwrite the oldest frame that has not been encoded yet
+
+DROP_POLICIES = [BLOCK, DROP_NEWEST, DROP_OLDEST]
+
+_STOP = None
+
+
+class AsyncVideoWriter:
+    """
+    A drop-in replacement for cv2.VideoWriter that encodes on a background thread.
+
+    Frames can either be passed to write (which copies them into a free buffer) or written straight into a buffer
+    obtained from acquire and handed back with submit, which avoids any per-frame allocation.
+
+    Args:
+        video_name (str): The path of the video file to write.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        fps (int): Frames per second of the output video. Defaults to 30.
+        queue_size (int): Number of pre-allocated frame buffers. Defaults to 64.
+        policy (str): One of DROP_POLICIES, applied when all buffers are in use. Defaults to "block".
+        profiler (StageProfiler): Optional profiler the encoding time is recorded with as the "video_encode" stage, on
+            the main thread when the writer is released.
+    """
+
+    def __init__(
+        self,
+        video_name: str,
+        width: int,
+        height: int,
+        fps: int = 30,
+        queue_size: int = 64,
+        policy: str = BLOCK,
+        profiler=None,
+    ) -> None:
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {policy}, expected one of {DROP_POLICIES}")
+
+        self.policy = policy
+        self.profiler = profiler
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self._error = None
+        # (stage, ns) timings of the encoder thread, only handed to the profiler after it has stopped
+        self._timings = []
+
+        self._writer = cv2.VideoWriter(
+            video_name, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+        )
+
+        self._free = queue.Queue()
+        for _ in range(queue_size):
+            self._free.put(np.empty((height, width, 3), dtype=np.uint8))
+
+        # Unbounded on purpose, the number of free buffers is what bounds the queue
+        self._pending = queue.Queue()
+
+        self._thread = threading.Thread(target=self._encode, name="video-encoder", daemon=True)
+        self._thread.start()
+
+    def acquire(self):
+        """
+        Returns a free frame buffer, or None if the frame should be dropped under the drop_newest policy.
+        """
+        self._raise_error()
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+
+        if self.policy == DROP_NEWEST:
+            self.frames_dropped += 1
+            return None
+
+        if self.policy == DROP_OLDEST:
+            try:
+                buffer = self._pending.get_nowait()
+                if buffer is not _STOP:
+                    self.frames_dropped += 1
+                    return buffer
+                self._pending.put(_STOP)
+            except queue.Empty:
+                # Every buffer is currently being encoded, wait for one of them
+                pass
+
+        buffer = self._free.get()
+        # A failing encoder hands its buffer back to wake this wait up
+        self._raise_error()
+        return buffer
+
+    def submit(self, buffer: np.ndarray) -> None:
+        """
+        Queues a buffer obtained from acquire for encoding.
+        """
+        self._pending.put(buffer)
+
+    def write(self, frame: np.ndarray) -> None:
+        buffer = self.acquire()
+        if buffer is None:
+            return
+        np.copyto(buffer, frame)
+        self.submit(buffer)
+
+    def release(self) -> None:
+        """
+        Encodes every queued frame and closes the video file.
+        """
+        self._pending.put(_STOP)
+        self._thread.join()
+        self._writer.release()
+        if self.profiler is not None:
+            self.profiler.replay(self._timings)
+            self._timings = []
+        self._raise_error()
+
+        if self.frames_dropped > 0:
+            logging.info(f"Video encoder dropped {self.frames_dropped} frames ({self.frames_written} written)")
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _encode(self) -> None:
+        while True:
+            buffer = self._pending.get()
+            if buffer is _STOP:
+                break
+
+            if self.profiler is not None:
+                start = time.perf_counter_ns()
+            try:
+                self._writer.write(buffer)
+            except Exception as error:
+                self._error = error
+                self._free.put(buffer)
+                break
+            if self.profiler is not None:
+                self._timings.append(("video_encode", time.perf_counter_ns() - start))
+
+            self.frames_written += 1
+            self._free.put(buffer)
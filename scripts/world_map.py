@@ -0,0 +1,187 @@
+"""
+Incremental level-wide tile map built from the scrolling game area.
+
+Column c of the game area shows the level's tile column origin + c, where origin is the camera position in tiles (see
+MarioController.update_world_map). Each update only classifies the columns that have not been seen before; the rest
+of the game area is compared against the stored terrain and the cells that differ are either moving sprites (Mario,
+enemies) or changed terrain (broken bricks, used blocks). Sprites are never stored as terrain: a newly exposed cell
+covered by a sprite is stored as unknown (no category bits, so it is neither a gap nor solid) and filled in by the
+first update that shows it without the sprite.
+
+The map keeps sorted column indexes, so "next gap ahead" and "next solid column ahead" are binary searches rather
+than scans, and reach beyond the 20 columns currently on screen. Scene.wall_ahead and Scene.gap_ahead answer from them
+once the map is attached to the scene (see MarioExpert.scan_frame).
+"""
+
+import bisect
+
+import numpy as np
+from scene_decoder import AIR, ENEMY, JUMPING_BUG, MARIO, SOLID, TILE_LUT
+
+SPRITES = MARIO | ENEMY | JUMPING_BUG
+
+_NO_SPRITES = np.empty((0, 3), dtype=np.intp)
+
+
+def _set_member(columns: list, col: int, present: bool) -> None:
+    index = bisect.bisect_left(columns, col)
+    found = index < len(columns) and columns[index] == col
+    if present and not found:
+        columns.insert(index, col)
+    elif found and not present:
+        del columns[index]
+
+
+class WorldMap:
+    """
+    The terrain of the current level, indexed by absolute tile column.
+
+    Args:
+        lut (np.ndarray): Tile ID to category bits lookup table. Defaults to scene_decoder.TILE_LUT.
+        rows (int): The number of game area rows. Defaults to 16.
+        capacity (int): The initial number of columns, grown as needed. Defaults to 512.
+    """
+
+    def __init__(self, lut: np.ndarray = TILE_LUT, rows: int = 16, capacity: int = 512) -> None:
+        self.lut = lut
+        self.rows = rows
+        self._capacity = capacity
+        self.clear()
+
+    def clear(self) -> None:
+        self.level = None
+        self.origin = 0
+        self.width = 0
+        self.columns_decoded = 0
+
+        self.tiles = np.zeros((self.rows, self._capacity), dtype=np.uint16)
+        self.flags = np.zeros((self.rows, self._capacity), dtype=np.uint8)
+        self.known = np.zeros(self._capacity, dtype=bool)
+        self.cells_known = np.zeros((self.rows, self._capacity), dtype=bool)
+        self.unknown_cells = 0
+
+        # (row, absolute col, tile ID) of every sprite cell in the last update
+        self.sprites = _NO_SPRITES
+
+        # Sorted absolute columns: bottom row is air, any solid tile, and a solid tile per row
+        self.gap_columns = []
+        self.solid_columns = []
+        self.solid_by_row = [[] for _ in range(self.rows)]
+
+    def _reserve(self, columns: int) -> None:
+        capacity = self.tiles.shape[1]
+        if columns <= capacity:
+            return
+        while capacity < columns:
+            capacity *= 2
+        grow = capacity - self.tiles.shape[1]
+        self.tiles = np.pad(self.tiles, ((0, 0), (0, grow)))
+        self.flags = np.pad(self.flags, ((0, 0), (0, grow)))
+        self.known = np.pad(self.known, (0, grow))
+        self.cells_known = np.pad(self.cells_known, ((0, 0), (0, grow)))
+
+    def _index_column(self, col: int) -> None:
+        flags = self.flags[:, col]
+        _set_member(self.gap_columns, col, bool(flags[-1] & AIR))
+        solid = flags & SOLID
+        _set_member(self.solid_columns, col, bool(solid.any()))
+        for row in range(self.rows):
+            _set_member(self.solid_by_row[row], col, bool(solid[row]))
+
+    def update(self, game_area, level, origin: int) -> None:
+        """
+        Adds a game area whose column 0 is the absolute tile column origin. A new level clears the map.
+        """
+        if level != self.level:
+            self.clear()
+            self.level = level
+
+        grid = np.asarray(game_area)
+        origin = max(origin, 0)
+        width = grid.shape[1]
+        self.origin = origin
+        self.width = width
+        self._reserve(origin + width)
+
+        window = slice(origin, origin + width)
+
+        # Newly exposed columns
+        new = np.flatnonzero(~self.known[window])
+        if new.size:
+            tiles = grid[:, new]
+            flags = self.lut[tiles]
+            sprite = (flags & SPRITES) != 0
+            columns = new + origin
+            self.tiles[:, columns] = np.where(sprite, 0, tiles)
+            self.flags[:, columns] = np.where(sprite, 0, flags)
+            self.known[columns] = True
+            self.cells_known[:, columns] = ~sprite
+            self.unknown_cells += int(sprite.sum())
+            self.columns_decoded += new.size
+            for col in columns.tolist():
+                self._index_column(col)
+
+        # Sprites, changed terrain and cells a sprite has moved off in the rest of the window
+        differs = grid != self.tiles[:, window]
+        if self.unknown_cells:
+            differs |= ~self.cells_known[:, window]
+        rows, cols = np.nonzero(differs)
+        if rows.size == 0:
+            self.sprites = _NO_SPRITES
+            return
+
+        tiles = grid[rows, cols]
+        sprite = (self.lut[tiles] & SPRITES) != 0
+        self.sprites = np.column_stack((rows[sprite], cols[sprite] + origin, tiles[sprite]))
+
+        changed = ~sprite
+        if changed.any():
+            rows, cols, tiles = rows[changed], cols[changed] + origin, tiles[changed]
+            self.tiles[rows, cols] = tiles
+            self.flags[rows, cols] = self.lut[tiles]
+            self.unknown_cells -= int(np.count_nonzero(~self.cells_known[rows, cols]))
+            self.cells_known[rows, cols] = True
+            for col in np.unique(cols).tolist():
+                self._index_column(col)
+
+    def to_absolute(self, col: int) -> int:
+        """
+        The absolute column of a game area column of the last update.
+        """
+        return self.origin + col
+
+    def known_until(self) -> int:
+        """
+        One past the rightmost column decoded so far.
+        """
+        known = np.flatnonzero(self.known)
+        return int(known[-1]) + 1 if known.size else 0
+
+    @staticmethod
+    def _next(columns: list, col: int):
+        index = bisect.bisect_left(columns, col)
+        return columns[index] if index < len(columns) else None
+
+    def next_gap(self, col: int):
+        """
+        The first column at or after col whose bottom row is air, or None if none has been seen.
+        """
+        return self._next(self.gap_columns, col)
+
+    def next_solid(self, col: int, row: int = None):
+        """
+        The first column at or after col with a solid tile (in row, if given), or None if none has been seen.
+        """
+        if row is None:
+            return self._next(self.solid_columns, col)
+        if not 0 <= row < self.rows:
+            return None
+        return self._next(self.solid_by_row[row], col)
+
+    def column(self, col: int):
+        """
+        The stored tile IDs of an absolute column, or None if it has not been seen. Unknown cells hold 0.
+        """
+        if 0 <= col < self.known.shape[0] and self.known[col]:
+            return self.tiles[:, col]
+        return None